@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Video/audio merge benchmark
+
+Compares wall time of the old merge path (audio always re-encoded to AAC,
+pairs merged one after another) with the ffmpeg pool (codecs probed, audio
+stream-copied when MP4 allows it, pairs merged in parallel). Fixture pairs
+of video-only MP4 and audio-only M4A files are generated locally with
+ffmpeg's test sources, so no network is needed.
+
+Usage: python bench_merge.py [--pairs 4] [--seconds 120] [--workers 4] [--ffmpeg PATH]
+"""
+
+import argparse
+import asyncio
+import logging
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from ffmpeg_pool import FfmpegPool
+from toolchain import Toolchain
+
+
+async def legacy_merge(ffmpeg_path: str, video_file: Path, audio_file: Path, output_file: Path) -> bool:
+    """The merge the bot used before the ffmpeg pool"""
+    cmd = [
+        ffmpeg_path,
+        '-i', str(video_file),
+        '-i', str(audio_file),
+        '-c:v', 'copy',
+        '-c:a', 'aac',
+        '-map', '0:v:0',
+        '-map', '1:a:0',
+        '-movflags', '+faststart',
+        '-y',
+        str(output_file)
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    await asyncio.wait_for(process.communicate(), timeout=30.0)
+    return process.returncode == 0 and output_file.exists()
+
+
+def make_fixtures(ffmpeg_path: str, directory: Path, pairs: int, seconds: int) -> list:
+    """Video-only and audio-only files like yt-dlp leaves for DASH formats"""
+    fixtures = []
+    video = directory / 'fixture.mp4'
+    audio = directory / 'fixture.m4a'
+    subprocess.run([ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y',
+                    '-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={seconds}',
+                    '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', '2500k', '-an', str(video)], check=True)
+    subprocess.run([ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y',
+                    '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                    '-c:a', 'aac', '-b:a', '128k', '-vn', str(audio)], check=True)
+    for n in range(pairs):
+        pair = (directory / f'item_{n}.mp4', directory / f'item_{n}.m4a')
+        shutil.copy(video, pair[0])
+        shutil.copy(audio, pair[1])
+        fixtures.append(pair)
+    return fixtures
+
+
+async def run_legacy(ffmpeg_path: str, fixtures: list) -> float:
+    started = time.perf_counter()
+    for video, audio in fixtures:
+        assert await legacy_merge(ffmpeg_path, video, audio, video.with_name(f'{video.stem}_legacy.mp4'))
+    return time.perf_counter() - started
+
+
+async def run_pool(ffmpeg_path: str, fixtures: list, workers: int) -> float:
+    pool = FfmpegPool(Toolchain((ffmpeg_path,)), workers=workers, nice=0)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(pool.merge(video, audio, video.with_name(f'{video.stem}_pool.mp4'))
+                                     for video, audio in fixtures))
+    assert all(results)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pairs', type=int, default=4)
+    parser.add_argument('--seconds', type=int, default=120)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--ffmpeg', default=shutil.which('ffmpeg'))
+    args = parser.parse_args()
+    if not args.ffmpeg:
+        parser.error('ffmpeg not found, pass --ffmpeg PATH')
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory(prefix='setupia_bench_') as temp_dir:
+        fixtures = make_fixtures(args.ffmpeg, Path(temp_dir), args.pairs, args.seconds)
+        size_mb = sum(v.stat().st_size + a.stat().st_size for v, a in fixtures) / (1024 * 1024)
+        print(f"{args.pairs} pair(s) of {args.seconds}s 720p video + AAC audio, {size_mb:.0f}MB total")
+
+        legacy = asyncio.run(run_legacy(args.ffmpeg, fixtures))
+        pooled = asyncio.run(run_pool(args.ffmpeg, fixtures, args.workers))
+
+    print(f"{'sequential, audio re-encoded':<34} {legacy:7.2f}s")
+    print(f"{f'pool ({args.workers} workers), audio copied':<34} {pooled:7.2f}s")
+    print(f"speedup: {legacy / pooled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
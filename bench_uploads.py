@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Upload memory benchmark
+
+Compares peak RSS of the old upload path (read the whole file into memory)
+with streamed uploads (file handle passed to the HTTP client) as the number
+of concurrent uploads grows. Uploads go to a local fake Bot API server, so
+no Telegram token or network is needed.
+
+Usage: python bench_uploads.py [--size-mb 40] [--concurrency 1,2,4,8]
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from fake_bot_api import FakeBotAPI
+from uploads import ThreadedUploadRequest
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+async def upload_all(mode: str, files: list):
+    from bot import SetupiaAISaver
+
+    api = FakeBotAPI().start()
+    # Streamed uploads go through the bot's request class, which reads files in a thread
+    request_class = HTTPXRequest if mode == 'read' else ThreadedUploadRequest
+    bot = Bot(
+        'bench:token',
+        base_url=f'{api.url}/bot',
+        request=request_class(connection_pool_size=len(files) + 1, media_write_timeout=120)
+    )
+    await bot.initialize()
+
+    async def send(path: Path):
+        if mode == 'read':
+            with open(path, 'rb') as f:
+                content = f.read()
+            await bot.send_video(chat_id=1, video=content)
+        else:
+            handle, content = await SetupiaAISaver.open_upload(path)
+            with handle:
+                await bot.send_video(chat_id=1, video=content)
+
+    await asyncio.gather(*(send(path) for path in files))
+    await bot.shutdown()
+    api.stop()
+    uploaded = sum(call['size'] for call in api.calls if call['method'] == 'sendVideo')
+    return uploaded
+
+
+def run_worker(mode: str, concurrency: int, size_mb: int):
+    with tempfile.TemporaryDirectory(prefix='setupia_bench_') as temp_dir:
+        files = []
+        for n in range(concurrency):
+            path = Path(temp_dir) / f'clip_{n}.mp4'
+            with open(path, 'wb') as f:
+                for _ in range(size_mb):
+                    f.write(os.urandom(1024 * 1024))
+            files.append(path)
+
+        baseline = peak_rss_mb()
+        uploaded = asyncio.run(upload_all(mode, files))
+        print(f'{baseline:.1f} {peak_rss_mb():.1f} {uploaded}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size-mb', type=int, default=40)
+    parser.add_argument('--concurrency', default='1,2,4,8')
+    parser.add_argument('--worker', choices=['read', 'stream'])
+    args = parser.parse_args()
+    levels = [int(n) for n in args.concurrency.split(',')]
+
+    if args.worker:
+        run_worker(args.worker, levels[0], args.size_mb)
+        return
+
+    print(f"📊 Peak RSS while uploading {args.size_mb}MB files concurrently")
+    print(f"{'uploads':>8} {'read() MB':>10} {'stream MB':>10}")
+    for concurrency in levels:
+        row = []
+        for mode in ('read', 'stream'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--worker', mode,
+                 '--concurrency', str(concurrency), '--size-mb', str(args.size_mb)],
+                capture_output=True, text=True, check=True
+            ).stdout.split()
+            baseline, peak, uploaded = float(output[0]), float(output[1]), int(output[2])
+            if uploaded < concurrency * args.size_mb * 1024 * 1024:
+                print(f"❌ {mode}: only {uploaded} bytes reached the server")
+            row.append(peak - baseline)
+        print(f"{concurrency:>8} {row[0]:>10.1f} {row[1]:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+URL normalization microbenchmark
+
+Times the per-link URL work the bot does (platform detection, YouTube
+check, download cleaning, cache key) with urlnorm against the substring
+based functions it replaced, and shows how many distinct cache keys each
+produces for links that point to the same media.
+
+Usage: python bench_urlnorm.py [--rounds 2000]
+"""
+
+import argparse
+import logging
+import time
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import urlnorm
+
+SAMPLE_URLS = [
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ&si=abc123&feature=share',
+    'https://youtu.be/dQw4w9WgXcQ?si=abc123',
+    'https://youtube.com/shorts/dQw4w9WgXcQ?feature=share',
+    'https://m.youtube.com/watch?v=dQw4w9WgXcQ&t=42',
+    'https://www.instagram.com/reel/C1a2b3c4d5e/?igsh=MWx4ZHQ&utm_source=ig_web_copy_link',
+    'https://instagram.com/p/C1a2b3c4d5e/',
+    'https://www.instagram.com/someone/p/C1a2b3c4d5e/?img_index=2',
+    'https://www.tiktok.com/@user/video/7301234567890123456?is_from_webapp=1&sender_device=pc',
+    'https://vm.tiktok.com/ZMabcdef/',
+    'https://x.com/user/status/1712345678901234567?s=20&t=abc',
+    'https://twitter.com/user/status/1712345678901234567',
+    'https://www.reddit.com/r/videos/comments/abc123/some_title/?utm_source=share&utm_medium=ios_app',
+    'https://redd.it/abc123',
+    'https://www.facebook.com/watch?v=1234567890&fbclid=IwAR0abc',
+    'https://fb.watch/abcDEF123/',
+    'https://www.pinterest.com/pin/123456789012345678/?sent=1&from_app=android',
+    'https://www.dropbox.com/s/abc/video.mp4?dl=1',
+    'https://example.com/media/clip.mp4?utm_campaign=x&token=keepme',
+    'https://t.me/channel/123?single',
+    'https://www.linkedin.com/posts/someone_activity-123?trackingId=abc&lipi=xyz',
+]
+
+# Links that point to the same media and should share one cache entry
+EQUIVALENT_GROUPS = [SAMPLE_URLS[0:4], SAMPLE_URLS[4:7], SAMPLE_URLS[9:11], SAMPLE_URLS[11:13]]
+
+LEGACY_TRACKING_QUERY_PARAMS = {'si', 'igsh', 'igshid', 'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'feature',
+                                'share_id', 'ref_src', 'ref_url', 'is_from_webapp', 'sender_device',
+                                'sender_web_id', '_r', '_t', 'u_code', 'preview_pb'}
+
+
+# ---------------------------------------------------------------------------
+# The functions urlnorm replaced, as they were in bot.py
+# ---------------------------------------------------------------------------
+
+def legacy_is_youtube_url(url: str) -> bool:
+    """Check if URL is from YouTube"""
+    return 'youtube.com' in url or 'youtu.be' in url
+
+
+def legacy_clean_url_for_download(url: str) -> str:
+    """Remove problematic parameters from social media URLs for downloading"""
+
+    # Special handling for YouTube URLs - remove everything from ? symbol to end
+    if 'youtube.com' in url.lower() or 'youtu.be' in url.lower():
+        if '?' in url:
+            clean_url = url.split('?')[0]
+            if clean_url != url:
+                logging.info(f"Cleaned YouTube URL: {url} -> {clean_url}")
+            return clean_url
+        return url
+
+    # Platform-specific parameters that can cause download issues (mobile app focus)
+    platform_params = {
+        'instagram.com': ['igsh=', 'img_index=', 'utm_source=', 'utm_medium=', 'utm_campaign=', 'igshid='],
+        'tiktok.com': ['is_from_webapp=', 'sender_device=', 'sender_web_id=', '_r=', '_t=', 'u_code=', 'preview_pb='],
+        'twitter.com': ['t=', 's=', 'ref_src=', 'ref_url=', 'cn=', 'refsrc='],
+        'x.com': ['t=', 's=', 'ref_src=', 'ref_url=', 'cn=', 'refsrc='],
+        'facebook.com': ['fbclid=', '__tn__=', '__cft__=', 'hash=', '_rdr=', 'app_id=', 'display='],
+        'fb.watch': ['fbclid=', '__tn__=', '__cft__=', '_rdr='],
+        'reddit.com': ['context=', 'share_id=', 'utm_source=', 'utm_medium=', 'utm_name=', 'utm_term=', 'utm_content='],
+        'redd.it': ['context=', 'share_id=', 'utm_source=', 'utm_medium='],
+        'pinterest.com': ['sent=', 'from_app='],
+        'tumblr.com': ['source=', 'ref='],
+        'linkedin.com': ['trackingId=', 'refId=', 'lipi=', 'licu='],
+        'telegram.org': ['single=', 'thread='],
+        'telegram.me': ['single=', 'thread='],
+        'snapchat.com': ['sender_web_id=', 'utm_source='],
+        'discord.com': ['utm_source=', 'utm_medium='],
+        'whatsapp.com': ['text=', 'app_absent=']
+    }
+
+    # Find matching platform
+    problematic_params = []
+    for platform, params in platform_params.items():
+        if platform in url.lower():
+            problematic_params = params
+            break
+
+    # If no specific platform match, use common tracking parameters (mobile apps often add these)
+    if not problematic_params:
+        problematic_params = ['utm_source=', 'utm_medium=', 'utm_campaign=', 'utm_term=', 'utm_content=',
+                            'utm_name=', 'igsh=', 'igshid=', 'fbclid=', 'gclid=', 'mc_cid=', 'mc_eid=']
+
+    # Remove problematic parameters (more precise handling)
+    original_url = url
+    for param in problematic_params:
+        # Handle ?param=value (remove everything from ? onwards)
+        if f'?{param}' in url:
+            url = url.split(f'?{param}')[0]
+            break
+        # Handle &param=value (remove everything from & onwards)
+        elif f'&{param}' in url:
+            url = url.split(f'&{param}')[0]
+            break
+
+    # Log if URL was cleaned
+    if url != original_url:
+        logging.info(f"Cleaned URL for download: {original_url} -> {url}")
+
+    return url
+
+
+def legacy_is_social_media_url(url: str) -> str:
+    """Detect social media platform type (mobile app aware)"""
+    url_lower = url.lower()
+
+    # Check for mobile app indicators and platform patterns
+    if 'pinterest.com' in url_lower:
+        return 'pinterest'
+    elif 'deviantart.com' in url_lower:
+        return 'deviantart'
+    elif 'flickr.com' in url_lower:
+        return 'flickr'
+    elif 'reddit.com' in url_lower or 'redd.it' in url_lower:
+        return 'reddit'
+    elif 'tumblr.com' in url_lower:
+        return 'tumblr'
+    elif 'behance.net' in url_lower:
+        return 'behance'
+    elif 'linkedin.com' in url_lower or 'lnkd.in' in url_lower:
+        return 'linkedin'
+    elif 't.me' in url_lower or 'telegram.me' in url_lower or 'telegram.org' in url_lower:
+        return 'telegram'
+    elif 'instagram.com' in url_lower:
+        return 'instagram'
+    elif 'twitter.com' in url_lower or 'x.com' in url_lower:
+        return 'twitter'
+    elif 'facebook.com' in url_lower or 'fb.watch' in url_lower or 'fb.me' in url_lower:
+        return 'facebook'
+    elif 'tiktok.com' in url_lower or 'vm.tiktok.com' in url_lower:
+        return 'tiktok'
+    elif 'snapchat.com' in url_lower or 'snap.com' in url_lower:
+        return 'snapchat'
+    elif 'discord.com' in url_lower or 'discord.gg' in url_lower:
+        return 'discord'
+    elif 'whatsapp.com' in url_lower or 'wa.me' in url_lower:
+        return 'whatsapp'
+    else:
+        return 'unknown'
+
+
+def legacy_strip_tracking(url: str) -> str:
+    # Remove tracking parameters that can cause issues (but keep si= for YouTube analytics)
+    tracking_params = ['utm_source=', 'utm_medium=', 'utm_name=', 'utm_term=', 'utm_content=', 'utm_campaign=']
+    for param in tracking_params:
+        if f'?{param}' in url:
+            url = url.split(f'?{param}')[0]
+            break
+        elif f'&{param}' in url:
+            url = url.split(f'&{param}')[0]
+            break
+    return url
+
+
+def legacy_media_cache_key(url: str, format_id: str = 'auto') -> str:
+    """Cache key for a media item: canonical URL plus the chosen format"""
+    return f"{legacy_canonical_url(url)}|{format_id}"
+
+def legacy_canonical_url(url: str) -> str:
+    """URL without scheme, mobile/www prefixes, trailing slash or tracking parameters"""
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    for prefix in ('www.', 'm.', 'mobile.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith('utm_') and name.lower() not in LEGACY_TRACKING_QUERY_PARAMS
+    )
+    canonical = f"{host}{parts.path.rstrip('/')}"
+    if query:
+        canonical += '?' + urlencode(query)
+    return canonical
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def legacy_pipeline(url: str) -> tuple:
+    url = legacy_strip_tracking(url)
+    platform = 'youtube' if legacy_is_youtube_url(url) else legacy_is_social_media_url(url)
+    return platform, legacy_clean_url_for_download(url), legacy_media_cache_key(url)
+
+
+def urlnorm_pipeline(url: str) -> tuple:
+    url = urlnorm.strip_utm(url)
+    platform = urlnorm.parse(url).platform
+    return platform, urlnorm.clean_url(url), f"{urlnorm.media_identity(url)}|auto"
+
+
+def time_pipeline(pipeline, rounds: int, cold: bool = False) -> float:
+    """Microseconds per URL"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        if cold:
+            urlnorm.parse.cache_clear()
+        for url in SAMPLE_URLS:
+            pipeline(url)
+    return (time.perf_counter() - start) / (rounds * len(SAMPLE_URLS)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"📊 URL handling cost per link ({len(SAMPLE_URLS)} sample URLs x {args.rounds} rounds)")
+    legacy = time_pipeline(legacy_pipeline, args.rounds)
+    cold = time_pipeline(urlnorm_pipeline, args.rounds, cold=True)
+    warm = time_pipeline(urlnorm_pipeline, args.rounds)
+    print(f"{'legacy substring scans':<28} {legacy:>8.2f} µs")
+    print(f"{'urlnorm (cold parse)':<28} {cold:>8.2f} µs")
+    print(f"{'urlnorm (cached parse)':<28} {warm:>8.2f} µs")
+
+    print("\n🔑 Distinct cache keys per media item")
+    for group in EQUIVALENT_GROUPS:
+        old_keys = {legacy_pipeline(url)[2] for url in group}
+        new_keys = {urlnorm_pipeline(url)[2] for url in group}
+        print(f"{len(group)} links -> legacy {len(old_keys)}, urlnorm {len(new_keys)} ({next(iter(new_keys))})")
+
+    print("\n🔍 Where the results differ")
+    for url in SAMPLE_URLS:
+        old, new = legacy_pipeline(url), urlnorm_pipeline(url)
+        if old[:2] != new[:2]:
+            print(f"{url}\n    legacy:  {old[0]:<10} {old[1]}\n    urlnorm: {new[0]:<10} {new[1]}")
+
+
+if __name__ == '__main__':
+    main()
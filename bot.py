@@ -1,20 +1,32 @@
 import os
 import asyncio
+import contextlib
 import tempfile
-import json
-import subprocess
 import shutil
 import logging
 import re
+import time
+import math
+import secrets
+from collections import OrderedDict, deque
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Callable, Awaitable
 
-from telegram import Update, Document, Video, PhotoSize, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, Document, Video, PhotoSize, InlineKeyboardButton, InlineKeyboardMarkup, InputFile, InputMediaPhoto, InputMediaVideo
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from telegram.constants import ParseMode
-import aiofiles
 from dotenv import load_dotenv
 
+from caches import open_database, FileIdCache, MetadataCache, NegativeCache, RedirectCache
+from extractor_pool import ExtractorPool
+from ffmpeg_pool import FfmpegPool, VIDEO_EXTENSIONS, AUDIO_EXTENSIONS, MERGE_BYTES_PER_SECOND
+import metrics
+from outbound import OutboundScheduler, TokenBucket
+import urlnorm
+from resolver import ShortLinkResolver
+from toolchain import Toolchain
+from uploads import ThreadedUploadRequest
+
 # Set up logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -32,16 +44,780 @@ REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT", "SetupiaAISaver/1.0")
 # Instagram configuration
 INSTAGRAM_COOKIES_FILE = os.getenv("INSTAGRAM_COOKIES_FILE")
 
+# Telegram user IDs allowed to use /status (comma separated); nobody if unset
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").replace(' ', '').split(',')
+                  if user_id.isdigit()}
+
+# Telegram Bot API server. Leave unset to use the cloud API (50 MB uploads);
+# point it at a self-hosted telegram-bot-api server (e.g. http://localhost:8081)
+# to send files by local path with uploads up to 2 GB.
+LOCAL_BOT_API_URL = (os.getenv("LOCAL_BOT_API_URL") or '').rstrip('/')
+LOCAL_BOT_API_TIMEOUT = float(os.getenv("LOCAL_BOT_API_TIMEOUT", "600"))
+CLOUD_UPLOAD_LIMIT = 50 * 1024 * 1024
+LOCAL_UPLOAD_LIMIT = 2000 * 1024 * 1024
+MAX_UPLOAD_BYTES = LOCAL_UPLOAD_LIMIT if LOCAL_BOT_API_URL else CLOUD_UPLOAD_LIMIT
+# Downloads stop a little below the upload limit to leave room for merging
+MAX_DOWNLOAD_BYTES = int(MAX_UPLOAD_BYTES * 0.9)
+
+# Files over the upload limit are made to fit with ffmpeg: "auto" re-encodes
+# unless the video bitrate would drop below OVERSIZE_MIN_VIDEO_KBPS and splits
+# into parts otherwise; "reencode" and "split" force one way, "off" disables it
+OVERSIZE_MODE = os.getenv("OVERSIZE_MODE", "auto").lower()
+OVERSIZE_MIN_VIDEO_KBPS = int(os.getenv("OVERSIZE_MIN_VIDEO_KBPS", "300"))
+# Largest download accepted while ffmpeg is there to shrink it
+OVERSIZE_MAX_BYTES = int(os.getenv("OVERSIZE_MAX_BYTES", str(MAX_UPLOAD_BYTES * 4)))
+# ffmpeg post-processing: concurrent processes (merges, splits, re-encodes),
+# how many of them may re-encode video, threads per process and CPU
+# niceness, kept low so transcodes don't slow down downloads
+FFMPEG_WORKERS = int(os.getenv("FFMPEG_WORKERS", "4"))
+FFMPEG_TRANSCODE_WORKERS = int(os.getenv("FFMPEG_TRANSCODE_WORKERS", "1"))
+FFMPEG_THREADS = int(os.getenv("FFMPEG_THREADS", "2"))
+FFMPEG_NICE = int(os.getenv("FFMPEG_NICE", "10"))
+
+# Photos and videos of a multi-item post are sent as albums of up to
+# MEDIA_GROUP_LIMIT (Telegram's maximum); this many albums upload at once
+MEDIA_GROUP_LIMIT = 10
+ALBUM_UPLOAD_CONCURRENCY = int(os.getenv("ALBUM_UPLOAD_CONCURRENCY", "3"))
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+VIDEO_UPLOAD_EXTENSIONS = ('.mp4', '.webm', '.mov', '.avi')
+
+# Cache configuration
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "cache/setupia.db")
+FILE_ID_CACHE_TTL = float(os.getenv("FILE_ID_CACHE_TTL", str(7 * 24 * 3600)))
+FILE_ID_CACHE_MAX_ENTRIES = int(os.getenv("FILE_ID_CACHE_MAX_ENTRIES", "20000"))
+# Extraction results, keyed on video/post ID; 0 disables a kind
+FORMATS_CACHE_TTL = float(os.getenv("FORMATS_CACHE_TTL", str(6 * 3600)))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "3600"))
+METADATA_CACHE_MEMORY_ENTRIES = int(os.getenv("METADATA_CACHE_MEMORY_ENTRIES", "512"))
+
+# Short links (vm.tiktok.com, redd.it, t.co, ...) are expanded before routing
+SHORT_LINK_MAX_HOPS = int(os.getenv("SHORT_LINK_MAX_HOPS", "5"))
+SHORT_LINK_TIMEOUT = float(os.getenv("SHORT_LINK_TIMEOUT", "5"))
+REDIRECT_CACHE_TTL = float(os.getenv("REDIRECT_CACHE_TTL", str(30 * 24 * 3600)))
+
+# Links that recently failed are answered from a negative cache. TTL in
+# seconds per failure class, e.g. "auth=1800,not_found=3600"; 0 disables a class
+NEGATIVE_CACHE_TTLS = os.getenv("NEGATIVE_CACHE_TTLS", "auth=1800,not_found=3600,rate_limited=300,timeout=120")
+
+# Failure classes, strongest first, and what the user is told for each
+FAILURE_CLASSES = ('auth', 'not_found', 'rate_limited', 'timeout')
+FAILURE_MESSAGES = {
+    'auth': "🔐 This content is private or requires login, so I can't download it.",
+    'not_found': "❌ This post wasn't found. It may have been deleted or made private.",
+    'rate_limited': "⏳ The platform is rate limiting downloads right now. Please try again in a few minutes.",
+    'timeout': "⌛ This link timed out a moment ago. Please try again a little later.",
+}
+# How downloader errors map to failure classes: the HTTP status first, then
+# word-bounded text markers (post IDs and URLs are full of digits and words)
+HTTP_STATUS_PATTERN = re.compile(r'HTTP Error (\d{3})', re.IGNORECASE)
+FAILURE_STATUS_CODES = {429: 'rate_limited', 401: 'auth', 404: 'not_found'}
+FAILURE_PATTERNS = (
+    ('rate_limited', re.compile(r'\b(too many requests|rate[- ]limit|not a bot)', re.IGNORECASE)),
+    ('auth', re.compile(r'\b(log ?in|sign in|authenticat\w*|cookies|private|members-only|unauthorized)\b',
+                        re.IGNORECASE)),
+    ('not_found', re.compile(r'\b(not found|does not exist|no longer available|has been removed|been deleted|'
+                             r'unavailable)\b', re.IGNORECASE)),
+)
+
+# Download scheduler configuration
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+# Warm yt-dlp / gallery-dl worker processes
+EXTRACTOR_WORKERS = int(os.getenv("EXTRACTOR_WORKERS", str(DOWNLOAD_WORKERS)))
+# Downloads are cancelled when their bytes stop advancing for STALL_TIMEOUT
+# seconds (the per-tool timeouts only cover the wait for the first progress)
+STALL_TIMEOUT = float(os.getenv("STALL_TIMEOUT", "20"))
+DOWNLOAD_MAX_DURATION = float(os.getenv("DOWNLOAD_MAX_DURATION", "1800"))
+# Minimum seconds between progress edits of the status message
+PROGRESS_EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "3"))
+# Outbound Bot API limits: messages per second overall and per private chat,
+# per minute per group; flood waits are retried this many times
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", "20"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "5"))
+MAX_ACTIVE_DOWNLOADS = int(os.getenv("MAX_ACTIVE_DOWNLOADS", str(DOWNLOAD_WORKERS)))
+# Per-platform caps, e.g. "instagram=2,reddit=2"; unlisted platforms use the default
+PLATFORM_CONCURRENCY = os.getenv("PLATFORM_CONCURRENCY", "instagram=2,reddit=2,facebook=2,youtube=3")
+DEFAULT_PLATFORM_CONCURRENCY = int(os.getenv("DEFAULT_PLATFORM_CONCURRENCY", "2"))
+
+# Hedged downloads: when the preferred downloader is slow, the next one is
+# started in parallel and the first to succeed wins. The delay adapts to the
+# recent latency of each platform/downloader pair and stays within min/max.
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "8"))  # used until enough samples exist
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "2"))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", "20"))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+# Extra platform slots a hedged attempt occupies, e.g. "instagram=1,reddit=2";
+# 0 makes hedging free, and hedges are skipped when the slots aren't idle
+HEDGE_COST = os.getenv("HEDGE_COST", "")
+DEFAULT_HEDGE_COST = int(os.getenv("DEFAULT_HEDGE_COST", "1"))
+
+# End-to-end time budget (seconds) for one link, shared by analysis and every
+# download attempt, e.g. "instagram=90,youtube=900"; unlisted platforms use the default
+REQUEST_DEADLINES = os.getenv("REQUEST_DEADLINES", "instagram=120,pinterest=90,youtube=900")
+DEFAULT_REQUEST_DEADLINE = int(os.getenv("DEFAULT_REQUEST_DEADLINE", "300"))
+
+# Shortest-job-first lanes: jobs predicted to take at most CHEAP_JOB_SECONDS
+# of slot time run in the cheap lane, which always keeps RESERVED_CHEAP_SLOTS
+# download slots that expensive jobs can't take
+CHEAP_JOB_SECONDS = float(os.getenv("CHEAP_JOB_SECONDS", "15"))
+RESERVED_CHEAP_SLOTS = int(os.getenv("RESERVED_CHEAP_SLOTS", "1"))
+# Predicted seconds per platform until real timings are recorded (for YouTube
+# links this is the format listing; the download itself is a separate job)
+PLATFORM_JOB_COSTS = os.getenv(
+    "PLATFORM_JOB_COSTS",
+    "pinterest=3,deviantart=3,flickr=3,behance=3,tumblr=3,instagram=10,twitter=10,telegram=10,"
+    "youtube=5,reddit=30,facebook=30,linkedin=30"
+)
+DEFAULT_JOB_COST = int(os.getenv("DEFAULT_JOB_COST", "20"))
+# Assumed bitrate (about 2 Mbit/s) for videos with a known duration but no size
+TYPICAL_VIDEO_BYTES_PER_SECOND = 250 * 1024
+# Download rate assumed when a job's size is known in advance
+EXPECTED_DOWNLOAD_MB_PER_SECOND = float(os.getenv("EXPECTED_DOWNLOAD_MB_PER_SECOND", "5"))
+
+# Prometheus metrics endpoint (http://METRICS_HOST:METRICS_PORT/metrics); port 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+# Per-user admission: links refill at USER_RATE_PER_MINUTE up to a burst of
+# USER_BURST, and at most USER_MAX_IN_FLIGHT requests per user are queued or
+# downloading at once (0 disables a limit)
+USER_RATE_PER_MINUTE = float(os.getenv("USER_RATE_PER_MINUTE", "6"))
+USER_BURST = int(os.getenv("USER_BURST", "10"))
+USER_MAX_IN_FLIGHT = int(os.getenv("USER_MAX_IN_FLIGHT", "3"))
+
+
+def parse_platform_limits(spec: str, minimum: int = 1) -> dict:
+    """Parse a "platform=limit,platform=limit" string into a dict"""
+    limits = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        platform, _, value = item.partition('=')
+        try:
+            limits[platform.strip().lower()] = max(minimum, int(value))
+        except ValueError:
+            logging.warning(f"Ignoring invalid platform limit: {item}")
+    return limits
+
+
+class DownloadTask:
+    """A unit of download work waiting for a scheduler slot"""
+
+    def __init__(self, platform: str, runner: Callable[[], Awaitable[None]], user_id: Optional[int] = None,
+                 cost: float = 0.0):
+        self.platform = platform
+        self.runner = runner
+        self.user_id = user_id
+        # Predicted seconds of slot time; decides the lane and the queue order
+        self.cost = cost
+        self.lane = 'cheap'
+        self.enqueued_at = time.monotonic()
+
+
+class DownloadScheduler:
+    """Bounded pool of async download workers.
+
+    Handlers only enqueue tasks. Workers pick the task with the shortest
+    predicted cost whose platform still has a free slot, so a burst of
+    Instagram links can't hold every worker while a Pinterest pin waits
+    behind them. Tasks costing up to `cheap_cost` seconds form the cheap
+    lane; `reserved_cheap` slots are kept free of expensive tasks, and
+    waiting lowers a task's rank so expensive tasks still get their turn.
+    """
+
+    LANES = ('cheap', 'expensive')
+    # Seconds of predicted cost forgiven per second spent waiting
+    AGING = 1.0
+
+    def __init__(self, workers: int, max_active: int, platform_limits: dict, default_limit: int,
+                 cheap_cost: float = 15.0, reserved_cheap: int = 1):
+        self.workers = max(1, workers)
+        self.max_active = max(1, max_active)
+        self.platform_limits = platform_limits
+        self.default_limit = max(1, default_limit)
+        self.cheap_cost = cheap_cost
+        # Slots expensive tasks may hold at once; at least one, or they'd never run
+        self.expensive_limit = max(1, min(self.workers, self.max_active) - max(0, reserved_cheap))
+        self._global = asyncio.Semaphore(self.max_active)
+        self._platform_sems = {}
+        self._pending = deque()
+        self._cond = asyncio.Condition()
+        self._worker_tasks = []
+        self.active = 0
+        self.lane_active = {lane: 0 for lane in self.LANES}
+
+    def _platform_sem(self, platform: str) -> asyncio.Semaphore:
+        if platform not in self._platform_sems:
+            limit = self.platform_limits.get(platform, self.default_limit)
+            self._platform_sems[platform] = asyncio.Semaphore(min(limit, self.max_active))
+        return self._platform_sems[platform]
+
+    def start(self):
+        """Spawn the worker coroutines on the running loop"""
+        for n in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker(n), name=f"download-worker-{n}"))
+        logging.info(f"Download scheduler started: {self.workers} workers, global cap {self.max_active}, "
+                     f"platform caps {self.platform_limits} (default {self.default_limit}), "
+                     f"expensive jobs (> {self.cheap_cost:.0f}s) capped at {self.expensive_limit}")
+
+    async def stop(self):
+        """Cancel all workers; queued tasks are dropped"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks.clear()
+        self._pending.clear()
+        self._publish()
+
+    @property
+    def queued(self) -> int:
+        return len(self._pending)
+
+    def _ordered(self) -> list:
+        """Pending tasks in dispatch order: shortest predicted job first, aged by time waited"""
+        now = time.monotonic()
+        return sorted(self._pending, key=lambda task: (task.cost - (now - task.enqueued_at) * self.AGING,
+                                                       task.enqueued_at))
+
+    def position(self, task: DownloadTask) -> int:
+        """1-based position of a task in the queue, 0 once it has started"""
+        try:
+            return self._ordered().index(task) + 1
+        except ValueError:
+            return 0
+
+    def lane_report(self) -> dict:
+        """Per lane: queued and running tasks, and p50/p95 seconds from queueing to finish"""
+        report = {}
+        for lane in self.LANES:
+            report[lane] = {
+                'queued': sum(1 for task in self._pending if task.lane == lane),
+                'active': self.lane_active[lane],
+                'p50': metrics.LANE_LATENCY.quantile(0.5, lane=lane),
+                'p95': metrics.LANE_LATENCY.quantile(0.95, lane=lane),
+            }
+        return report
+
+    def has_free_slot(self, platform: str) -> bool:
+        return not self._global.locked() and not self._platform_sem(platform).locked()
+
+    def _publish(self):
+        """Queue depth and running jobs per lane, for the metrics endpoint"""
+        for lane in self.LANES:
+            metrics.QUEUE_DEPTH.set(sum(1 for task in self._pending if task.lane == lane), lane=lane)
+            metrics.ACTIVE_JOBS.set(self.lane_active[lane], lane=lane)
+
+    async def submit(self, task: DownloadTask) -> int:
+        """Queue a task and return its position (1 = next in line)"""
+        task.lane = 'cheap' if task.cost <= self.cheap_cost else 'expensive'
+        async with self._cond:
+            self._pending.append(task)
+            self._publish()
+            self._cond.notify_all()
+            return self.position(task)
+
+    def _pop_runnable(self) -> Optional[DownloadTask]:
+        if self._global.locked():
+            return None
+        for task in self._ordered():
+            if task.lane == 'expensive' and self.lane_active['expensive'] >= self.expensive_limit:
+                continue
+            if not self._platform_sem(task.platform).locked():
+                self._pending.remove(task)
+                return task
+        return None
+
+    async def _take(self) -> DownloadTask:
+        async with self._cond:
+            while True:
+                task = self._pop_runnable()
+                if task:
+                    # Both semaphores are known to be free, so this never blocks
+                    await self._global.acquire()
+                    await self._platform_sem(task.platform).acquire()
+                    self.lane_active[task.lane] += 1
+                    self._publish()
+                    return task
+                await self._cond.wait()
+
+    async def _release(self, task: DownloadTask):
+        self.lane_active[task.lane] -= 1
+        self._publish()
+        self._platform_sem(task.platform).release()
+        self._global.release()
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def try_claim(self, platform: str, slots: int) -> bool:
+        """Take extra idle slots for a hedged attempt without waiting.
+
+        Returns False (holding nothing) if the slots aren't free right now,
+        so hedges only ever use capacity no queued task could have used.
+        """
+        sem = self._platform_sem(platform)
+        for claimed in range(slots):
+            if self._global.locked() or sem.locked():
+                await self.release_claim(platform, claimed)
+                return False
+            await self._global.acquire()
+            await sem.acquire()
+        return True
+
+    async def release_claim(self, platform: str, slots: int):
+        if not slots:
+            return
+        sem = self._platform_sem(platform)
+        for _ in range(slots):
+            sem.release()
+            self._global.release()
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def _worker(self, n: int):
+        while True:
+            task = await self._take()
+            self.active += 1
+            waited = time.monotonic() - task.enqueued_at
+            metrics.LANE_WAIT.observe(waited, lane=task.lane)
+            logging.info(f"Worker {n} starting {task.platform} job in {task.lane} lane "
+                         f"(predicted {task.cost:.0f}s, waited {waited:.1f}s, {self.queued} queued)")
+            try:
+                await task.runner()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Download job failed in worker {n}: {e}")
+            finally:
+                self.active -= 1
+                metrics.LANE_LATENCY.observe(time.monotonic() - task.enqueued_at, lane=task.lane)
+                await self._release(task)
+
+
+class SingleFlight:
+    """Coalesces concurrent requests for the same key onto one shared future.
+
+    The first request for a key becomes the leader and does the work; later
+    requests for the same key await the leader's result instead of starting
+    their own download.
+    """
+
+    def __init__(self):
+        self._futures = {}
+
+    def join(self, key: str) -> Optional[asyncio.Future]:
+        """The in-flight future for key, if a leader is already working on it"""
+        return self._futures.get(key)
+
+    def begin(self, key: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        return future
+
+    def finish(self, key: str, result):
+        future = self._futures.pop(key, None)
+        if future and not future.done():
+            future.set_result(result)
+
+    def __len__(self):
+        return len(self._futures)
+
+
+class QualityPicks:
+    """Quality menu choices kept on the server behind short callback tokens.
+
+    Telegram caps callback_data at 64 bytes, which a format id plus a watch
+    URL with query parameters easily exceeds, so buttons only carry a token
+    for the (url, format_id) pick. The oldest picks are dropped above
+    `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._picks = OrderedDict()
+
+    def add(self, url: str, format_id: str) -> str:
+        token = secrets.token_urlsafe(6)
+        self._picks[token] = (url, format_id)
+        while len(self._picks) > self.max_entries:
+            self._picks.popitem(last=False)
+        return token
+
+    def get(self, token: str) -> Optional[tuple]:
+        """(url, format_id) for a token, None once it was dropped (or after a restart)"""
+        return self._picks.get(token)
+
+
+class AdmissionControl:
+    """Per-user link quotas (token buckets) and in-flight caps.
+
+    Checked before a request does any work, so one user pasting dozens of
+    links can't fill every download slot.
+    """
+
+    # Idle users are forgotten above this many
+    MAX_IDLE_USERS = 10000
+
+    def __init__(self, rate_per_minute: float, burst: int, max_in_flight: int):
+        self.rate = rate_per_minute / 60
+        self.burst = max(1, burst)
+        self.max_in_flight = max_in_flight
+        self._buckets = {}
+        self._in_flight = {}
+        metrics.ADMISSION_LIMIT.set(rate_per_minute, limit='rate_per_minute')
+        metrics.ADMISSION_LIMIT.set(self.burst, limit='burst')
+        metrics.ADMISSION_LIMIT.set(max_in_flight, limit='max_in_flight')
+
+    def in_flight(self, user_id: int) -> int:
+        return self._in_flight.get(user_id, 0)
+
+    def acquire(self, user_id: int, charge: bool = True) -> Optional[tuple]:
+        """Take an in-flight slot (and a link token if `charge`).
+
+        Returns None when admitted - the caller must release() once the
+        request is done - or (reason, retry_after_seconds) when rejected.
+        """
+        if self.max_in_flight and self.in_flight(user_id) >= self.max_in_flight:
+            metrics.ADMISSION_REJECTED.inc(reason='in_flight')
+            return 'in_flight', None
+        if charge and self.rate > 0:
+            now = time.monotonic()
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                if len(self._buckets) > self.MAX_IDLE_USERS:
+                    self._buckets = {user: b for user, b in self._buckets.items() if not b.full(now)}
+                bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+            wait = bucket.wait_time(now)
+            if wait > 0:
+                metrics.ADMISSION_REJECTED.inc(reason='rate')
+                return 'rate', wait
+            bucket.take(now)
+        self._in_flight[user_id] = self.in_flight(user_id) + 1
+        metrics.ADMISSION_IN_FLIGHT.inc()
+        return None
+
+    def release(self, user_id: int):
+        count = self.in_flight(user_id) - 1
+        if count > 0:
+            self._in_flight[user_id] = count
+        else:
+            self._in_flight.pop(user_id, None)
+        metrics.ADMISSION_IN_FLIGHT.dec()
+
+
+class LatencyTracker:
+    """Recent successful durations per (platform, downloader) pair"""
+
+    def __init__(self, window: int = 50, min_samples: int = 5):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+
+    def record(self, platform: str, tool: str, seconds: float):
+        key = (platform, tool)
+        if key not in self._samples:
+            self._samples[key] = deque(maxlen=self.window)
+        self._samples[key].append(seconds)
+
+    def percentile(self, platform: str, tool: str, q: float) -> Optional[float]:
+        """The q-th percentile, or None until enough samples are recorded"""
+        samples = sorted(self._samples.get((platform, tool), ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def hedge_delay(self, platform: str, tool: str) -> float:
+        """How long to give a downloader before hedging with the next one"""
+        delay = self.percentile(platform, tool, HEDGE_PERCENTILE)
+        if delay is None:
+            delay = HEDGE_DELAY
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, delay))
+
+
+class Deadline:
+    """Time budget for one request, shared by all of its attempts"""
+
+    def __init__(self, budget: float, platform: str = 'unknown'):
+        self.budget = budget
+        self.platform = platform
+        self.started = time.monotonic()
+        self.expires = self.started + budget
+        self.spent = []
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+    def limit(self, timeout: float) -> float:
+        """A step's own timeout, cut down to what is left of the budget"""
+        return min(timeout, self.remaining())
+
+    def skip(self, stage: str) -> bool:
+        """True (and counted) when no budget is left for a stage"""
+        if not self.expired:
+            return False
+        logging.warning(f"Skipping {stage} for {self.platform}: request deadline of {self.budget:.0f}s passed")
+        metrics.DEADLINE_SKIPPED.inc(platform=self.platform, stage=stage)
+        return True
+
+    @contextlib.contextmanager
+    def attempt(self, stage: str):
+        """Record the share of the budget an attempt used"""
+        started = time.monotonic()
+        try:
+            yield self
+        finally:
+            used = time.monotonic() - started
+            self.spent.append((stage, used))
+            metrics.DEADLINE_BUDGET_USED.observe(used / self.budget, platform=self.platform, stage=stage)
+            if self.expired:
+                metrics.DEADLINE_EXCEEDED.inc(platform=self.platform, stage=stage)
+
+    def summary(self) -> str:
+        used = ', '.join(f"{stage} {seconds / self.budget:.0%}" for stage, seconds in self.spent)
+        return f"{time.monotonic() - self.started:.1f}s of {self.budget:.0f}s ({used or 'no attempts'})"
+
+
+class ProgressMessage:
+    """Rate-limited progress edits of a status message.
+
+    update() is called from the extractor pool's watchdog loop; edits run in
+    the background, never overlap and happen at most every `interval`
+    seconds. close() must be awaited before the message is edited elsewhere.
+    """
+
+    def __init__(self, message, interval: float = PROGRESS_EDIT_INTERVAL):
+        self.message = message
+        self.interval = interval
+        self._last_edit = 0.0
+        self._last_text = None
+        self._editing = None
+        self._closed = False
+
+    def update(self, progress: dict, label: str = ''):
+        if not self.message or self._closed:
+            return
+        now = time.monotonic()
+        if now - self._last_edit < self.interval or (self._editing and not self._editing.done()):
+            return
+        text = self.render(progress, label)
+        if text == self._last_text:
+            return
+        self._last_edit, self._last_text = now, text
+        self._editing = asyncio.create_task(self._edit(text))
+
+    async def _edit(self, text: str):
+        try:
+            await self.message.edit_text(text)
+        except Exception as e:
+            logging.warning(f"Could not update progress message: {e}")
+
+    async def close(self):
+        self._closed = True
+        if self._editing:
+            await asyncio.gather(self._editing, return_exceptions=True)
+
+    @staticmethod
+    def render(progress: dict, label: str = '') -> str:
+        if progress['phase'] == 'processing':
+            return "⚙️ Processing downloaded media..."
+        downloaded = progress['downloaded'] / (1024 * 1024)
+        text = f"⬇️ Downloading{label}... {downloaded:.1f} MB"
+        if progress['total']:
+            percent = min(100, int(progress['downloaded'] * 100 / progress['total']))
+            text += f" / {progress['total'] / (1024 * 1024):.1f} MB ({percent}%)"
+        if progress['files'] > 1:
+            text += f"\n📁 {progress['files']} files done"
+        return text
+
+
 class SetupiaAISaver:
     def __init__(self, token: str):
         self.token = token
-        self.app = Application.builder().token(token).build()
+        self.scheduler = DownloadScheduler(
+            DOWNLOAD_WORKERS,
+            MAX_ACTIVE_DOWNLOADS,
+            parse_platform_limits(PLATFORM_CONCURRENCY),
+            DEFAULT_PLATFORM_CONCURRENCY,
+            CHEAP_JOB_SECONDS,
+            RESERVED_CHEAP_SLOTS
+        )
+        self.job_costs = parse_platform_limits(PLATFORM_JOB_COSTS)
+        self.metrics_server = None
+        self.flights = SingleFlight()
+        self.picks = QualityPicks()
+        self.latency = LatencyTracker()
+        self.hedge_costs = parse_platform_limits(HEDGE_COST, minimum=0)
+        self.deadlines = parse_platform_limits(REQUEST_DEADLINES)
+        self.admission = AdmissionControl(USER_RATE_PER_MINUTE, USER_BURST, USER_MAX_IN_FLIGHT)
+        self.cache_db = open_database(CACHE_DB_PATH)
+        self.file_ids = FileIdCache(self.cache_db, FILE_ID_CACHE_TTL, FILE_ID_CACHE_MAX_ENTRIES)
+        self.metadata = MetadataCache(
+            self.cache_db,
+            {'formats': FORMATS_CACHE_TTL, 'analysis': ANALYSIS_CACHE_TTL},
+            METADATA_CACHE_MEMORY_ENTRIES
+        )
+        self.negative = NegativeCache(self.cache_db, parse_platform_limits(NEGATIVE_CACHE_TTLS, minimum=0))
+        self.failure_notes = {}
+        self.resolver = ShortLinkResolver(
+            RedirectCache(self.cache_db, REDIRECT_CACHE_TTL),
+            max_hops=SHORT_LINK_MAX_HOPS,
+            timeout=SHORT_LINK_TIMEOUT
+        )
+        # ffmpeg / yt-dlp / gallery-dl paths, versions and features, probed at startup
+        self.toolchain = Toolchain()
+        self.extractors = ExtractorPool(EXTRACTOR_WORKERS, {
+            'instagram_cookies': INSTAGRAM_COOKIES_FILE if INSTAGRAM_COOKIES_FILE and Path(INSTAGRAM_COOKIES_FILE).exists() else None,
+            'reddit_client_id': REDDIT_CLIENT_ID,
+            'reddit_client_secret': REDDIT_CLIENT_SECRET,
+            'reddit_user_agent': REDDIT_USER_AGENT,
+        }, stall_timeout=STALL_TIMEOUT, max_duration=DOWNLOAD_MAX_DURATION, toolchain=self.toolchain)
+        # Merges, re-encodes and splits run here, off the download slots
+        self.ffmpeg = FfmpegPool(self.toolchain, FFMPEG_WORKERS, FFMPEG_TRANSCODE_WORKERS, FFMPEG_THREADS, FFMPEG_NICE)
+        # Every send and edit is queued here: rate limits, flood-wait retries,
+        # media ahead of status edits
+        self.outbound = OutboundScheduler(OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_GROUP_RATE / 60,
+                                          OUTBOUND_MAX_RETRIES)
+        builder = (
+            Application.builder()
+            .token(token)
+            .concurrent_updates(True)
+            .rate_limiter(self.outbound)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+        )
+        if LOCAL_BOT_API_URL:
+            # The local server uploads to Telegram before answering, so sends
+            # of large files need far longer timeouts than the cloud defaults
+            builder = (
+                builder
+                .base_url(f"{LOCAL_BOT_API_URL}/bot")
+                .base_file_url(f"{LOCAL_BOT_API_URL}/file/bot")
+                .local_mode(True)
+                .read_timeout(LOCAL_BOT_API_TIMEOUT)
+                .write_timeout(LOCAL_BOT_API_TIMEOUT)
+                .media_write_timeout(LOCAL_BOT_API_TIMEOUT)
+            )
+            logging.info(f"Using local Bot API server at {LOCAL_BOT_API_URL} "
+                         f"(uploads up to {MAX_UPLOAD_BYTES // (1024 * 1024)}MB)")
+        else:
+            # Multipart uploads read their files in a thread (the pool size is the builder's default)
+            builder = builder.request(ThreadedUploadRequest(connection_pool_size=256))
+        self.app = builder.build()
         self.setup_handlers()
 
+    async def post_init(self, application: Application):
+        """Start background workers once the event loop is running"""
+        # The extractor workers are given the probed ffmpeg, so they wait for the probe
+        await self.toolchain.ready()
+        self.extractors.start()
+        self.resolver.start()
+        self.scheduler.start()
+        if METRICS_PORT:
+            self.metrics_server = await metrics.serve(METRICS_HOST, METRICS_PORT)
+
+    async def post_shutdown(self, application: Application):
+        """Stop background workers"""
+        if self.metrics_server:
+            self.metrics_server.close()
+            await self.metrics_server.wait_closed()
+        await self.scheduler.stop()
+        await self.resolver.close()
+        self.extractors.shutdown()
+
+    def platform_for_url(self, url: str) -> str:
+        """Scheduler key for a URL"""
+        if self.is_youtube_url(url):
+            return 'youtube'
+        return self.is_social_media_url(url)
+
+    def media_cache_key(self, url: str, format_id: str = 'auto') -> str:
+        """Cache key for a media item: media identity plus the chosen format"""
+        return f"{self.media_identity(url)}|{format_id}"
+
+    def canonical_url(self, url: str) -> str:
+        """URL without scheme, mobile/www prefixes, trailing slash or tracking parameters"""
+        return urlnorm.canonical_url(url)
+
+    def media_identity(self, url: str) -> str:
+        """Platform media ID (e.g. youtube:dQw4w9WgXcQ), or the canonical URL"""
+        return urlnorm.media_identity(url)
+
+    def deadline_for(self, platform: str) -> Deadline:
+        """A fresh request deadline with the platform's budget"""
+        return Deadline(self.deadlines.get(platform, DEFAULT_REQUEST_DEADLINE), platform)
+
+    async def run_budgeted(self, deadline: Optional[Deadline], stage: str, timeout: float, call) -> Optional[dict]:
+        """Run an extractor pool call within what is left of a request's deadline.
+
+        `call(timeout, max_duration)` starts the pool call. Both are cut to the
+        remaining budget; None (like a pool timeout) once the deadline passed.
+        """
+        if deadline is not None and deadline.skip(stage):
+            return None
+        # Deadline stages are named after the downloader; metrics split the two
+        labels = {
+            'stage': 'analysis' if stage == 'analysis' else 'download',
+            'platform': deadline.platform if deadline else 'unknown',
+            'downloader': 'gallery-dl' if stage == 'gallery-dl' else 'yt-dlp',
+        }
+        with metrics.STAGE_SECONDS.time(**labels):
+            if deadline is None:
+                result = await call(timeout, None)
+            else:
+                with deadline.attempt(stage):
+                    result = await call(deadline.limit(timeout), deadline.remaining())
+        if result is None:
+            metrics.TIMEOUTS.inc(**labels)
+        return result
+
+    def cached_metadata(self, kind: str, url: str):
+        """Metadata cache lookup for a URL, logging the running hit rate"""
+        value = self.metadata.get(kind, self.media_identity(url))
+        if value is not None:
+            hit_rate = self.metadata.stats()[kind]['hit_rate']
+            logging.info(f"Served {kind} for {url} from metadata cache ({hit_rate:.0%} hit rate)")
+        return value
+
+    def classify_failure(self, error: str) -> Optional[str]:
+        """Map a yt-dlp / gallery-dl error message to a failure class"""
+        status = HTTP_STATUS_PATTERN.search(error)
+        if status:
+            return FAILURE_STATUS_CODES.get(int(status.group(1)))
+        for failure, pattern in FAILURE_PATTERNS:
+            if pattern.search(error):
+                return failure
+        return None
+
+    def classify_result(self, result: dict) -> Optional[str]:
+        """Failure class of a failed pool call; none when it only waited on a busy pool"""
+        if result.get('busy'):
+            return None
+        return self.classify_failure(result['error'])
+
+    def note_failure(self, url: str, failure: Optional[str]):
+        """Remember why an attempt on a URL failed, keeping the strongest class"""
+        if not failure:
+            return
+        key = self.canonical_url(url)
+        current = self.failure_notes.get(key)
+        if current is None or FAILURE_CLASSES.index(failure) < FAILURE_CLASSES.index(current):
+            self.failure_notes[key] = failure
+
+    def take_failure(self, *urls: str) -> Optional[str]:
+        """Strongest failure class noted for any of the URLs, clearing the notes"""
+        failures = [self.failure_notes.pop(self.canonical_url(url), None) for url in urls]
+        failures = [failure for failure in failures if failure]
+        return min(failures, key=FAILURE_CLASSES.index) if failures else None
+
     def setup_handlers(self):
         """Setup bot command and message handlers"""
         self.app.add_handler(CommandHandler("start", self.start_command))
         self.app.add_handler(CommandHandler("help", self.help_command))
+        self.app.add_handler(CommandHandler("status", self.status_command))
         self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_url))
         self.app.add_handler(CallbackQueryHandler(self.quality_callback))
 
@@ -98,6 +874,39 @@ Just paste the link and I'll handle the rest! 🚀
         """
         await update.message.reply_text(help_message, parse_mode=ParseMode.MARKDOWN)
 
+    async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /status command: toolchain readiness (/status refresh probes again).
+
+        Admins only: it shows server paths and tool versions, and a refresh
+        re-probes the whole toolchain.
+        """
+        if update.effective_user is None or update.effective_user.id not in ADMIN_USER_IDS:
+            await update.message.reply_text("⛔ /status is only available to the bot's admins.")
+            return
+        if context.args and context.args[0].lower() == 'refresh':
+            await self.toolchain.probe()
+        else:
+            await self.toolchain.ready()
+        report = self.toolchain.report()
+
+        lines = ["✅ Ready" if report['ready'] else "❌ Not ready: a required downloader is missing", ""]
+        for name, tool in report['tools'].items():
+            if tool['available']:
+                features = ', '.join(feature for feature, supported in tool['features'].items() if supported)
+                lines.append(f"✅ {name} {tool['version'] or ''}" + (f" ({features})" if features else ''))
+            else:
+                lines.append(f"❌ {name}: {tool['error']}")
+        if report['missing_optional']:
+            lines += ["", f"⚠️ Running without {', '.join(report['missing_optional'])}"]
+
+        lines += ["", "Download lanes (queue to finish):"]
+        for lane, stats in self.scheduler.lane_report().items():
+            latency = (f"p50 {stats['p50']:.0f}s, p95 {stats['p95']:.0f}s" if stats['p50'] is not None
+                       else "no jobs yet")
+            lines.append(f"• {lane}: {stats['active']} running, {stats['queued']} queued, {latency}")
+        # Plain text: tool errors contain underscores and paths
+        await update.message.reply_text('\n'.join(lines))
+
     async def handle_url(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle URL messages and download media"""
         url = update.message.text.strip()
@@ -106,15 +915,8 @@ Just paste the link and I'll handle the rest! 🚀
         if url.startswith('@'):
             url = url[1:]  # Remove @ symbol
         
-        # Remove tracking parameters that can cause issues (but keep si= for YouTube analytics)
-        tracking_params = ['utm_source=', 'utm_medium=', 'utm_name=', 'utm_term=', 'utm_content=', 'utm_campaign=']
-        for param in tracking_params:
-            if f'?{param}' in url:
-                url = url.split(f'?{param}')[0]
-                break
-            elif f'&{param}' in url:
-                url = url.split(f'&{param}')[0]
-                break
+        # Remove utm_* tracking parameters (but keep si= for YouTube analytics)
+        url = urlnorm.strip_utm(url)
         user = update.effective_user
 
         logging.info(f"URL received from {user.first_name}: {url}")
@@ -123,9 +925,164 @@ Just paste the link and I'll handle the rest! 🚀
             await update.message.reply_text("❌ Please send a valid URL from supported platforms.")
             return
 
-        # Send processing message
-        processing_msg = await update.message.reply_text("🔄 Processing your request...")
+        # Quotas are checked before any work: link expansion, caches, downloads
+        if not await self.admit(update.message, user.id):
+            return
+        queued = False
+        try:
+            queued = await self.start_url(update, context, url)
+        finally:
+            if not queued:
+                self.admission.release(user.id)
+
+    async def start_url(self, update: Update, context: ContextTypes.DEFAULT_TYPE, url: str) -> bool:
+        """Answer a link from the caches or queue its download.
+
+        Returns True once a download task is queued; the task then owns the
+        user's admission slot.
+        """
+        user = update.effective_user
+
+        # Expand short links so routing and the caches see the real post URL
+        started = time.monotonic()
+        url = await self.resolver.resolve(url)
+        metrics.STAGE_SECONDS.observe(time.monotonic() - started, stage='url_normalization',
+                                      platform=self.platform_for_url(url), downloader='none')
+
+        # Links that failed a moment ago are answered without another attempt
+        failure = self.negative.get(self.canonical_url(url))
+        if failure:
+            logging.info(f"Negative cache hit ({failure}) for {url}")
+            await update.message.reply_text(FAILURE_MESSAGES[failure])
+            return False
+
+        # Links we already delivered are resent by file_id without downloading
+        cache_key = self.media_cache_key(url)
+        if not self.is_youtube_url(url):
+            if await self.reply_from_cache(update.message, cache_key):
+                return False
+
+            # Someone else is already downloading this link - share their result
+            flight = self.flights.join(cache_key)
+            if flight:
+                waiting_msg = await update.message.reply_text("🔄 This link is already being downloaded, sharing the result...")
+                self.app.create_task(self.follow_flight(update.message, flight, waiting_msg))
+                return False
+            self.flights.begin(cache_key)
+
+        platform = self.platform_for_url(url)
+        try:
+            if self.scheduler.has_free_slot(platform):
+                processing_msg = await update.message.reply_text("🔄 Processing your request...")
+            else:
+                processing_msg = await update.message.reply_text(self.queue_text(self.scheduler.queued + 1))
+        except Exception:
+            # Never leave followers waiting on a leader that didn't start
+            self.flights.finish(cache_key, None)
+            raise
+
+        await self.enqueue(
+            platform, user.id, lambda: self.process_url(update, context, url, processing_msg), processing_msg,
+            cost=self.predict_cost(url)
+        )
+        logging.info(f"Queued {platform} download for {user.first_name}: {url}")
+        return True
+
+    async def admit(self, message, user_id: int, charge: bool = True) -> bool:
+        """Apply the user's quotas; replies with the reason when the request is refused"""
+        rejection = self.admission.acquire(user_id, charge)
+        if rejection is None:
+            return True
+        reason, retry_after = rejection
+        logging.info(f"Admission refused for user {user_id}: {reason}")
+        if reason == 'rate':
+            await message.reply_text(f"⏳ You're sending links faster than I can take them. "
+                                     f"Try again in {math.ceil(retry_after)}s.")
+        else:
+            await message.reply_text(f"⏳ You already have {self.admission.in_flight(user_id)} downloads in progress. "
+                                     f"Try again once one of them finishes.")
+        return False
+
+    def predict_cost(self, url: str, format_id: Optional[str] = None) -> float:
+        """Expected seconds of download-slot time for a request, from what is known before downloading.
+
+        A known size (the picked YouTube format, or an analysed Instagram
+        post) is priced at the expected download rate; otherwise recent
+        timings for the platform are used, then the configured prior.
+        """
+        platform = self.platform_for_url(url)
+        bytes_per_second = EXPECTED_DOWNLOAD_MB_PER_SECOND * 1024 * 1024
+        size = None
+        if format_id is not None:
+            formats = self.metadata.get('formats', self.media_identity(url), count=False) or []
+            picked = next((fmt for fmt in formats if fmt['id'] == format_id), None)
+            size = picked['size'] if picked else None
+            if size:
+                # Separate video and audio still have to be merged
+                merge = size / MERGE_BYTES_PER_SECOND if '+' in format_id else 0
+                return 2 + size / bytes_per_second + merge
+        elif platform == 'youtube':
+            # The link itself only lists formats
+            return self.job_costs.get('youtube', DEFAULT_JOB_COST)
+        elif platform == 'instagram':
+            analysis = self.metadata.get('analysis', self.media_identity(url), count=False)
+            if analysis and analysis.get('type') == 'image':
+                return 2
+            if analysis and analysis.get('duration'):
+                size = analysis.get('size') or analysis['duration'] * TYPICAL_VIDEO_BYTES_PER_SECOND
+                return 2 + size / bytes_per_second
+
+        timings = [self.latency.percentile(platform, tool, 0.5) for tool in ('yt-dlp', 'gallery-dl')]
+        timings = [seconds for seconds in timings if seconds is not None]
+        if timings:
+            return min(timings)
+        if format_id is not None:
+            # A download, not the format listing the YouTube prior stands for
+            return DEFAULT_JOB_COST
+        return self.job_costs.get(platform, DEFAULT_JOB_COST)
+
+    @staticmethod
+    def queue_text(position: int) -> str:
+        return f"⏳ All download slots are busy, your link is queued (position {position})..."
+
+    async def enqueue(self, platform: str, user_id: int, runner: Callable[[], Awaitable[None]], status_msg,
+                      cost: float = 0.0):
+        """Queue an admitted request; its status message tracks the queue position until it starts"""
+        watcher = None
+
+        async def run():
+            if watcher:
+                watcher.cancel()
+            try:
+                await runner()
+            finally:
+                self.admission.release(user_id)
+
+        task = DownloadTask(platform, run, user_id=user_id, cost=cost)
+        position = await self.scheduler.submit(task)
+        watcher = self.app.create_task(self.show_queue_position(task, status_msg, position))
+
+    async def show_queue_position(self, task: DownloadTask, status_msg, shown: int):
+        """Edit a queued request's status message as it moves up the queue"""
+        while True:
+            await asyncio.sleep(PROGRESS_EDIT_INTERVAL)
+            position = self.scheduler.position(task)
+            if not position:
+                return
+            if position != shown:
+                shown = position
+                try:
+                    await status_msg.edit_text(self.queue_text(position))
+                except Exception as e:
+                    logging.debug(f"Queue position update failed: {e}")
+
+    async def process_url(self, update: Update, context: ContextTypes.DEFAULT_TYPE, url: str, processing_msg):
+        """Download a URL and send the result; runs on a scheduler worker"""
         logging.info(f"Starting download process for: {url}")
+        cache_key = self.media_cache_key(url)
+        shared_result = None
+        # One time budget for analysis and every download attempt below
+        deadline = self.deadline_for(self.platform_for_url(url))
 
         # Create a temporary directory that we control
         temp_dir = tempfile.mkdtemp(prefix="setupia_")
@@ -137,27 +1094,7 @@ Just paste the link and I'll handle the rest! 🚀
                 formats = await self.get_youtube_formats(url)
 
                 if formats:
-                    keyboard = []
-
-                    # Create quality buttons
-                    for fmt in formats:
-                        if fmt['quality'] == 'Audio Only':
-                            quality_text = f"🎵 {fmt['quality']} (M4A)"
-                        else:
-                            quality_text = f"📺 {fmt['quality']} (Video Only)"
-                        callback_data = f"quality:{fmt['id']}:{url}"
-                        keyboard.append([InlineKeyboardButton(quality_text, callback_data=callback_data)])
-
-                    # Add best quality auto-select option
-                    keyboard.append([InlineKeyboardButton("⭐ Best Available", callback_data=f"quality:best:{url}")])
-
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-
-                    quality_message = f"""```
-Available formats:
-{chr(10).join([f"• {fmt['quality']}" for fmt in formats])}
-```"""
-
+                    quality_message, reply_markup = await self.format_picker(formats, url)
                     await processing_msg.edit_text(
                         quality_message,
                         reply_markup=reply_markup,
@@ -178,37 +1115,25 @@ Available formats:
                         formats = await self.get_youtube_formats(clean_url)
                         if formats:
                             # Success with cleaned URL - show formats
-                            keyboard = []
-                            for fmt in formats:
-                                if fmt['quality'] == 'Audio Only':
-                                    quality_text = f"🎵 {fmt['quality']} (M4A)"
-                                else:
-                                    quality_text = f"📺 {fmt['quality']} (Video Only)"
-                                callback_data = f"quality:{fmt['id']}:{clean_url}"
-                                keyboard.append([InlineKeyboardButton(quality_text, callback_data=callback_data)])
-                            
-                            keyboard.append([InlineKeyboardButton("⭐ Best Available", callback_data=f"quality:best:{clean_url}")])
-                            reply_markup = InlineKeyboardMarkup(keyboard)
-                            
-                            quality_message = f"""```
-Available formats (cleaned URL):
-{chr(10).join([f"• {fmt['quality']}" for fmt in formats])}
-```"""
-                            
+                            quality_message, reply_markup = await self.format_picker(
+                                formats, clean_url, "Available formats (cleaned URL)"
+                            )
                             await processing_msg.edit_text(
                                 quality_message,
                                 reply_markup=reply_markup,
                                 parse_mode=ParseMode.MARKDOWN
                             )
-                            
+
                             context.user_data['pending_url'] = clean_url
                             context.user_data['temp_dir'] = temp_dir
                             return
                     
                     # Final fallback - download with best quality
+                    metrics.FALLBACKS.inc(platform='youtube', kind='no_format_list')
                     await processing_msg.edit_text("🔄 Getting formats failed, downloading best quality...")
                     download_url = clean_url if clean_url != url else url
-                    media_info = await self.download_with_yt_dlp(download_url, temp_dir)
+                    media_info = await self.hedged_download('youtube', [('yt-dlp', download_url)], temp_dir, processing_msg,
+                                                            deadline=deadline)
             else:
                 # Detect platform and choose optimal downloader
                 platform = self.is_social_media_url(url)
@@ -217,95 +1142,93 @@ Available formats (cleaned URL):
                 if platform == 'instagram':
                     # Analyze Instagram content first to determine best tool
                     await processing_msg.edit_text("🔍 Analyzing Instagram content...")
-                    analysis = await self.analyze_instagram_content(url)
+                    analysis = await self.analyze_instagram_content(url, deadline)
                     
                     if analysis['type'] == 'auth_required':
                         if not INSTAGRAM_COOKIES_FILE or not Path(INSTAGRAM_COOKIES_FILE).exists():
+                            self.negative.put(self.canonical_url(url), 'auth')
                             await processing_msg.edit_text("🔐 Instagram content requires authentication.\n\n💡 **Permission Request:**\nTo download Instagram stories/posts, I need your browser cookies (login session).\n\n📋 **Setup steps:**\n1. Install 'Get cookies.txt LOCALLY' Chrome extension\n2. Login to Instagram\n3. Export cookies to cookies/instagram_cookies.txt\n\n🔒 **Privacy:** Cookies stay on your device only.\n\n📖 See GET_INSTAGRAM_COOKIES.md for detailed guide.")
                             return
                         else:
                             # Try with cookies
                             await processing_msg.edit_text("🔐 Using your Instagram cookies for authentication...")
-                            analysis['best_tool'] = 'gallery-dl'  # Use gallery-dl with cookies
+                            analysis = dict(analysis, best_tool='gallery-dl')  # Use gallery-dl with cookies
                     
                     # Use the best tool based on analysis
+                    info = analysis.get('info')
                     if analysis.get('type') == 'video':
                         await processing_msg.edit_text(f"🎬 Instagram video detected, using yt-dlp...")
-                        media_info = await self.download_with_yt_dlp(url, temp_dir)
-                        if not media_info:
-                            await processing_msg.edit_text("🔄 Trying gallery-dl for video...")
-                            media_info = await self.download_with_gallery_dl(url, temp_dir)
+                        order = ['yt-dlp', 'gallery-dl']
                     elif analysis.get('type') == 'image':
                         await processing_msg.edit_text(f"📸 Instagram image detected, using gallery-dl...")
-                        media_info = await self.download_with_gallery_dl(url, temp_dir)
-                        if not media_info:
-                            await processing_msg.edit_text("🔄 Trying yt-dlp for image...")
-                            media_info = await self.download_with_yt_dlp(url, temp_dir)
+                        order = ['gallery-dl', 'yt-dlp']
                     else:
                         # Unknown or mixed content - use gallery-dl first (Instagram default)
                         await processing_msg.edit_text(f"📱 Instagram content detected, using gallery-dl...")
-                        media_info = await self.download_with_gallery_dl(url, temp_dir)
-                        if not media_info:
-                            await processing_msg.edit_text("🔄 Trying yt-dlp as fallback...")
-                            media_info = await self.download_with_yt_dlp(url, temp_dir)
-                            
+                        order = ['gallery-dl', 'yt-dlp']
+                        info = None
+                    media_info = await self.hedged_download(
+                        platform, [(tool, url) for tool in order], temp_dir, processing_msg, info=info,
+                        deadline=deadline
+                    )
+
                 elif platform in ['pinterest', 'deviantart', 'flickr', 'behance', 'tumblr']:
                     # Image-focused platforms: gallery-dl first
                     await processing_msg.edit_text(f"🎨 Downloading from {platform.title()}...")
-                    media_info = await self.download_with_gallery_dl(url, temp_dir)
-                    
-                    if not media_info:
-                        await processing_msg.edit_text(f"🔄 Trying alternative method for {platform.title()}...")
-                        media_info = await self.download_with_yt_dlp(url, temp_dir)
-                        
+                    media_info = await self.hedged_download(
+                        platform, [('gallery-dl', url), ('yt-dlp', url)], temp_dir, processing_msg, deadline=deadline
+                    )
+
                 elif platform in ['facebook', 'reddit', 'linkedin']:
                     # Video-focused platforms: yt-dlp first
                     await processing_msg.edit_text(f"📺 Downloading from {platform.title()}...")
-                    media_info = await self.download_with_yt_dlp(url, temp_dir)
-                    
-                    if not media_info:
-                        await processing_msg.edit_text(f"🔄 Trying alternative method for {platform.title()}...")
-                        media_info = await self.download_with_gallery_dl(url, temp_dir)
-                        
+                    media_info = await self.hedged_download(
+                        platform, [('yt-dlp', url), ('gallery-dl', url)], temp_dir, processing_msg, deadline=deadline
+                    )
+
                 elif platform in ['twitter', 'telegram']:
                     # Mixed content platforms: balanced approach
                     await processing_msg.edit_text(f"📱 Downloading from {platform.title()}...")
-                    media_info = await self.download_with_gallery_dl(url, temp_dir)
-                    
-                    if not media_info:
-                        media_info = await self.download_with_yt_dlp(url, temp_dir)
-                        
+                    media_info = await self.hedged_download(
+                        platform, [('gallery-dl', url), ('yt-dlp', url)], temp_dir, processing_msg, deadline=deadline
+                    )
+
                 else:
-                    # Unknown/other platforms: try both methods
+                    # Unknown/other platforms: try both methods, then both
+                    # again with the cleaned URL
                     await processing_msg.edit_text("🔍 Detecting platform and downloading...")
-                    media_info = await self.download_with_gallery_dl(url, temp_dir)
-                    
-                    if not media_info:
-                        media_info = await self.download_with_yt_dlp(url, temp_dir)
-                    
-                    # If download failed, try with cleaned URL
-                    if not media_info:
-                        clean_url = self.clean_url_for_download(url)
-                        if clean_url != url:
-                            await processing_msg.edit_text("🔄 Trying cleaned URL for better compatibility...")
-                            
-                            # Try gallery-dl with cleaned URL first
-                            media_info = await self.download_with_gallery_dl(clean_url, temp_dir)
-                            
-                            # If still failed, try yt-dlp with cleaned URL
-                            if not media_info:
-                                media_info = await self.download_with_yt_dlp(clean_url, temp_dir)
+                    attempts = [('gallery-dl', url), ('yt-dlp', url)]
+                    clean_url = self.clean_url_for_download(url)
+                    if clean_url != url:
+                        attempts += [('gallery-dl', clean_url), ('yt-dlp', clean_url)]
+                    media_info = await self.hedged_download(platform, attempts, temp_dir, processing_msg,
+                                                            deadline=deadline)
 
             if 'media_info' in locals() and media_info:
-                await self.send_media_to_user(update, media_info)
+                media_info = await self.fit_for_upload(media_info, processing_msg)
+                delivered = await self.send_media_to_user(update, media_info)
+                caption = self.format_description(media_info['metadata'])
+                await asyncio.to_thread(self.file_ids.put, cache_key, delivered, caption)
+                shared_result = {'items': delivered, 'caption': caption}
                 await processing_msg.delete()
-            elif not self.is_youtube_url(url):
-                await processing_msg.edit_text("❌ Download failed or timed out. This can happen with:\n• Very long videos\n• Private content\n• Unsupported formats\n\nTry a shorter video or different URL!")
+            else:
+                # Every attempt failed: remember why, so a resend is answered at once
+                failure = self.take_failure(url, self.clean_url_for_download(url))
+                if failure:
+                    self.negative.put(self.canonical_url(url), failure)
+                    logging.info(f"Caching {failure} failure for {url}")
+                if not self.is_youtube_url(url):
+                    await processing_msg.edit_text(FAILURE_MESSAGES.get(failure) or "❌ Download failed or timed out. This can happen with:\n• Very long videos\n• Private content\n• Unsupported formats\n\nTry a shorter video or different URL!")
 
         except Exception as e:
             await processing_msg.edit_text(f"❌ Error processing URL: {str(e)}")
             print(f"Error: {e}")
         finally:
+            # Hand the uploaded file_ids to anyone waiting on the same link
+            self.flights.finish(cache_key, shared_result)
+            self.take_failure(url, self.clean_url_for_download(url))
+            logging.info(f"Request budget for {url}: {deadline.summary()}")
+
             # Clean up temp directory
             try:
                 shutil.rmtree(temp_dir)
@@ -318,393 +1241,445 @@ Available formats (cleaned URL):
 
     def is_youtube_url(self, url: str) -> bool:
         """Check if URL is from YouTube"""
-        return 'youtube.com' in url or 'youtu.be' in url
-    
+        return urlnorm.parse(url).platform == 'youtube'
+
     def clean_url_for_download(self, url: str) -> str:
-        """Remove problematic parameters from social media URLs for downloading"""
-        
-        # Special handling for YouTube URLs - remove everything from ? symbol to end
-        if 'youtube.com' in url.lower() or 'youtu.be' in url.lower():
-            if '?' in url:
-                clean_url = url.split('?')[0]
-                if clean_url != url:
-                    logging.info(f"Cleaned YouTube URL: {url} -> {clean_url}")
-                return clean_url
-            return url
-        
-        # Platform-specific parameters that can cause download issues (mobile app focus)
-        platform_params = {
-            'instagram.com': ['igsh=', 'img_index=', 'utm_source=', 'utm_medium=', 'utm_campaign=', 'igshid='],
-            'tiktok.com': ['is_from_webapp=', 'sender_device=', 'sender_web_id=', '_r=', '_t=', 'u_code=', 'preview_pb='],
-            'twitter.com': ['t=', 's=', 'ref_src=', 'ref_url=', 'cn=', 'refsrc='],
-            'x.com': ['t=', 's=', 'ref_src=', 'ref_url=', 'cn=', 'refsrc='],
-            'facebook.com': ['fbclid=', '__tn__=', '__cft__=', 'hash=', '_rdr=', 'app_id=', 'display='],
-            'fb.watch': ['fbclid=', '__tn__=', '__cft__=', '_rdr='],
-            'reddit.com': ['context=', 'share_id=', 'utm_source=', 'utm_medium=', 'utm_name=', 'utm_term=', 'utm_content='],
-            'redd.it': ['context=', 'share_id=', 'utm_source=', 'utm_medium='],
-            'pinterest.com': ['sent=', 'from_app='],
-            'tumblr.com': ['source=', 'ref='],
-            'linkedin.com': ['trackingId=', 'refId=', 'lipi=', 'licu='],
-            'telegram.org': ['single=', 'thread='],
-            'telegram.me': ['single=', 'thread='],
-            'snapchat.com': ['sender_web_id=', 'utm_source='],
-            'discord.com': ['utm_source=', 'utm_medium='],
-            'whatsapp.com': ['text=', 'app_absent=']
-        }
-        
-        # Find matching platform
-        problematic_params = []
-        for platform, params in platform_params.items():
-            if platform in url.lower():
-                problematic_params = params
-                break
-        
-        # If no specific platform match, use common tracking parameters (mobile apps often add these)
-        if not problematic_params:
-            problematic_params = ['utm_source=', 'utm_medium=', 'utm_campaign=', 'utm_term=', 'utm_content=', 
-                                'utm_name=', 'igsh=', 'igshid=', 'fbclid=', 'gclid=', 'mc_cid=', 'mc_eid=']
-        
-        # Remove problematic parameters (more precise handling)
-        original_url = url
-        for param in problematic_params:
-            # Handle ?param=value (remove everything from ? onwards)
-            if f'?{param}' in url:
-                url = url.split(f'?{param}')[0]
-                break
-            # Handle &param=value (remove everything from & onwards)
-            elif f'&{param}' in url:
-                url = url.split(f'&{param}')[0]
-                break
-        
-        # Log if URL was cleaned
-        if url != original_url:
-            logging.info(f"Cleaned URL for download: {original_url} -> {url}")
-                
-        return url
-    
+        """Remove tracking and problematic parameters from social media URLs for downloading"""
+        clean_url = urlnorm.clean_url(url)
+        if clean_url != url:
+            logging.info(f"Cleaned URL for download: {url} -> {clean_url}")
+        return clean_url
+
     def is_social_media_url(self, url: str) -> str:
         """Detect social media platform type (mobile app aware)"""
-        url_lower = url.lower()
-        
-        # Check for mobile app indicators and platform patterns
-        if 'pinterest.com' in url_lower:
-            return 'pinterest'
-        elif 'deviantart.com' in url_lower:
-            return 'deviantart'
-        elif 'flickr.com' in url_lower:
-            return 'flickr'
-        elif 'reddit.com' in url_lower or 'redd.it' in url_lower:
-            return 'reddit'
-        elif 'tumblr.com' in url_lower:
-            return 'tumblr'
-        elif 'behance.net' in url_lower:
-            return 'behance'
-        elif 'linkedin.com' in url_lower or 'lnkd.in' in url_lower:
-            return 'linkedin'
-        elif 't.me' in url_lower or 'telegram.me' in url_lower or 'telegram.org' in url_lower:
-            return 'telegram'
-        elif 'instagram.com' in url_lower:
-            return 'instagram'
-        elif 'twitter.com' in url_lower or 'x.com' in url_lower:
-            return 'twitter'
-        elif 'facebook.com' in url_lower or 'fb.watch' in url_lower or 'fb.me' in url_lower:
-            return 'facebook'
-        elif 'tiktok.com' in url_lower or 'vm.tiktok.com' in url_lower:
-            return 'tiktok'
-        elif 'snapchat.com' in url_lower or 'snap.com' in url_lower:
-            return 'snapchat'
-        elif 'discord.com' in url_lower or 'discord.gg' in url_lower:
-            return 'discord'
-        elif 'whatsapp.com' in url_lower or 'wa.me' in url_lower:
-            return 'whatsapp'
-        else:
-            return 'unknown'
-
-    def find_ffmpeg(self) -> Optional[str]:
-        """Find ffmpeg executable in common locations"""
-        common_paths = [
-            '/usr/local/bin/ffmpeg',
-            '/opt/homebrew/bin/ffmpeg', 
-            '/usr/bin/ffmpeg',
-            'ffmpeg'  # Check if it's in PATH
-        ]
-        
-        for path in common_paths:
-            try:
-                result = subprocess.run([path, '-version'], 
-                                      capture_output=True, 
-                                      timeout=5)
-                if result.returncode == 0:
-                    return path
-            except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
-                continue
-        return None
+        return urlnorm.parse(url).platform
+
+    async def find_ffmpeg(self) -> Optional[str]:
+        """ffmpeg path from the toolchain registry, None if it isn't installed"""
+        return (await self.toolchain.ready()).path('ffmpeg')
 
-    async def analyze_instagram_content(self, url: str) -> dict:
+    async def analyze_instagram_content(self, url: str, deadline: Optional[Deadline] = None) -> dict:
         """Analyze Instagram URL to determine content type (video/image)"""
+        cached = self.cached_metadata('analysis', url)
+        if cached:
+            return cached
+
         try:
             # Use yt-dlp to quickly analyze the content without downloading
-            cmd = [
-                'yt-dlp',
-                '--dump-json',
-                '--no-download',
-                '--no-warnings',
-                url
-            ]
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            result = await self.run_budgeted(
+                deadline, 'analysis', 15.0, lambda timeout, _: self.extractors.extract(url, timeout=timeout)
             )
-            
-            try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=15.0)
-            except asyncio.TimeoutError:
-                process.kill()
-                await process.wait()
+            if result is None:
+                self.note_failure(url, 'timeout')
                 return {'type': 'unknown', 'reason': 'timeout'}
-            
-            if process.returncode == 0:
-                try:
-                    info = json.loads(stdout.decode())
-                    
-                    # Analyze the content
-                    has_video = bool(info.get('duration')) or bool(info.get('vcodec', '').strip('none'))
-                    has_audio = bool(info.get('acodec', '').strip('none'))
-                    width = info.get('width', 0)
-                    height = info.get('height', 0)
-                    ext = info.get('ext', '').lower()
-                    
-                    # Determine content type
-                    if has_video or ext in ['mp4', 'webm', 'mov']:
-                        content_type = 'video'
-                        best_tool = 'yt-dlp'  # Better for videos
-                    elif ext in ['jpg', 'jpeg', 'png', 'gif'] or (width > 0 and height > 0 and not has_video):
-                        content_type = 'image'
-                        best_tool = 'gallery-dl'  # Better for images
-                    else:
-                        content_type = 'mixed'
-                        best_tool = 'gallery-dl'  # Default for Instagram
-                    
-                    return {
-                        'type': content_type,
-                        'best_tool': best_tool,
-                        'has_video': has_video,
-                        'has_audio': has_audio,
-                        'duration': info.get('duration'),
-                        'format': ext,
-                        'resolution': f"{width}x{height}" if width and height else None,
-                        'title': info.get('title', ''),
-                        'uploader': info.get('uploader', '')
-                    }
-                    
-                except json.JSONDecodeError:
-                    return {'type': 'unknown', 'reason': 'invalid_json'}
+
+            if result['ok']:
+                info = result['info']
+
+                # Analyze the content
+                has_video = bool(info.get('duration')) or bool((info.get('vcodec') or '').strip('none'))
+                has_audio = bool((info.get('acodec') or '').strip('none'))
+                width = info.get('width') or 0
+                height = info.get('height') or 0
+                ext = (info.get('ext') or '').lower()
+
+                # Determine content type
+                if has_video or ext in ['mp4', 'webm', 'mov']:
+                    content_type = 'video'
+                    best_tool = 'yt-dlp'  # Better for videos
+                elif ext in ['jpg', 'jpeg', 'png', 'gif'] or (width > 0 and height > 0 and not has_video):
+                    content_type = 'image'
+                    best_tool = 'gallery-dl'  # Better for images
+                else:
+                    content_type = 'mixed'
+                    best_tool = 'gallery-dl'  # Default for Instagram
+
+                analysis = {
+                    'type': content_type,
+                    'best_tool': best_tool,
+                    'has_video': has_video,
+                    'has_audio': has_audio,
+                    'duration': info.get('duration'),
+                    'format': ext,
+                    'resolution': f"{width}x{height}" if width and height else None,
+                    'title': info.get('title', ''),
+                    'uploader': info.get('uploader', ''),
+                    # Predicted download size, for the scheduler's cost estimate
+                    'size': self.estimate_format_size(info, info.get('duration'))[0],
+                }
+                # Only the fields above are cached: the info dict carries signed
+                # media URLs, request headers and cookies
+                self.metadata.put('analysis', self.media_identity(url), analysis)
+                # Handed to download_with_yt_dlp so the post isn't extracted twice
+                return dict(analysis, info=info)
             else:
                 # Check if it's an authentication error
-                error_msg = stderr.decode().lower()
+                error_msg = result['error'].lower()
+                self.note_failure(url, self.classify_result(result))
                 if 'login' in error_msg or 'auth' in error_msg:
                     return {'type': 'auth_required', 'reason': 'authentication_needed'}
                 else:
                     return {'type': 'unknown', 'reason': 'analysis_failed'}
-                    
+
         except Exception as e:
             logging.error(f"Error analyzing Instagram content: {e}")
             return {'type': 'unknown', 'reason': str(e)}
 
-    async def merge_video_audio_ffmpeg(self, video_file: Path, audio_file: Path, output_file: Path) -> bool:
+    async def download_size_limit(self) -> int:
+        """Largest file yt-dlp may download: above the upload limit only if it can be shrunk"""
+        if OVERSIZE_MODE != 'off' and await self.ffmpeg.can_fit(OVERSIZE_MODE):
+            return max(MAX_DOWNLOAD_BYTES, OVERSIZE_MAX_BYTES)
+        return MAX_DOWNLOAD_BYTES
+
+    async def fit_for_upload(self, media_info: dict, status_msg=None) -> dict:
+        """Re-encode or split files over the upload limit so they can be sent.
+
+        Files that can't be made to fit are kept and reported by the sender.
+        """
+        if OVERSIZE_MODE == 'off':
+            return media_info
+
+        async def fit(file_path: Path) -> list:
+            if file_path.suffix.lower() not in VIDEO_EXTENSIONS | AUDIO_EXTENSIONS:
+                return [file_path]
+            try:
+                size = (await asyncio.to_thread(file_path.stat)).st_size
+            except OSError:
+                return [file_path]
+            if size <= MAX_UPLOAD_BYTES:
+                return [file_path]
+            if status_msg:
+                try:
+                    await status_msg.edit_text(f"🗜️ {size / (1024 * 1024):.0f}MB is over the "
+                                               f"{MAX_UPLOAD_BYTES // (1024 * 1024)}MB upload limit, making it fit...")
+                except Exception as e:
+                    logging.warning(f"Could not update status message: {e}")
+            fitted = await self.ffmpeg.fit(file_path, MAX_UPLOAD_BYTES, OVERSIZE_MODE, OVERSIZE_MIN_VIDEO_KBPS,
+                                           platform=media_info.get('platform', 'unknown'))
+            if fitted:
+                logging.info(f"Fitted {file_path.name} ({size / (1024 * 1024):.1f}MB) into {len(fitted)} file(s)")
+            return fitted or [file_path]
+
+        results = await asyncio.gather(*(fit(file_path) for file_path in media_info['files']))
+        files = []
+        file_metadata = dict(media_info.get('file_metadata', {}))
+        for original, fitted in zip(media_info['files'], results):
+            for file_path in fitted:
+                files.append(file_path)
+                # Re-encodes and parts keep the caption of the file they came from
+                file_metadata.setdefault(file_path, file_metadata.get(original, media_info['metadata']))
+        return {**media_info, 'files': files, 'file_metadata': file_metadata}
+
+    async def merge_video_audio_ffmpeg(self, video_file: Path, audio_file: Path, output_file: Path,
+                                       platform: str = 'unknown') -> bool:
         """Merge video and audio files using ffmpeg"""
-        ffmpeg_path = self.find_ffmpeg()
-        if not ffmpeg_path:
+        if not await self.ffmpeg.ffmpeg_path():
             logging.warning("ffmpeg not found, cannot merge video/audio")
             return False
-            
+
         try:
-            cmd = [
-                ffmpeg_path,
-                '-i', str(video_file),
-                '-i', str(audio_file),
-                '-c:v', 'copy',  # Copy video without re-encoding
-                '-c:a', 'aac',   # Re-encode audio to AAC
-                '-map', '0:v:0', # Map first video stream
-                '-map', '1:a:0', # Map first audio stream
-                '-movflags', '+faststart',  # Optimize for streaming
-                '-y',  # Overwrite output file
-                str(output_file)
-            ]
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=30.0)
-            
-            if process.returncode == 0 and output_file.exists():
-                logging.info(f"Successfully merged video/audio with ffmpeg: {output_file}")
-                return True
-            else:
-                logging.error(f"ffmpeg merge failed: {stderr.decode()}")
-                return False
-                
+            return await self.ffmpeg.merge(video_file, audio_file, output_file, platform)
         except Exception as e:
             logging.error(f"Error in ffmpeg merge: {e}")
             return False
 
     async def get_youtube_formats(self, url: str) -> Optional[list]:
-        """Get available formats for YouTube video"""
-        try:
-            cmd = [
-                'yt-dlp',
-                '--list-formats',
-                '--no-warnings',
-                url
-            ]
-
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+        """Get available formats for YouTube video with estimated download sizes.
 
-            try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=15.0)
-            except asyncio.TimeoutError:
-                process.kill()
-                await process.wait()
+        Each entry has the format id to download (video-only picks are paired
+        with the best M4A audio when ffmpeg can merge them), the estimated size
+        in bytes (or None), whether the size is an estimate, and whether it
+        fits the download limit. The best fitting entry is marked recommended.
+        """
+        # The same limit the download gets, so a format shown as fitting isn't refused
+        limit = await self.download_size_limit()
+        cached = self.cached_metadata('formats', url)
+        if cached:
+            return self.mark_fitting(cached, limit)
+
+        try:
+            labels = {'stage': 'format_listing', 'platform': 'youtube', 'downloader': 'yt-dlp'}
+            with metrics.STAGE_SECONDS.time(**labels):
+                result = await self.extractors.extract(url, timeout=15.0)
+            if result is None:
                 logging.warning(f"YouTube format detection timeout for URL: {url}")
+                metrics.TIMEOUTS.inc(**labels)
+                self.note_failure(url, 'timeout')
                 return None
 
-            if process.returncode != 0:
-                error_msg = stderr.decode().strip()
-                logging.warning(f"YouTube format detection failed for URL: {url}, Error: {error_msg}")
+            if not result['ok']:
+                logging.warning(f"YouTube format detection failed for URL: {url}, Error: {result['error']}")
+                self.note_failure(url, self.classify_result(result))
                 return None
 
-            # Parse format list and extract formats with audio or pre-combined
-            quality_set = set()
-            format_mapping = {}
-            lines = stdout.decode().split('\n')
+            info = result['info']
+            duration = info.get('duration')
+            can_merge = await self.find_ffmpeg() is not None
+            quality_heights = [(2160, '2160p'), (1440, '1440p'), (1080, '1080p'), (720, '720p'),
+                               (480, '480p'), (360, '360p'), (240, '240p')]
+
+            # Best M4A audio track, used for Audio Only and to pair with video-only formats
+            audio = None
+            for fmt in info.get('formats') or []:
+                if fmt.get('vcodec') in (None, 'none') and fmt.get('acodec') not in (None, 'none') \
+                        and fmt.get('ext') == 'm4a':
+                    if audio is None or (fmt.get('abr') or fmt.get('tbr') or 0) > (audio.get('abr') or audio.get('tbr') or 0):
+                        audio = fmt
+            audio_size = self.estimate_format_size(audio, duration) if audio else (None, True)
+
+            # Per quality, the smallest combo that delivers video with sound
+            candidates = {}
+            for fmt in info.get('formats') or []:
+                # Look for video formats (include both combined and video-only)
+                if fmt.get('ext') not in ('mp4', 'webm') or fmt.get('vcodec') in (None, 'none'):
+                    continue
 
-            for line in lines:
-                if line.startswith('format code') or line.startswith('----') or not line.strip():
+                format_id = str(fmt.get('format_id', ''))
+                height = fmt.get('height') or 0
+                quality = next((label for min_height, label in quality_heights if height >= min_height), None)
+                if not quality:
                     continue
 
-                # Look for video formats (include both combined and video-only)
-                if ('mp4' in line or 'webm' in line) and 'audio only' not in line:
-                    parts = line.split()
-                    if len(parts) >= 3:
-                        format_id = parts[0]
-
-                        # Extract quality from the line
-                        quality = None
-                        if '2160' in line or '4K' in line:
-                            quality = '2160p'
-                        elif '1440' in line:
-                            quality = '1440p'
-                        elif '1080' in line:
-                            quality = '1080p'
-                        elif '720' in line:
-                            quality = '720p'
-                        elif '480' in line:
-                            quality = '480p'
-                        elif '360' in line:
-                            quality = '360p'
-                        elif '240' in line:
-                            quality = '240p'
-                        elif '144' in line:
-                            quality = '144p'
-                        else:
-                            continue
-
-                        # Include all video qualities (will combine with audio automatically)
-                        if quality and quality not in ['144p'] and format_id not in ['140', '251', '249', '250', '17', '36']:
-                            quality_set.add(quality)
-                            # Prioritize formats that already have audio, but include video-only too
-                            if quality not in format_mapping or 'video only' not in line:
-                                format_mapping[quality] = format_id
-
-            # Always add audio-only option
-            quality_set.add('Audio Only')
-            format_mapping['Audio Only'] = '140'  # M4A audio format
-
-            # Convert to list and sort by quality (put Audio Only last)
-            quality_order = {'2160p': 7, '1440p': 6, '1080p': 5, '720p': 4, '480p': 3, '360p': 2, '240p': 1, 'Audio Only': 0}
-            available_qualities = sorted(list(quality_set),
-                                       key=lambda x: quality_order.get(x, 0),
-                                       reverse=True)
-
-            # Create formats list
-            formats = []
-            for quality in available_qualities:
-                formats.append({
-                    'id': format_mapping[quality],
-                    'resolution': quality,
-                    'note': quality,
-                    'quality': quality
-                })
-
-            return formats[:6]  # Return top 6 formats
+                size, estimated = self.estimate_format_size(fmt, duration)
+                has_audio = fmt.get('acodec') not in (None, 'none')
+                if not has_audio and can_merge and audio:
+                    format_id = f"{format_id}+{audio['format_id']}"
+                    size = size + audio_size[0] if size is not None and audio_size[0] is not None else None
+                    estimated = estimated or audio_size[1]
+                    has_audio = True
+
+                candidate = {'id': format_id, 'quality': quality, 'size': size,
+                             'estimated': estimated, 'has_audio': has_audio}
+                current = candidates.get(quality)
+                # Prefer formats with sound, then ones with a known, smaller size
+                rank = (has_audio, size is not None, -(size or 0))
+                if current is None or rank > (current['has_audio'], current['size'] is not None, -(current['size'] or 0)):
+                    candidates[quality] = candidate
+
+            quality_order = [label for _, label in quality_heights]
+            videos = [candidates[q] for q in quality_order if q in candidates]
+
+            # Keep at most 5 video buttons, dropping the biggest oversized ones first
+            while len(videos) > 5:
+                oversized = [fmt for fmt in videos if fmt['size'] is not None and fmt['size'] > limit]
+                videos.remove(oversized[0] if oversized else videos[-1])
+
+            formats = videos + [{
+                'id': '140',  # M4A audio format
+                'quality': 'Audio Only',
+                'size': audio_size[0],
+                'estimated': audio_size[1],
+                'has_audio': True,
+            }]
+            for fmt in formats:
+                fmt['resolution'] = fmt['note'] = fmt['quality']
+
+            self.metadata.put('formats', self.media_identity(url), formats)
+            return self.mark_fitting(formats, limit)
 
         except Exception as e:
             logging.error(f"Error getting YouTube formats: {e}")
             return None
 
-    async def download_with_gallery_dl(self, url: str, temp_dir: str) -> Optional[dict]:
+    @staticmethod
+    def mark_fitting(formats: list, limit: int) -> list:
+        """Flagged copies of formats against the download limit, with the recommended one picked"""
+        # The list may be the metadata cache's own entry, so annotate copies
+        formats = [dict(fmt) for fmt in formats]
+        for fmt in formats:
+            fmt['fits'] = fmt['size'] is None or fmt['size'] <= limit
+            fmt['recommended'] = False
+
+        # Pre-select the highest quality with sound that is known to fit
+        for fmt in formats:
+            if fmt['has_audio'] and fmt['fits'] and fmt['size'] is not None:
+                fmt['recommended'] = True
+                break
+        return formats
+
+    @staticmethod
+    def estimate_format_size(fmt: dict, duration: Optional[float]) -> tuple:
+        """(bytes or None, is_estimate) for a yt-dlp format entry"""
+        if fmt.get('filesize'):
+            return int(fmt['filesize']), False
+        if fmt.get('filesize_approx'):
+            return int(fmt['filesize_approx']), True
+        if fmt.get('tbr') and duration:
+            return int(fmt['tbr'] * 125 * duration), True  # kbit/s -> bytes
+        return None, True
+
+    @staticmethod
+    def format_size(size: Optional[int], estimated: bool = True) -> str:
+        if size is None:
+            return "size unknown"
+        prefix = '~' if estimated else ''
+        if size >= 1024 * 1024 * 1024:
+            return f"{prefix}{size / (1024 * 1024 * 1024):.1f} GB"
+        return f"{prefix}{max(1, round(size / (1024 * 1024)))} MB"
+
+    async def format_picker(self, formats: list, url: str, title: str = "Available formats") -> tuple:
+        """Message text and inline keyboard for the quality menu"""
+        keyboard = []
+        lines = []
+        recommended = next((fmt for fmt in formats if fmt['recommended']), None)
+        if recommended:
+            size = self.format_size(recommended['size'], recommended['estimated'])
+            keyboard.append([InlineKeyboardButton(
+                f"⭐ {recommended['quality']} · {size} (recommended)",
+                callback_data=f"quality:{self.picks.add(url, recommended['id'])}"
+            )])
+
+        for fmt in formats:
+            size = self.format_size(fmt['size'], fmt['estimated'])
+            if fmt['quality'] == 'Audio Only':
+                label = f"🎵 {fmt['quality']} (M4A)"
+            elif fmt['has_audio']:
+                label = f"📺 {fmt['quality']}"
+            else:
+                label = f"📺 {fmt['quality']} (Video Only)"
+            flag = '' if fmt['fits'] else '⚠️ '
+            lines.append(f"• {fmt['quality']}: {size}{'' if fmt['fits'] else ' (too large)'}")
+            if fmt is not recommended:
+                keyboard.append([InlineKeyboardButton(f"{flag}{label} · {size}", callback_data=f"quality:{self.picks.add(url, fmt['id'])}")])
+
+        if not recommended:
+            # Nothing is known to fit, let yt-dlp pick within the limit
+            keyboard.append([InlineKeyboardButton("⭐ Best Available", callback_data=f"quality:{self.picks.add(url, 'best')}")])
+
+        limit = self.format_size(await self.download_size_limit(), estimated=False)
+        text = f"""```
+{title} (limit {limit}):
+{chr(10).join(lines)}
+```"""
+        return text, InlineKeyboardMarkup(keyboard)
+
+    async def hedged_download(self, platform: str, attempts: list, temp_dir: str,
+                              processing_msg=None, info: Optional[dict] = None,
+                              deadline: Optional[Deadline] = None) -> Optional[dict]:
+        """Race downloaders in preference order instead of trying them one by one.
+
+        `attempts` is a list of (tool, url) pairs. The first starts right away.
+        The next one starts as soon as everything running has failed, or in
+        parallel once the latest attempt has run past its hedge delay without
+        moving any bytes and the platform has idle slots to pay for it.
+        Progress is shown on `processing_msg`. The first success wins and the
+        remaining attempts are cancelled. `info` is reused by yt-dlp attempts
+        on the first attempt's URL. Every attempt only gets what is left of
+        `deadline`, and none are started once it has passed.
+        """
+        queue = list(attempts)
+        running = {}
+        cost = self.hedge_costs.get(platform, DEFAULT_HEDGE_COST)
+        claimed = 0
+        hedge_at = None
+        reporter = ProgressMessage(processing_msg)
+        progressed = set()
+
+        def launch(tool: str, url: str):
+            nonlocal hedge_at
+
+            def on_progress(state: dict):
+                if state['downloaded'] or state['phase'] == 'processing':
+                    progressed.add((tool, url))
+                reporter.update(state, f" with {tool}" if len(running) > 1 else '')
+
+            # Each attempt gets its own directory so a cancelled loser can't
+            # leave files behind that end up in the winner's upload
+            attempt_dir = tempfile.mkdtemp(prefix=f"{tool}_", dir=temp_dir)
+            if tool == 'gallery-dl':
+                coro = self.download_with_gallery_dl(url, attempt_dir, on_progress=on_progress, deadline=deadline)
+            else:
+                coro = self.download_with_yt_dlp(url, attempt_dir, info=info if url == attempts[0][1] else None,
+                                                 on_progress=on_progress, deadline=deadline)
+            started = time.monotonic()
+            running[asyncio.create_task(coro)] = (tool, url, started)
+            hedge_at = started + self.latency.hedge_delay(platform, tool)
+
+        async def status(text: str):
+            if processing_msg:
+                try:
+                    await processing_msg.edit_text(text)
+                except Exception as e:
+                    logging.warning(f"Could not update status message: {e}")
+
+        try:
+            launch(*queue.pop(0))
+            while running:
+                timeout = max(0.0, hedge_at - time.monotonic()) if queue else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    tool, url, started = running.pop(task)
+                    elapsed = time.monotonic() - started
+                    media_info = None if task.exception() else task.result()
+                    if media_info:
+                        self.latency.record(platform, tool, elapsed)
+                        if running:
+                            logging.info(f"{tool} won the hedged race for {url} after {elapsed:.1f}s, "
+                                         f"cancelling {len(running)} other attempt(s)")
+                        return media_info
+                    logging.info(f"{tool} failed for {url} after {elapsed:.1f}s")
+
+                if not queue:
+                    continue
+                if deadline and deadline.expired:
+                    # Nothing more will be started: wait on the running attempts alone
+                    for tool, _ in queue:
+                        deadline.skip(tool)
+                    queue.clear()
+                    continue
+                if not running:
+                    # Everything failed: fall back right away on the job's own slot
+                    metrics.FALLBACKS.inc(platform=platform, kind='next_downloader')
+                    tool, next_url = queue[0]
+                    await status(f"🔄 Trying {tool}{' with cleaned URL' if next_url != attempts[0][1] else ''}...")
+                    launch(*queue.pop(0))
+                elif not done:
+                    moving = [(tool, url) for tool, url, _ in running.values() if (tool, url) in progressed]
+                    if moving:
+                        # A downloader that is moving bytes isn't slow, just big
+                        hedge_at = time.monotonic() + self.latency.hedge_delay(platform, moving[-1][0])
+                    elif await self.scheduler.try_claim(platform, cost):
+                        claimed += cost
+                        tool, next_url = queue[0]
+                        logging.info(f"Hedging {platform} download with {tool} for {next_url}")
+                        await status(f"⏳ Still working, also trying {tool}...")
+                        launch(*queue.pop(0))
+                    else:
+                        # No idle capacity: check again a little later
+                        hedge_at = time.monotonic() + HEDGE_MIN_DELAY
+            return None
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            await reporter.close()
+            await self.scheduler.release_claim(platform, claimed)
+
+    async def download_with_gallery_dl(self, url: str, temp_dir: str, on_progress=None,
+                                       deadline: Optional[Deadline] = None) -> Optional[dict]:
         """Download media using gallery-dl"""
         try:
-            cmd = [
-                'gallery-dl',
-                '--write-info-json',
-                '--directory', temp_dir,
-                url
-            ]
-            
-            # Add Instagram cookies if available
-            if ('instagram.com' in url) and INSTAGRAM_COOKIES_FILE and Path(INSTAGRAM_COOKIES_FILE).exists():
-                cmd.extend(['--cookies', INSTAGRAM_COOKIES_FILE])
-                logging.info("Using Instagram cookies for authentication")
-            
-            # Add Reddit API credentials if available
-            elif ('reddit.com' in url or 'redd.it' in url) and REDDIT_CLIENT_ID and REDDIT_CLIENT_SECRET:
-                # Create temporary config for Reddit API
-                config_content = f"""{{
-    "extractor": {{
-        "reddit": {{
-            "client-id": "{REDDIT_CLIENT_ID}",
-            "client-secret": "{REDDIT_CLIENT_SECRET}",
-            "user-agent": "{REDDIT_USER_AGENT}"
-        }}
-    }}
-}}"""
-                config_file = Path(temp_dir) / "gallery-dl-config.json"
-                with open(config_file, 'w') as f:
-                    f.write(config_content)
-                
-                cmd.extend(['--config', str(config_file)])
-                logging.info("Using Reddit API credentials for better access")
+            # Time allowed until the first progress report (Reddit needs more time);
+            # after that only a stall ends the download
+            timeout = 45.0 if ('reddit.com' in url or 'redd.it' in url) else 20.0
 
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            result = await self.run_budgeted(
+                deadline, 'gallery-dl', timeout,
+                lambda timeout, max_duration: self.extractors.gallery_dl(
+                    url, temp_dir, timeout=timeout, on_progress=on_progress, max_duration=max_duration
+                )
             )
-
-            # Set timeout based on platform (Reddit needs more time)
-            timeout = 45.0 if ('reddit.com' in url or 'redd.it' in url) else 20.0
-            try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
-            except asyncio.TimeoutError:
-                process.kill()
-                await process.wait()
-                logging.error(f"gallery-dl timeout after {timeout}s for URL: {url}")
+            if result is None:
+                logging.error(f"gallery-dl timed out or stalled for URL: {url}")
+                self.note_failure(url, 'timeout')
                 return None
 
-            if process.returncode == 0:
-                return await self.process_downloaded_files(temp_dir, 'gallery-dl')
+            if result['ok']:
+                return await self.build_media_info(result['files'], 'gallery-dl', platform=self.platform_for_url(url))
             else:
-                error_msg = stderr.decode()
+                error_msg = result['error']
+                self.note_failure(url, self.classify_result(result))
                 if "rate limit" in error_msg.lower():
                     logging.warning("Reddit rate limit hit - consider adding Reddit API credentials")
                 elif "login page" in error_msg.lower():
@@ -716,11 +1691,12 @@ Available formats (cleaned URL):
 
         return None
 
-    async def download_with_yt_dlp(self, url: str, temp_dir: str) -> Optional[dict]:
-        """Download media using yt-dlp"""
+    async def download_with_yt_dlp(self, url: str, temp_dir: str, info: Optional[dict] = None,
+                                   on_progress=None, deadline: Optional[Deadline] = None) -> Optional[dict]:
+        """Download media using yt-dlp, reusing an already extracted info dict if given"""
         try:
             # Detect if ffmpeg is available for better merging
-            ffmpeg_available = self.find_ffmpeg() is not None
+            ffmpeg_available = await self.find_ffmpeg() is not None
             
             # Special handling for platforms that often have separate video/audio
             if 'reddit.com' in url or 'redd.it' in url or 'facebook.com' in url:
@@ -733,204 +1709,362 @@ Available formats (cleaned URL):
             else:
                 format_selector = 'best[height<=720][acodec!=none]/best[acodec!=none]/best'
             
-            cmd = [
-                'yt-dlp',
-                '--write-info-json',
-                '--format', format_selector,
-                '--max-filesize', '45M',  # Telegram limit
-                '--output', f'{temp_dir}/%(title)s.%(ext)s',
-                url
-            ]
+            options = {
+                'format': format_selector,
+                'max_filesize': await self.download_size_limit(),
+            }
             
             # Only add merge format if ffmpeg is not available (let our custom merge handle it)
             if not ffmpeg_available:
-                cmd.extend(['--merge-output-format', 'mp4'])
+                options['merge_output_format'] = 'mp4'
 
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-
-            # Set timeout based on platform and ffmpeg availability
+            # Time allowed until the first progress report; after that only a
+            # stall ends the download
             if 'reddit.com' in url or 'redd.it' in url or 'facebook.com' in url:
                 timeout = 60.0  # Reddit/Facebook videos need more time
             else:
                 timeout = 30.0
-                
-            try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
-            except asyncio.TimeoutError:
-                process.kill()
-                await process.wait()
-                logging.error(f"yt-dlp timeout after {timeout}s for URL: {url}")
+
+            result = await self.run_budgeted(
+                deadline, 'yt-dlp', timeout,
+                lambda timeout, max_duration: self.extractors.download(
+                    url, temp_dir, options, timeout=timeout, info=info,
+                    on_progress=on_progress, max_duration=max_duration
+                )
+            )
+            if result is None:
+                logging.error(f"yt-dlp timed out or stalled for URL: {url}")
+                self.note_failure(url, 'timeout')
                 return None
 
-            if process.returncode == 0:
-                return await self.process_downloaded_files(temp_dir, 'yt-dlp')
+            if result['ok']:
+                return await self.build_media_info(result['files'], 'yt-dlp', result['info'],
+                                                   platform=self.platform_for_url(url))
             else:
-                logging.error(f"yt-dlp failed: {stderr.decode()}")
+                logging.error(f"yt-dlp failed: {result['error']}")
+                self.note_failure(url, self.classify_result(result))
 
         except Exception as e:
             logging.error(f"yt-dlp error: {e}")
 
         return None
 
-    async def process_downloaded_files(self, temp_dir: str, source: str) -> Optional[dict]:
-        """Process downloaded files and extract info"""
-        temp_path = Path(temp_dir)
-        media_files = []
-        info_files = []
-        video_files = []
-        audio_files = []
-
-        # Find downloaded files
-        for file_path in temp_path.rglob('*'):
-            if file_path.is_file():
-                ext = file_path.suffix.lower()
-                if ext in ['.mp4', '.webm', '.mov', '.avi', '.mkv']:
-                    # Check if it's video-only by looking for audio counterpart
-                    audio_counterpart = file_path.with_suffix('.m4a')
-                    if audio_counterpart.exists():
-                        video_files.append(file_path)
-                    else:
-                        media_files.append(file_path)
-                elif ext in ['.m4a', '.mp3', '.aac', '.opus']:
-                    # Check if it's audio-only by looking for video counterpart
-                    video_counterpart = file_path.with_name(file_path.stem.replace('.m4a', '')).with_suffix('.mp4')
-                    if video_counterpart.exists():
-                        audio_files.append(file_path)
+    async def build_media_info(self, manifest: list, source: str, metadata: Optional[dict] = None,
+                               platform: str = 'unknown') -> Optional[dict]:
+        """Build media_info from a downloader manifest, merging unmerged video/audio pairs.
+
+        Each manifest item is {'path', 'metadata'} plus 'audio' for a video
+        whose audio came as a separate file. Nothing is scanned or guessed
+        from file names, and every file keeps its own metadata; `metadata`
+        is only used for items that came without any.
+        """
+        downloader = self.downloader_for(source)
+        items = []
+        for entry in manifest:
+            items.append({
+                'path': Path(entry['path']),
+                'audio': Path(entry['audio']) if entry.get('audio') else None,
+                'metadata': entry.get('metadata') or metadata or {},
+            })
+
+        pairs = [item for item in items if item['audio']]
+        if pairs:
+            if await self.find_ffmpeg():
+                logging.info(f"Found {len(pairs)} separate video/audio pair(s), merging with ffmpeg...")
+                # Pairs of a multi-item post merge in parallel on the ffmpeg pool
+                merged_files = [item['path'].with_name(f"{item['path'].stem}_merged.mp4") for item in pairs]
+                with metrics.STAGE_SECONDS.time(stage='merge', platform=platform, downloader=downloader):
+                    results = await asyncio.gather(*(
+                        self.merge_video_audio_ffmpeg(item['path'], item['audio'], merged_file, platform)
+                        for item, merged_file in zip(pairs, merged_files)
+                    ))
+                for item, merged_file, merged in zip(pairs, merged_files, results):
+                    if merged:
+                        item['path'], item['audio'] = merged_file, None
+                        logging.info(f"Successfully merged: {merged_file}")
                     else:
-                        media_files.append(file_path)
-                elif ext in ['.jpg', '.jpeg', '.png', '.gif']:
-                    media_files.append(file_path)
-                elif ext == '.json':
-                    info_files.append(file_path)
-
-        # Try to merge video+audio files with ffmpeg if available
-        if video_files and audio_files and len(video_files) == len(audio_files):
-            ffmpeg_path = self.find_ffmpeg()
-            if ffmpeg_path:
-                logging.info("Found separate video/audio files, attempting ffmpeg merge...")
-                for i, video_file in enumerate(video_files):
-                    if i < len(audio_files):
-                        audio_file = audio_files[i]
-                        merged_file = video_file.with_name(f"{video_file.stem}_merged.mp4")
-                        
-                        if await self.merge_video_audio_ffmpeg(video_file, audio_file, merged_file):
-                            media_files.append(merged_file)
-                            logging.info(f"Successfully merged: {merged_file}")
-                        else:
-                            # Fallback: keep original files
-                            media_files.extend([video_file, audio_file])
-                            logging.warning("ffmpeg merge failed, keeping separate files")
+                        logging.warning("ffmpeg merge failed, keeping separate files")
             else:
-                # No ffmpeg available, keep separate files
-                media_files.extend(video_files)
-                media_files.extend(audio_files)
                 logging.warning("ffmpeg not available, keeping separate video/audio files")
-        else:
-            # Add any remaining video/audio files
-            media_files.extend(video_files)
-            media_files.extend(audio_files)
 
-        if not media_files:
+        files = []
+        file_metadata = {}
+        for item in items:
+            for file_path in (item['path'], item['audio']):
+                if file_path is not None and file_path not in file_metadata:
+                    files.append(file_path)
+                    file_metadata[file_path] = item['metadata']
+
+        if not files:
             return None
 
-        # Read metadata from info files
-        metadata = {}
-        if info_files:
-            try:
-                async with aiofiles.open(info_files[0], 'r', encoding='utf-8') as f:
-                    content = await f.read()
-                    metadata = json.loads(content)
-            except Exception as e:
-                print(f"Error reading metadata: {e}")
+        def total_size() -> int:
+            return sum(file_path.stat().st_size for file_path in files if file_path.exists())
 
+        metrics.BYTES_DOWNLOADED.inc(await asyncio.to_thread(total_size), platform=platform, downloader=downloader)
         return {
-            'files': media_files,
-            'metadata': metadata,
-            'source': source
+            'files': files,
+            'metadata': file_metadata[files[0]],
+            # Per-file metadata, so each file gets its own caption
+            'file_metadata': file_metadata,
+            'source': source,
+            'platform': platform
         }
 
-    async def send_media_to_user(self, update: Update, media_info: dict):
-        """Send downloaded media to user with formatted description"""
-        files = media_info['files']
-        metadata = media_info['metadata']
-
-        # Format description with Geist Mono font
-        import sys
-        print(f"MAIN DEBUG - About to format description", file=sys.stderr)
-        print(f"MAIN DEBUG - Metadata keys: {list(metadata.keys()) if metadata else 'None'}", file=sys.stderr)
-        if metadata:
-            print(f"MAIN DEBUG - Title: '{metadata.get('title', '')}'", file=sys.stderr)
-            print(f"MAIN DEBUG - Uploader: '{metadata.get('uploader', '')}'", file=sys.stderr)
-            print(f"MAIN DEBUG - Description: '{metadata.get('description', '')}'", file=sys.stderr)
-        description = self.format_description(metadata)
-        print(f"MAIN DEBUG - Final description: '{description}'", file=sys.stderr)
-
-        for file_path in files:
+    @staticmethod
+    def downloader_for(source: str) -> str:
+        """Metrics label for a media_info source ('yt-dlp-fallback' counts as yt-dlp)"""
+        return 'gallery-dl' if source == 'gallery-dl' else 'yt-dlp'
+
+    def caption_for(self, media_info: dict, file_path: Path) -> str:
+        """Caption for one file, from its own metadata"""
+        metadata = media_info.get('file_metadata', {}).get(file_path, media_info['metadata'])
+        return self.format_description(metadata)
+
+    async def send_media_to_user(self, update: Update, media_info: dict) -> list:
+        """Send downloaded media to user with formatted description.
+
+        Returns the file_ids Telegram assigned, for the file_id cache.
+        """
+        return await self.deliver_files(update.message, media_info)
+
+    async def deliver_files(self, message, media_info: dict) -> list:
+        """Send downloaded files as replies to `message`.
+
+        Photos and videos of a multi-item post go out as albums with the
+        caption on the first item only, up to ALBUM_UPLOAD_CONCURRENCY albums
+        uploading at once; everything else is sent file by file. Returns the
+        file_ids Telegram assigned, in file order, for the file_id cache.
+        """
+        started = time.monotonic()
+        sendable = {}
+        for file_path in media_info['files']:
             try:
                 # Check if file exists
                 if not file_path.exists():
-                    await update.message.reply_text(f"❌ File not found: {file_path.name}")
+                    await message.reply_text(f"❌ File not found: {file_path.name}")
                     continue
 
-                file_size = file_path.stat().st_size
+                file_size = (await asyncio.to_thread(file_path.stat)).st_size
 
-                # Check file size (Telegram limit is 50MB)
-                if file_size > 50 * 1024 * 1024:  # 50MB
-                    await update.message.reply_text(f"❌ File too large to send: {file_path.name} ({file_size / (1024*1024):.1f}MB)")
+                # Check file size against the active Bot API upload limit
+                if file_size > MAX_UPLOAD_BYTES:
+                    await message.reply_text(f"❌ File too large to send: {file_path.name} ({file_size / (1024*1024):.1f}MB)")
                     continue
 
-                # Read file content first
-                file_content = None
-                try:
-                    with open(file_path, 'rb') as f:
-                        file_content = f.read()
-                except Exception as read_error:
-                    await update.message.reply_text(f"❌ Error reading file: {str(read_error)}")
+                if not file_size:
+                    await message.reply_text(f"❌ Empty file: {file_path.name}")
                     continue
+                sendable[file_path] = file_size
+            except Exception as e:
+                await message.reply_text(f"❌ Error sending file: {str(e)}")
+                logging.error(f"Error checking file {file_path}: {e}")
+
+        album = [file_path for file_path in sendable
+                 if file_path.suffix.lower() in PHOTO_EXTENSIONS + VIDEO_UPLOAD_EXTENSIONS]
+        if len(album) < 2:
+            album = []
+
+        # Within an album a caption is only repeated when it changes (e.g. a
+        # playlist of several posts), so a carousel is captioned once
+        captions = {}
+        previous = None
+        for file_path in album:
+            caption = self.caption_for(media_info, file_path)
+            captions[file_path] = caption if caption != previous else None
+            previous = caption
+
+        delivered = {}
+        slots = asyncio.Semaphore(ALBUM_UPLOAD_CONCURRENCY)
+
+        async def send_chunk(chunk: list):
+            async with slots:
+                delivered.update(await self.send_album(message, chunk, captions))
+
+        await asyncio.gather(*(send_chunk(album[i:i + MEDIA_GROUP_LIMIT])
+                               for i in range(0, len(album), MEDIA_GROUP_LIMIT)))
+
+        for file_path in sendable:
+            if file_path not in delivered:
+                delivered[file_path] = await self.send_file(message, file_path, self.caption_for(media_info, file_path))
+
+        labels = {'platform': media_info.get('platform', 'unknown'),
+                  'downloader': self.downloader_for(media_info.get('source', ''))}
+        metrics.STAGE_SECONDS.observe(time.monotonic() - started, stage='upload', **labels)
+        metrics.BYTES_UPLOADED.inc(sum(size for file_path, size in sendable.items() if delivered.get(file_path)),
+                                   **labels)
 
-                if not file_content:
-                    await update.message.reply_text(f"❌ Empty file: {file_path.name}")
-                    continue
+        # No separate copyable text message - everything is in caption now
+        return [item for file_path in sendable for item in delivered.get(file_path, [])]
+
+    async def send_album(self, message, chunk: list, captions: dict) -> dict:
+        """Send up to MEDIA_GROUP_LIMIT photos/videos as one media group.
 
-                # Determine file type and send accordingly
-                file_ext = file_path.suffix.lower()
+        Returns {path: delivered items}; if the group is rejected the files
+        are sent one by one instead.
+        """
+        try:
+            with contextlib.ExitStack() as handles:
+                media = []
+                for file_path in chunk:
+                    handle, file_content = await self.open_upload(file_path, attach=True)
+                    handles.enter_context(handle)
+                    media_class = InputMediaVideo if file_path.suffix.lower() in VIDEO_UPLOAD_EXTENSIONS else InputMediaPhoto
+                    media.append(media_class(media=file_content, caption=captions.get(file_path),
+                                             parse_mode=ParseMode.MARKDOWN))
+                sent = await message.reply_media_group(media=media)
+            logging.info(f"Sent album of {len(chunk)} file(s) in one request")
+            return {file_path: [dict(item, caption=captions.get(file_path)) for item in self.sent_file_ids(reply)]
+                    for file_path, reply in zip(chunk, sent)}
+        except Exception as e:
+            logging.warning(f"Album of {len(chunk)} file(s) failed ({e}), sending them one by one")
+            return {file_path: await self.send_file(message, file_path, captions.get(file_path)) for file_path in chunk}
 
-                if file_ext in ['.jpg', '.jpeg', '.png', '.gif']:
-                    await update.message.reply_photo(
+    async def send_file(self, message, file_path: Path, caption: Optional[str]) -> list:
+        """Send one file with the method matching its type"""
+        try:
+            # Open the file for a streamed upload
+            try:
+                handle, file_content = await self.open_upload(file_path)
+            except Exception as read_error:
+                await message.reply_text(f"❌ Error reading file: {str(read_error)}")
+                return []
+
+            # Determine file type and send accordingly
+            file_ext = file_path.suffix.lower()
+
+            with handle:
+                if file_ext in PHOTO_EXTENSIONS + ('.gif',):
+                    sent = await message.reply_photo(
                         photo=file_content,
-                        caption=description,
+                        caption=caption,
                         parse_mode=ParseMode.MARKDOWN
                     )
-                elif file_ext in ['.mp4', '.webm', '.mov', '.avi']:
-                    await update.message.reply_video(
+                elif file_ext in VIDEO_UPLOAD_EXTENSIONS:
+                    sent = await message.reply_video(
                         video=file_content,
-                        caption=description,
+                        caption=caption,
                         parse_mode=ParseMode.MARKDOWN
                     )
                 elif file_ext in ['.mp3', '.m4a', '.wav', '.ogg']:
-                    await update.message.reply_audio(
+                    sent = await message.reply_audio(
                         audio=file_content,
-                        caption=description,
+                        caption=caption,
                         parse_mode=ParseMode.MARKDOWN
                     )
                 else:
                     # Send as document
-                    await update.message.reply_document(
+                    sent = await message.reply_document(
                         document=file_content,
                         filename=file_path.name,
-                        caption=description,
+                        caption=caption,
                         parse_mode=ParseMode.MARKDOWN
                     )
+                return [dict(item, caption=caption) for item in self.sent_file_ids(sent)]
 
-            except Exception as e:
-                await update.message.reply_text(f"❌ Error sending file: {str(e)}")
-                print(f"Error sending file {file_path}: {e}")
+        except Exception as e:
+            await message.reply_text(f"❌ Error sending file: {str(e)}")
+            logging.error(f"Error sending file {file_path}: {e}")
+            return []
+
+    @staticmethod
+    async def open_upload(file_path: Path, attach: bool = False):
+        """Open a file for a streamed upload without blocking the event loop.
+
+        Returns the open handle (caller closes it) and an InputFile that
+        hands the handle to the HTTP client, which reads it in chunks in a
+        worker thread (see uploads.ThreadedUploadRequest) instead of loading
+        the whole file into memory. With a local Bot API
+        server the absolute path is sent instead and the server reads the
+        file itself, so there is no multipart copy at all.
+        """
+        if LOCAL_BOT_API_URL:
+            return contextlib.nullcontext(), file_path.resolve()
+
+        def _open():
+            handle = open(file_path, 'rb')
+            if hasattr(os, 'posix_fadvise'):
+                # Let the kernel read ahead so upload chunks come from page cache
+                os.posix_fadvise(handle.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                os.posix_fadvise(handle.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            return handle
+
+        handle = await asyncio.to_thread(_open)
+        # Media groups reference their files by attach:// name
+        return handle, InputFile(handle, filename=file_path.name, attach=attach, read_file_handle=False)
+
+    def sent_file_ids(self, sent) -> list:
+        """Extract the reusable file_id from a sent message"""
+        if sent is None:
+            return []
+        if sent.video:
+            return [{'kind': 'video', 'file_id': sent.video.file_id}]
+        if sent.photo:
+            return [{'kind': 'photo', 'file_id': sent.photo[-1].file_id}]
+        if sent.audio:
+            return [{'kind': 'audio', 'file_id': sent.audio.file_id}]
+        if sent.animation:
+            return [{'kind': 'animation', 'file_id': sent.animation.file_id}]
+        if sent.document:
+            return [{'kind': 'document', 'file_id': sent.document.file_id}]
+        return []
+
+    async def reply_from_cache(self, message, key: str) -> bool:
+        """Resend a previously delivered media item by file_id"""
+        entry = self.file_ids.get(key)
+        if not entry:
+            return False
 
-        # No separate copyable text message - everything is in caption now
+        try:
+            await self.send_file_ids(message, entry)
+        except Exception as e:
+            # A stale file_id is useless; drop it and download normally
+            logging.warning(f"Cached file_id resend failed for {key}: {e}")
+            await asyncio.to_thread(self.file_ids.delete, key)
+            return False
+
+        logging.info(f"Served {key} from file_id cache ({self.file_ids.stats()['hit_rate']:.0%} hit rate)")
+        return True
+
+    async def follow_flight(self, message, flight: asyncio.Future, status_msg):
+        """Wait for another request's download of the same media and reuse its upload"""
+        result = await asyncio.shield(flight)
+        try:
+            if result and result['items']:
+                await self.send_file_ids(message, result)
+                await status_msg.delete()
+            else:
+                await status_msg.edit_text("❌ Download failed or timed out. This can happen with:\n• Very long videos\n• Private content\n• Unsupported formats\n\nTry a shorter video or different URL!")
+        except Exception as e:
+            logging.error(f"Error sharing coalesced download: {e}")
+
+    async def send_file_ids(self, message, entry: dict):
+        """Send media by the file_ids of an earlier upload, albums grouped as before"""
+        album = [item for item in entry['items'] if item['kind'] in ('photo', 'video')]
+        if len(album) < 2:
+            album = []
+        for i in range(0, len(album), MEDIA_GROUP_LIMIT):
+            media = [(InputMediaVideo if item['kind'] == 'video' else InputMediaPhoto)(
+                         media=item['file_id'], caption=item.get('caption', entry['caption']),
+                         parse_mode=ParseMode.MARKDOWN)
+                     for item in album[i:i + MEDIA_GROUP_LIMIT]]
+            await message.reply_media_group(media=media)
+
+        for item in entry['items']:
+            if album and item['kind'] in ('photo', 'video'):
+                continue
+            kind = item['kind']
+            caption = item.get('caption', entry['caption'])
+            if kind == 'video':
+                await message.reply_video(video=item['file_id'], caption=caption, parse_mode=ParseMode.MARKDOWN)
+            elif kind == 'photo':
+                await message.reply_photo(photo=item['file_id'], caption=caption, parse_mode=ParseMode.MARKDOWN)
+            elif kind == 'audio':
+                await message.reply_audio(audio=item['file_id'], caption=caption, parse_mode=ParseMode.MARKDOWN)
+            elif kind == 'animation':
+                await message.reply_animation(animation=item['file_id'], caption=caption, parse_mode=ParseMode.MARKDOWN)
+            else:
+                await message.reply_document(document=item['file_id'], caption=caption, parse_mode=ParseMode.MARKDOWN)
 
     async def send_copyable_description(self, update: Update, metadata: dict):
         """Send media description as copyable text - only title and description"""
@@ -1071,36 +2205,92 @@ Available formats (cleaned URL):
         except:
             pass  # Ignore callback answer errors
 
-        data_parts = query.data.split(':', 2)
-        if len(data_parts) != 3 or data_parts[0] != 'quality':
+        data_parts = query.data.split(':', 1)
+        pick = self.picks.get(data_parts[1]) if len(data_parts) == 2 and data_parts[0] == 'quality' else None
+        if pick is None:
             try:
-                await query.edit_message_text("❌ Invalid selection")
+                await query.edit_message_text("❌ This menu has expired. Please send the link again.")
             except:
                 pass
             return
 
-        format_id = data_parts[1]
-        url = data_parts[2]
+        url, format_id = pick
 
         user = query.from_user
         logging.info(f"Quality selected by {user.first_name}: {format_id} for {url}")
 
+        # The link was already charged when it was sent; only the in-flight cap applies
+        if not await self.admit(query.message, user.id, charge=False):
+            return
+        queued = False
+        try:
+            queued = await self.start_quality(query, url, format_id)
+        finally:
+            if not queued:
+                self.admission.release(user.id)
+
+    async def start_quality(self, query, url: str, format_id: str) -> bool:
+        """Answer a quality pick from the caches or queue its download; True once queued"""
+        cache_key = self.media_cache_key(url, format_id)
+        if await self.reply_from_cache(query.message, cache_key):
+            try:
+                await query.message.delete()
+            except:
+                pass
+            return False
+
+        flight = self.flights.join(cache_key)
+        if flight:
+            try:
+                await query.edit_message_text("🔄 This quality is already being downloaded, sharing the result...")
+            except:
+                pass
+            self.app.create_task(self.follow_flight(query.message, flight, query.message))
+            return False
+        self.flights.begin(cache_key)
+
         # Update message to show downloading
+        platform = self.platform_for_url(url)
+        if self.scheduler.has_free_slot(platform):
+            status_text = "🔄 Downloading your selected quality..."
+        else:
+            status_text = self.queue_text(self.scheduler.queued + 1)
         try:
-            await query.edit_message_text("🔄 Downloading your selected quality...")
+            await query.edit_message_text(status_text)
         except:
             # If editing fails, send a new message
-            await query.message.reply_text("🔄 Downloading your selected quality...")
+            await query.message.reply_text(status_text)
+
+        await self.enqueue(
+            platform, query.from_user.id, lambda: self.process_quality(query, url, format_id),
+            query.message, cost=self.predict_cost(url, format_id)
+        )
+        return True
+
+    async def process_quality(self, query, url: str, format_id: str):
+        """Download the selected format and send it; runs on a scheduler worker"""
+        cache_key = self.media_cache_key(url, format_id)
+        shared_result = None
+        deadline = self.deadline_for('youtube')
 
         # Create temp directory
         temp_dir = tempfile.mkdtemp(prefix="setupia_")
 
         try:
             # Download with selected format
-            media_info = await self.download_with_yt_dlp_format(url, temp_dir, format_id)
+            reporter = ProgressMessage(query.message)
+            try:
+                media_info = await self.download_with_yt_dlp_format(url, temp_dir, format_id,
+                                                                     on_progress=reporter.update, deadline=deadline)
+            finally:
+                await reporter.close()
 
             if media_info:
-                await self.send_media_to_user_from_callback(query, media_info)
+                media_info = await self.fit_for_upload(media_info, query.message)
+                delivered = await self.send_media_to_user_from_callback(query, media_info)
+                caption = self.format_description(media_info['metadata'])
+                await asyncio.to_thread(self.file_ids.put, cache_key, delivered, caption)
+                shared_result = {'items': delivered, 'caption': caption}
                 # Delete the quality selection message
                 try:
                     await query.message.delete()
@@ -1113,13 +2303,17 @@ Available formats (cleaned URL):
             await query.edit_message_text(f"❌ Error downloading: {str(e)}")
             logging.error(f"Error in quality callback: {e}")
         finally:
+            self.flights.finish(cache_key, shared_result)
+            logging.info(f"Request budget for {url} ({format_id}): {deadline.summary()}")
+
             # Clean up
             try:
                 shutil.rmtree(temp_dir)
             except Exception as e:
                 logging.error(f"Error cleaning up temp dir: {e}")
 
-    async def download_with_yt_dlp_format(self, url: str, temp_dir: str, format_id: str) -> Optional[dict]:
+    async def download_with_yt_dlp_format(self, url: str, temp_dir: str, format_id: str,
+                                          on_progress=None, deadline: Optional[Deadline] = None) -> Optional[dict]:
         """Download media using yt-dlp with specific format"""
         try:
             if format_id == "best" or format_id == "Best":
@@ -1130,143 +2324,74 @@ Available formats (cleaned URL):
                     format_selector = 'best[height<=720][acodec!=none]/best[acodec!=none]/best'
             elif format_id == "140":  # Audio only
                 format_selector = 'bestaudio[ext=m4a]/best'
+            elif '+' in format_id:
+                # Video-only format paired with audio by the format picker
+                video_id = format_id.split('+')[0]
+                format_selector = f'{format_id}/{video_id}/best[height<=720][acodec!=none]/best'
             else:
                 # For video formats, try to get combined streams first, then video-only
                 format_selector = f'{format_id}[acodec!=none]/{format_id}/best[height<=720][acodec!=none]/best'
 
-            cmd = [
-                'yt-dlp',
-                '--write-info-json',
-                '--format', format_selector,
-                '--max-filesize', '45M',
-                '--output', f'{temp_dir}/%(title)s.%(ext)s',
-                '--merge-output-format', 'mp4',  # Ensure merged output
-                '--no-warnings',
-                url
-            ]
-
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            options = {
+                'format': format_selector,
+                'max_filesize': await self.download_size_limit(),
+                'merge_output_format': 'mp4',  # Ensure merged output
+            }
+
+            result = await self.run_budgeted(
+                deadline, 'yt-dlp', 45.0,
+                lambda timeout, max_duration: self.extractors.download(
+                    url, temp_dir, options, timeout=timeout, on_progress=on_progress, max_duration=max_duration
+                )
             )
-
-            try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=45.0)
-            except asyncio.TimeoutError:
-                process.kill()
-                await process.wait()
-                logging.error(f"yt-dlp timeout for format {format_id}")
+            if result is None:
+                logging.error(f"yt-dlp timed out or stalled for format {format_id}")
                 return None
 
-            if process.returncode == 0:
-                return await self.process_downloaded_files(temp_dir, 'yt-dlp')
+            if result['ok']:
+                return await self.build_media_info(result['files'], 'yt-dlp', result['info'],
+                                                   platform=self.platform_for_url(url))
             else:
                 # Log the error and try best fallback
-                error_msg = stderr.decode()
-                logging.error(f"yt-dlp failed for format {format_id}: {error_msg}")
-                return await self.fallback_download(url, temp_dir)
+                logging.error(f"yt-dlp failed for format {format_id}: {result['error']}")
+                return await self.fallback_download(url, temp_dir, on_progress, deadline)
 
         except Exception as e:
             logging.error(f"yt-dlp error for format {format_id}: {e}")
-            return await self.fallback_download(url, temp_dir)
+            return await self.fallback_download(url, temp_dir, on_progress, deadline)
 
         return None
 
-    async def fallback_download(self, url: str, temp_dir: str) -> Optional[dict]:
+    async def fallback_download(self, url: str, temp_dir: str, on_progress=None,
+                                deadline: Optional[Deadline] = None) -> Optional[dict]:
         """Fallback download with best available quality"""
+        metrics.FALLBACKS.inc(platform=self.platform_for_url(url), kind='best_format')
         try:
-            cmd = [
-                'yt-dlp',
-                '--write-info-json',
-                '--format', 'best[height<=720][acodec!=none]/best[acodec!=none]/best',
-                '--output', f'{temp_dir}/%(title)s_fallback.%(ext)s',
-                '--no-warnings',
-                url
-            ]
-
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            options = {
+                'format': 'best[height<=720][acodec!=none]/best[acodec!=none]/best',
+                'outtmpl': '%(title)s_fallback.%(ext)s',
+                'max_filesize': await self.download_size_limit(),
+            }
+
+            result = await self.run_budgeted(
+                deadline, 'fallback', 30.0,
+                lambda timeout, max_duration: self.extractors.download(
+                    url, temp_dir, options, timeout=timeout, on_progress=on_progress, max_duration=max_duration
+                )
             )
 
-            try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=30.0)
-            except asyncio.TimeoutError:
-                process.kill()
-                await process.wait()
-                return None
-
-            if process.returncode == 0:
-                return await self.process_downloaded_files(temp_dir, 'yt-dlp-fallback')
+            if result and result['ok']:
+                return await self.build_media_info(result['files'], 'yt-dlp-fallback', result['info'],
+                                                   platform=self.platform_for_url(url))
 
         except Exception as e:
             logging.error(f"Fallback download error: {e}")
 
         return None
 
-    async def send_media_to_user_from_callback(self, query, media_info: dict):
+    async def send_media_to_user_from_callback(self, query, media_info: dict) -> list:
         """Send downloaded media to user from callback query"""
-        files = media_info['files']
-        metadata = media_info['metadata']
-
-        # Format description with Geist Mono font
-        description = self.format_description(metadata)
-
-        for file_path in files:
-            try:
-                if not file_path.exists():
-                    await query.message.reply_text(f"❌ File not found: {file_path.name}")
-                    continue
-
-                file_size = file_path.stat().st_size
-
-                if file_size > 50 * 1024 * 1024:  # 50MB
-                    await query.message.reply_text(f"❌ File too large: {file_path.name} ({file_size / (1024*1024):.1f}MB)")
-                    continue
-
-                # Read file content
-                with open(file_path, 'rb') as f:
-                    file_content = f.read()
-
-                if not file_content:
-                    await query.message.reply_text(f"❌ Empty file: {file_path.name}")
-                    continue
-
-                file_ext = file_path.suffix.lower()
-
-                if file_ext in ['.mp4', '.webm', '.mov', '.avi']:
-                    await query.message.reply_video(
-                        video=file_content,
-                        caption=description,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                elif file_ext in ['.jpg', '.jpeg', '.png', '.gif']:
-                    await query.message.reply_photo(
-                        photo=file_content,
-                        caption=description,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                elif file_ext in ['.mp3', '.m4a', '.wav', '.ogg']:
-                    await query.message.reply_audio(
-                        audio=file_content,
-                        caption=description,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                else:
-                    await query.message.reply_document(
-                        document=file_content,
-                        filename=file_path.name,
-                        caption=description,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-
-            except Exception as e:
-                await query.message.reply_text(f"❌ Error sending file: {str(e)}")
-                logging.error(f"Error sending file {file_path}: {e}")
-
-        # No separate copyable text message - everything is in caption now
+        return await self.deliver_files(query.message, media_info)
 
     async def send_copyable_description_callback(self, query, metadata: dict):
         """Send media description as copyable text from callback - only title and description"""
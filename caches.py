@@ -0,0 +1,326 @@
+"""
+Persistent caches for Setupia AI Saver.
+
+Everything is stored in one SQLite database so the caches survive restarts
+and need no extra service.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import metrics
+
+# MetadataCache hit counter -> result label of the cache lookup metric
+LOOKUP_RESULTS = {'memory_hits': 'memory_hit', 'disk_hits': 'disk_hit', 'misses': 'miss'}
+
+
+def open_database(path: str) -> sqlite3.Connection:
+    """Open (and create) the cache database"""
+    if path != ':memory:':
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class FileIdCache:
+    """Telegram file_id cache keyed on media identity + chosen format.
+
+    Once a file has been uploaded, Telegram can resend it by file_id without
+    us downloading or uploading a byte. Entries expire after `ttl` seconds,
+    and the least recently used ones are evicted above `max_entries`.
+
+    get() only reads: hits are noted in memory and written in one batch by
+    the next put(), which is where eviction needs them. The row count is
+    kept in memory too, so neither call has to count the table.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, ttl: float, max_entries: int):
+        self.conn = conn
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> last use not written to the database yet
+        self._touched = {}
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS file_ids (
+                    key TEXT PRIMARY KEY,
+                    items TEXT NOT NULL,
+                    caption TEXT,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self.conn.execute('CREATE INDEX IF NOT EXISTS file_ids_last_used ON file_ids (last_used)')
+            self.entries = self.conn.execute('SELECT COUNT(*) FROM file_ids').fetchone()[0]
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return {'items': [...], 'caption': str} or None"""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT items, caption, created FROM file_ids WHERE key = ?', (key,)
+            ).fetchone()
+            if not row or now - row[2] > self.ttl:
+                # Expired rows are left for the next put() to delete
+                self.misses += 1
+                metrics.CACHE_LOOKUPS.inc(cache='file_id', result='miss')
+                return None
+            self._touched[key] = now
+            self.hits += 1
+            metrics.CACHE_LOOKUPS.inc(cache='file_id', result='disk_hit')
+        return {'items': json.loads(row[0]), 'caption': row[1]}
+
+    def put(self, key: str, items: list, caption: Optional[str]):
+        """Store the file_ids Telegram returned for a delivery.
+
+        Writes to the database; call it off the event loop.
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            exists = self.conn.execute('SELECT 1 FROM file_ids WHERE key = ?', (key,)).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO file_ids (key, items, caption, created, last_used) VALUES (?, ?, ?, ?, ?)',
+                (key, json.dumps(items), caption, now, now)
+            )
+            self._touched.pop(key, None)
+            if not exists:
+                self.entries += 1
+            self._evict(now)
+
+    def _flush(self):
+        """Write the noted last uses in one batch"""
+        if self._touched:
+            self.conn.executemany('UPDATE file_ids SET last_used = ? WHERE key = ?',
+                                  [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self, now: float):
+        self._flush()
+        expired = self.conn.execute('DELETE FROM file_ids WHERE created < ?', (now - self.ttl,)).rowcount
+        overflow = max(0, self.entries - expired - self.max_entries)
+        if overflow:
+            overflow = self.conn.execute(
+                'DELETE FROM file_ids WHERE key IN (SELECT key FROM file_ids ORDER BY last_used LIMIT ?)',
+                (overflow,)
+            ).rowcount
+        self.entries -= expired + overflow
+        self.evictions += expired + overflow
+
+    def delete(self, key: str):
+        with self._lock:
+            self._touched.pop(key, None)
+            self.entries -= self.conn.execute('DELETE FROM file_ids WHERE key = ?', (key,)).rowcount
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'entries': self.entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+class MetadataCache:
+    """Extraction results (format lists, content analysis) keyed on media ID.
+
+    Entries live in SQLite so they survive restarts, with a small in-memory
+    LRU in front for hot links. Every entry kind has its own TTL; kinds
+    without one are never cached.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, ttls: dict, memory_entries: int = 512):
+        self.conn = conn
+        self.ttls = ttls
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS metadata (
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (kind, key)
+                )
+            """)
+            self.conn.execute('CREATE INDEX IF NOT EXISTS metadata_created ON metadata (kind, created)')
+
+    def _count(self, kind: str, counter: str):
+        counters = self._counters.setdefault(kind, {'memory_hits': 0, 'disk_hits': 0, 'misses': 0})
+        counters[counter] += 1
+        metrics.CACHE_LOOKUPS.inc(cache=kind, result=LOOKUP_RESULTS[counter])
+
+    def _remember(self, kind: str, key: str, value, created: float):
+        self._memory[(kind, key)] = (value, created)
+        self._memory.move_to_end((kind, key))
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, kind: str, key: str, count: bool = True):
+        """Cached value or None; `count=False` leaves the hit counters alone"""
+        ttl = self.ttls.get(kind)
+        if not ttl:
+            return None
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get((kind, key))
+            if cached and now - cached[1] <= ttl:
+                self._memory.move_to_end((kind, key))
+                if count:
+                    self._count(kind, 'memory_hits')
+                return cached[0]
+            self._memory.pop((kind, key), None)
+
+            row = self.conn.execute(
+                'SELECT value, created FROM metadata WHERE kind = ? AND key = ?', (kind, key)
+            ).fetchone()
+            if not row or now - row[1] > ttl:
+                if count:
+                    self._count(kind, 'misses')
+                return None
+            value = json.loads(row[0])
+            self._remember(kind, key, value, row[1])
+            if count:
+                self._count(kind, 'disk_hits')
+        return value
+
+    def put(self, kind: str, key: str, value):
+        ttl = self.ttls.get(kind)
+        if not ttl:
+            return
+        now = time.time()
+        try:
+            encoded = json.dumps(value)
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Not caching {kind} for {key}: {e}")
+            return
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO metadata (kind, key, value, created) VALUES (?, ?, ?, ?)',
+                (kind, key, encoded, now)
+            )
+            self.conn.execute('DELETE FROM metadata WHERE kind = ? AND created < ?', (kind, now - ttl))
+            self._remember(kind, key, value, now)
+
+    def delete(self, kind: str, key: str):
+        with self._lock:
+            self._memory.pop((kind, key), None)
+            self.conn.execute('DELETE FROM metadata WHERE kind = ? AND key = ?', (kind, key))
+
+    def stats(self) -> dict:
+        """Per-kind hit counters and hit rate"""
+        with self._lock:
+            stats = {}
+            for kind, counters in self._counters.items():
+                hits = counters['memory_hits'] + counters['disk_hits']
+                total = hits + counters['misses']
+                stats[kind] = dict(counters, hit_rate=hits / total if total else 0.0)
+        return stats
+
+
+class NegativeCache:
+    """Recently failed links, keyed on canonical URL.
+
+    Stores the failure class (auth, not_found, rate_limited, timeout) so a
+    resent private or deleted link is answered at once instead of going
+    through every downloader again. Each class has its own TTL.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, ttls: dict):
+        self.conn = conn
+        self.ttls = ttls
+        self.hits = 0
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS failures (
+                    key TEXT PRIMARY KEY,
+                    failure TEXT NOT NULL,
+                    detail TEXT,
+                    created REAL NOT NULL
+                )
+            """)
+
+    def get(self, key: str) -> Optional[str]:
+        """Failure class if the link failed recently"""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute('SELECT failure, created FROM failures WHERE key = ?', (key,)).fetchone()
+            if not row:
+                return None
+            if now - row[1] > self.ttls.get(row[0], 0):
+                self.conn.execute('DELETE FROM failures WHERE key = ?', (key,))
+                return None
+            self.hits += 1
+        return row[0]
+
+    def put(self, key: str, failure: str, detail: Optional[str] = None):
+        if not self.ttls.get(failure):
+            return
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO failures (key, failure, detail, created) VALUES (?, ?, ?, ?)',
+                (key, failure, detail, now)
+            )
+            # Every TTL is short, so anything older than the longest one is dead
+            self.conn.execute('DELETE FROM failures WHERE created < ?', (now - max(self.ttls.values()),))
+
+    def delete(self, key: str):
+        with self._lock:
+            self.conn.execute('DELETE FROM failures WHERE key = ?', (key,))
+
+
+class RedirectCache:
+    """Short link -> resolved URL, so each short link is resolved once"""
+
+    def __init__(self, conn: sqlite3.Connection, ttl: float):
+        self.conn = conn
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS redirects (
+                    short TEXT PRIMARY KEY,
+                    target TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+
+    def get(self, short: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute('SELECT target, created FROM redirects WHERE short = ?', (short,)).fetchone()
+            if not row or time.time() - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row[0]
+
+    def put(self, short: str, target: str):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO redirects (short, target, created) VALUES (?, ?, ?)',
+                (short, target, now)
+            )
+            self.conn.execute('DELETE FROM redirects WHERE created < ?', (now - self.ttl,))
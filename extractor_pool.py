@@ -0,0 +1,689 @@
+"""
+Warm extractor worker processes for Setupia AI Saver.
+
+Each worker process imports yt-dlp and gallery-dl once. It keeps a
+long-lived YoutubeDL instance and one gallery-dl HTTP session (with its
+cookie jar) per extractor category. Requests therefore skip interpreter
+startup, extractor imports, config loading and the TLS handshake that a
+fresh `yt-dlp` / `gallery-dl` subprocess pays on every call. Workers return
+the info dict and the downloaded files directly.
+
+While downloading, workers publish their progress (bytes, files, phase) to
+a shared dict. The bot uses it as a stall watchdog: a call is cancelled
+when its bytes stop advancing, not after a fixed timeout.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional
+
+import metrics
+from toolchain import Toolchain
+
+# Keys dropped from metadata sent back to the bot (large and unused)
+HEAVY_INFO_KEYS = (
+    'formats', 'requested_formats', 'requested_downloads', 'thumbnails',
+    'automatic_captions', 'subtitles', 'requested_subtitles', 'http_headers',
+    'entries', 'heatmap', 'fragments'
+)
+
+# How often download hooks check for a cancellation request (seconds)
+CANCEL_CHECK_INTERVAL = 0.5
+# How often workers publish download progress, and the bot polls it (seconds)
+PROGRESS_INTERVAL = 0.5
+# Seconds a cancelled call may keep its worker before the process is killed
+CANCEL_GRACE = 5.0
+
+
+# ---------------------------------------------------------------------------
+# Worker side: everything below runs inside the pool processes
+# ---------------------------------------------------------------------------
+
+_ydl = None
+_cancelled = None
+_progress = None
+_running = None
+_ffmpeg_location = None
+_gdl_sessions = {}
+_gdl_token = None
+_manifest_job = None
+
+
+class _WorkerLogger:
+    """Collects yt-dlp errors instead of printing them"""
+
+    def __init__(self):
+        self.errors = []
+
+    def debug(self, msg):
+        pass
+
+    def info(self, msg):
+        pass
+
+    def warning(self, msg):
+        pass
+
+    def error(self, msg):
+        self.errors.append(msg)
+
+
+def _init_worker(cancelled, progress, running, gallery_dl_options, ffmpeg_location=None):
+    """Pool initializer: pre-import the extractors and load their config"""
+    global _cancelled, _progress, _running, _ffmpeg_location
+    _cancelled = cancelled
+    _progress = progress
+    _running = running
+    _ffmpeg_location = ffmpeg_location
+    _get_ydl()
+    _init_gallery_dl(gallery_dl_options or {})
+
+
+def _run_call(func, *args):
+    """Worker entry point for bot calls: report the pickup, then run `func`.
+
+    The bot starts a call's startup timeout here rather than at submission,
+    and uses the pid to kill this process if the call ignores a cancellation.
+    """
+    token = args[-1]
+    if token in _cancelled:
+        return {'ok': False, 'error': 'cancelled before it started'}
+    _running[token] = os.getpid()
+    return func(*args)
+
+
+def _get_ydl():
+    global _ydl
+    if _ydl is None:
+        import yt_dlp
+        _ydl = yt_dlp.YoutubeDL({
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+            'socket_timeout': 20,
+            'logger': _WorkerLogger(),
+            # The ffmpeg the bot probed, so merges don't depend on the worker's PATH
+            'ffmpeg_location': _ffmpeg_location,
+        })
+    return _ydl
+
+
+@contextmanager
+def _call_params(ydl, overrides: dict):
+    """Temporarily apply per-call params to the shared YoutubeDL instance.
+
+    YoutubeDL compiles params['format'] into `format_selector` only once, in
+    __init__, so a per-call format also needs its own selector.
+    """
+    missing = object()
+    saved = {key: ydl.params.get(key, missing) for key in overrides}
+    saved_selector = ydl.format_selector
+    ydl.params['logger'].errors = []
+    if 'format' in overrides:
+        # None falls back to yt-dlp's default format for each video
+        fmt = overrides['format']
+        ydl.format_selector = ydl.build_format_selector(fmt) if fmt else None
+    ydl.params.update(overrides)
+    try:
+        yield
+    finally:
+        ydl.format_selector = saved_selector
+        for key, value in saved.items():
+            if value is missing:
+                ydl.params.pop(key, None)
+            else:
+                ydl.params[key] = value
+
+
+class _ProgressPublisher:
+    """Publishes (phase, bytes, total, files) for one call, at most every
+    PROGRESS_INTERVAL seconds unless the phase changes or a file completes"""
+
+    def __init__(self, token: str):
+        self.token = token
+        self.bytes_done = 0
+        self.files = 0
+        self._last_publish = 0.0
+
+    def publish(self, phase: str, current_bytes: int = 0, current_total: Optional[int] = None, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_publish < PROGRESS_INTERVAL:
+            return
+        self._last_publish = now
+        total = self.bytes_done + current_total if current_total else None
+        try:
+            _progress[self.token] = (phase, self.bytes_done + current_bytes, total, self.files)
+        except Exception:
+            pass  # progress is best effort
+
+    def file_finished(self, size: int):
+        self.bytes_done += size
+        self.files += 1
+        self.publish('downloading', force=True)
+
+
+def _download_hooks(token: str):
+    """yt-dlp progress and postprocessor hooks: publish progress and abort
+    the download once the bot cancels the call"""
+    from yt_dlp.utils import DownloadCancelled
+    publisher = _ProgressPublisher(token)
+    last_check = [0.0]
+
+    def progress_hook(status):
+        if status.get('status') == 'finished':
+            publisher.file_finished(status.get('downloaded_bytes') or status.get('total_bytes') or 0)
+        elif status.get('status') == 'downloading':
+            publisher.publish(
+                'downloading',
+                status.get('downloaded_bytes') or 0,
+                status.get('total_bytes') or status.get('total_bytes_estimate')
+            )
+
+        now = time.monotonic()
+        if now - last_check[0] < CANCEL_CHECK_INTERVAL:
+            return
+        last_check[0] = now
+        if token in _cancelled:
+            raise DownloadCancelled(f'cancelled by bot ({token})')
+
+    def postprocessor_hook(status):
+        # Merging/remuxing moves no bytes; tell the watchdog it isn't a stall
+        if status.get('status') == 'started':
+            publisher.publish('processing', force=True)
+
+    return progress_hook, postprocessor_hook
+
+
+def _slim_info(info: dict) -> dict:
+    return {key: value for key, value in info.items() if key not in HEAVY_INFO_KEYS}
+
+
+def _manifest(info: dict) -> list:
+    """Files yt-dlp produced for an info dict and its playlist entries.
+
+    The in-process equivalent of `--print after_move:filepath`: each item is
+    {'path', 'metadata'} with the metadata of the entry the file belongs to.
+    Separate video and audio formats that weren't merged come back as one
+    item with the audio file under 'audio'.
+    """
+    manifest = []
+    for entry in info.get('entries') or []:
+        if entry:
+            manifest.extend(_manifest(entry))
+    for download in info.get('requested_downloads') or []:
+        metadata = _slim_info(info)
+        filepath = download.get('filepath') or download.get('filename')
+        if filepath and Path(filepath).is_file():
+            if all(item['path'] != filepath for item in manifest):
+                manifest.append({'path': filepath, 'metadata': metadata})
+            continue
+        parts = [fmt for fmt in download.get('requested_formats') or []
+                 if fmt.get('filepath') and Path(fmt['filepath']).is_file()]
+        video = [fmt['filepath'] for fmt in parts if fmt.get('vcodec') not in (None, 'none')]
+        audio = [fmt['filepath'] for fmt in parts if fmt.get('vcodec') in (None, 'none')]
+        if len(video) == 1 and len(audio) == 1:
+            manifest.append({'path': video[0], 'audio': audio[0], 'metadata': metadata})
+        else:
+            manifest.extend({'path': fmt['filepath'], 'metadata': metadata} for fmt in parts)
+    return manifest
+
+
+def _error_result(ydl, error: Exception) -> dict:
+    errors = ydl.params['logger'].errors
+    return {'ok': False, 'error': errors[-1] if errors else str(error)}
+
+
+def ytdlp_extract(url: str, token: str) -> dict:
+    """Extract info without downloading (like `yt-dlp --dump-json`)"""
+    ydl = _get_ydl()
+    with _call_params(ydl, {'skip_download': True}):
+        try:
+            info = ydl.extract_info(url, download=False)
+            return {'ok': True, 'info': ydl.sanitize_info(info)}
+        except Exception as e:
+            return _error_result(ydl, e)
+
+
+def ytdlp_download(url: str, temp_dir: str, options: dict, info: Optional[dict], token: str) -> dict:
+    """Download a URL into temp_dir and report the produced files (see _manifest).
+
+    When `info` is an info dict from an earlier ytdlp_extract call it is
+    processed directly (like `yt-dlp --load-info-json`), so the page isn't
+    extracted a second time.
+    """
+    ydl = _get_ydl()
+    params = {
+        'paths': {'home': temp_dir},
+        'outtmpl': {'default': options.get('outtmpl', '%(title)s.%(ext)s')},
+        'format': options.get('format'),
+        'max_filesize': options.get('max_filesize'),
+        'merge_output_format': options.get('merge_output_format'),
+    }
+    progress_hook, postprocessor_hook = _download_hooks(token)
+    ydl.add_progress_hook(progress_hook)
+    ydl.add_postprocessor_hook(postprocessor_hook)
+    try:
+        # An invalid format spec raises here, while the selector is built
+        with _call_params(ydl, params):
+            info = _download_from_info(ydl, info) if info else None
+            if info is None:
+                info = ydl.extract_info(url, download=True)
+            info = ydl.sanitize_info(info)
+            return {'ok': True, 'info': _slim_info(info), 'files': _manifest(info)}
+    except Exception as e:
+        return _error_result(ydl, e)
+    finally:
+        ydl._progress_hooks.remove(progress_hook)
+        ydl._postprocessor_hooks.remove(postprocessor_hook)
+
+
+def _init_gallery_dl(options: dict):
+    """Load gallery-dl config once per worker instead of once per download"""
+    from gallery_dl import config
+    config.load()
+    config.set(('output',), 'mode', 'null')
+    # Report byte progress to the output object (see _ProgressOutput)
+    config.set(('downloader',), 'progress', PROGRESS_INTERVAL)
+
+    # Instagram cookies for authentication
+    if options.get('instagram_cookies'):
+        config.set(('extractor', 'instagram'), 'cookies', options['instagram_cookies'])
+
+    # Reddit API credentials for better access
+    if options.get('reddit_client_id') and options.get('reddit_client_secret'):
+        config.set(('extractor', 'reddit'), 'client-id', options['reddit_client_id'])
+        config.set(('extractor', 'reddit'), 'client-secret', options['reddit_client_secret'])
+        config.set(('extractor', 'reddit'), 'user-agent', options.get('reddit_user_agent'))
+
+
+class _ErrorCollector(logging.Handler):
+    """Keeps gallery-dl error log lines for the bot"""
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.ERROR)
+        self.errors = []
+
+    def emit(self, record):
+        self.errors.append(record.getMessage())
+
+
+def _json_safe(kwdict: dict) -> dict:
+    public = {key: value for key, value in kwdict.items() if not key.startswith('_')}
+    return json.loads(json.dumps(public, default=str))
+
+
+class _ProgressOutput:
+    """gallery-dl output that forwards per-file progress to the bot"""
+
+    def __init__(self, publisher: _ProgressPublisher):
+        self.publisher = publisher
+        self.current = 0
+        self._last_cancel_check = 0.0
+
+    def start(self, path):
+        self.current = 0
+        self.publisher.publish('downloading', force=True)
+
+    def skip(self, path):
+        pass
+
+    def success(self, path):
+        self.publisher.file_finished(self.current)
+        self.current = 0
+
+    def progress(self, bytes_total, bytes_downloaded, bytes_per_second):
+        self.current = bytes_downloaded
+        self.publisher.publish('downloading', bytes_downloaded, bytes_total)
+
+        # Large files: also honour cancellation in the middle of a file
+        now = time.monotonic()
+        if now - self._last_cancel_check >= CANCEL_CHECK_INTERVAL:
+            self._last_cancel_check = now
+            if self.publisher.token in _cancelled:
+                from gallery_dl import exception
+                raise exception.StopExtraction()
+
+
+def _manifest_job_class():
+    global _manifest_job
+    if _manifest_job is not None:
+        return _manifest_job
+
+    from gallery_dl import exception, job
+
+    class ManifestJob(job.DownloadJob):
+        """DownloadJob that records each produced file with its metadata
+        and reuses one HTTP session per extractor category"""
+
+        def __init__(self, extr, parent=None):
+            job.DownloadJob.__init__(self, extr, parent)
+            self.produced = parent.produced if parent is not None else []
+            self.out = parent.out if parent is not None else _ProgressOutput(_ProgressPublisher(_gdl_token))
+            self._last_cancel_check = 0.0
+            session = _gdl_sessions.get(self.extractor.category)
+            if session is not None and self.extractor.session is None:
+                self.extractor.session = session
+
+        def handle_url(self, url, kwdict):
+            now = time.monotonic()
+            if now - self._last_cancel_check >= CANCEL_CHECK_INTERVAL:
+                self._last_cancel_check = now
+                if _gdl_token in _cancelled:
+                    raise exception.StopExtraction()
+
+            status = self.status
+            job.DownloadJob.handle_url(self, url, kwdict)
+            path = self.pathfmt.path
+            if self.status == status and path and Path(path).is_file():
+                self.produced.append({'path': path, 'metadata': _json_safe(kwdict)})
+
+        def run(self):
+            try:
+                return job.DownloadJob.run(self)
+            finally:
+                if self.extractor.session is not None:
+                    _gdl_sessions.setdefault(self.extractor.category, self.extractor.session)
+
+    _manifest_job = ManifestJob
+    return _manifest_job
+
+
+def gallery_dl_download(url: str, temp_dir: str, token: str) -> dict:
+    """Download a URL with gallery-dl and report each produced file"""
+    global _gdl_token
+    from gallery_dl import config, exception
+
+    config.set((), 'base-directory', temp_dir)
+    config.set((), 'directory', ())
+    collector = _ErrorCollector()
+    root_logger = logging.getLogger()
+    root_logger.addHandler(collector)
+    _gdl_token = token
+    try:
+        manifest_job = _manifest_job_class()(url)
+        status = manifest_job.run()
+        files = manifest_job.produced
+        if status == 0 or files:
+            return {'ok': True, 'files': files, 'status': status}
+        error = collector.errors[-1] if collector.errors else f'gallery-dl exit status {status}'
+        return {'ok': False, 'error': error, 'status': status}
+    except exception.NoExtractorError:
+        return {'ok': False, 'error': f'Unsupported URL: {url}'}
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+    finally:
+        _gdl_token = None
+        root_logger.removeHandler(collector)
+
+
+def _download_from_info(ydl, info: dict) -> Optional[dict]:
+    """Download from a previously extracted info dict; None if it went stale"""
+    from yt_dlp.utils import DownloadError, ReExtractInfo
+    try:
+        return ydl.process_ie_result(ydl.sanitize_info(info, True), download=True)
+    except (DownloadError, ReExtractInfo) as e:
+        # Media URLs in the info dict can expire; extract again from the page
+        ydl.params['logger'].errors = []
+        logging.info(f"Reusing extracted info failed ({e}), extracting again")
+        return None
+
+
+def _warm_up() -> int:
+    # Keep each warm-up task busy briefly so every process gets one
+    time.sleep(0.2)
+    return multiprocessing.current_process().pid
+
+
+# ---------------------------------------------------------------------------
+# Bot side
+# ---------------------------------------------------------------------------
+
+class ExtractorPool:
+    """Long-lived ProcessPoolExecutor of warm yt-dlp / gallery-dl workers.
+
+    Download calls are watched rather than timed: `timeout` only bounds the
+    time from a worker picking a call up until its first progress report.
+    After that a call is cancelled when its bytes stop advancing for
+    `stall_timeout` seconds, and `max_duration` caps it overall. A cancelled
+    call that doesn't stop within CANCEL_GRACE seconds (a blocked socket read
+    never reaches a hook) gets its worker killed, so it can't hold up the
+    calls queued behind it.
+    """
+
+    def __init__(self, workers: int, gallery_dl_options: Optional[dict] = None,
+                 stall_timeout: float = 20.0, max_duration: float = 1800.0,
+                 toolchain: Optional[Toolchain] = None):
+        self.workers = max(1, workers)
+        self.toolchain = toolchain
+        self.gallery_dl_options = gallery_dl_options or {}
+        self.stall_timeout = stall_timeout
+        self.max_duration = max_duration
+        self._context = multiprocessing.get_context('spawn')
+        self._manager = None
+        self._cancelled = None
+        self._progress = None
+        self._running = None
+        self._executor = None
+
+    def start(self):
+        """Spawn the workers and warm them up in the background.
+
+        Workers hand yt-dlp the toolchain's ffmpeg as probed at this point.
+        """
+        if self._manager is None:
+            self._manager = self._context.Manager()
+            self._cancelled = self._manager.dict()
+            self._progress = self._manager.dict()
+            self._running = self._manager.dict()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._cancelled, self._progress, self._running, self.gallery_dl_options,
+                      self.ffmpeg_location())
+        )
+        for _ in range(self.workers):
+            self._executor.submit(_warm_up)
+        metrics.SUBPROCESS_SPAWNS.inc(self.workers, program='extractor-worker')
+        logging.info(f"Extractor pool started with {self.workers} warm workers")
+
+    def ffmpeg_location(self) -> Optional[str]:
+        """Full path of the toolchain's ffmpeg; yt-dlp can't look a bare name up on PATH"""
+        if not self.toolchain or not self.toolchain.has('ffmpeg'):
+            return None
+        return shutil.which(self.toolchain.path('ffmpeg'))
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager:
+            self._manager.shutdown()
+            self._manager = None
+
+    def cancel(self, token: str):
+        """Ask the worker running `token` to abort at its next hook"""
+        try:
+            self._cancelled[token] = True
+        except Exception as e:
+            logging.warning(f"Could not flag extractor call {token} as cancelled: {e}")
+
+    def _forget(self, token: str):
+        try:
+            self._cancelled.pop(token, None)
+            self._progress.pop(token, None)
+            self._running.pop(token, None)
+        except Exception:
+            pass
+
+    def _worker_pid(self, token: str) -> Optional[int]:
+        """pid of the worker running a call, None while it is still queued"""
+        try:
+            return self._running.get(token)
+        except Exception:
+            return None
+
+    def progress(self, token: str) -> Optional[dict]:
+        """Latest progress a worker published for a call"""
+        try:
+            state = self._progress.get(token)
+        except Exception:
+            return None
+        if state is None:
+            return None
+        phase, downloaded, total, files = state
+        return {'phase': phase, 'downloaded': downloaded, 'total': total, 'files': files}
+
+    async def call(self, func, *args, timeout: float,
+                   on_progress: Optional[Callable[[dict], None]] = None,
+                   max_duration: Optional[float] = None) -> Optional[dict]:
+        """Run a worker function; returns None on timeout, stall or pool failure.
+
+        A call that spent most of its max_duration waiting for a free worker
+        comes back as an error result marked 'busy' instead, so the link
+        isn't blamed for the pool being full.
+
+        `timeout` bounds the call from the moment a worker picks it up until
+        it first reports progress; time spent waiting for a free worker
+        doesn't count. From then on only a stall (or max_duration, counted
+        from submission) ends it early. A `max_duration` lower than the
+        pool's own (a request's remaining deadline) takes precedence.
+        """
+        if max_duration is None or max_duration > self.max_duration:
+            max_duration = self.max_duration
+        # A call interrupted by _replace() runs once more on the new workers,
+        # with what is left of its max_duration
+        started = time.monotonic()
+        for _ in range(2):
+            remaining = max_duration - (time.monotonic() - started)
+            if remaining <= 0:
+                logging.error(f"{func.__name__} interrupted by a worker replacement with no time left")
+                return None
+            if self._executor is None:
+                self.start()
+            executor = self._executor
+            try:
+                return await self._watch(executor, func, args, timeout, on_progress, remaining)
+            except BrokenProcessPool:
+                if executor is self._executor:
+                    self._restart()
+                    return None
+                logging.warning(f"{func.__name__} interrupted by a worker replacement, running it again")
+        return None
+
+    async def _watch(self, executor: ProcessPoolExecutor, func, args: tuple, timeout: float,
+                     on_progress: Optional[Callable[[dict], None]], max_duration: float) -> Optional[dict]:
+        token = uuid.uuid4().hex
+        job = executor.submit(_run_call, func, *args, token)
+        # Drop the cancel flag only once the worker has really finished
+        job.add_done_callback(lambda _: self._forget(token))
+        future = asyncio.wrap_future(job)
+        submitted = last_change = time.monotonic()
+        picked_up = None
+        last_state = None
+        try:
+            while True:
+                done, _ = await asyncio.wait({future}, timeout=PROGRESS_INTERVAL)
+                if done:
+                    return future.result()
+
+                now = time.monotonic()
+                if picked_up is None and self._worker_pid(token) is not None:
+                    picked_up = now
+                state = self.progress(token)
+                if state != last_state:
+                    last_state, last_change = state, now
+                    if on_progress and state:
+                        on_progress(state)
+
+                if now - submitted > max_duration:
+                    waited = (now if picked_up is None else picked_up) - submitted
+                    if waited * 2 >= now - submitted:
+                        self._abort(token, job, future, executor)
+                        logging.error(f"{func.__name__} cancelled: waited {waited:.0f}s of its "
+                                      f"{max_duration:.0f}s for a free worker")
+                        return {'ok': False, 'error': 'all extractor workers are busy', 'busy': True}
+                    reason = f"still running after {max_duration:.0f}s"
+                elif picked_up is None:
+                    reason = None
+                elif state is None:
+                    reason = f"no progress after {timeout}s" if now - picked_up > timeout else None
+                elif state['phase'] == 'downloading' and now - last_change > self.stall_timeout:
+                    reason = f"stalled at {state['downloaded']} bytes for {self.stall_timeout}s"
+                else:
+                    reason = None
+                if reason:
+                    self._abort(token, job, future, executor)
+                    logging.error(f"{func.__name__} cancelled: {reason}")
+                    return None
+        except asyncio.CancelledError:
+            # e.g. the losing side of a hedged download
+            self._abort(token, job, future, executor)
+            raise
+
+    def _abort(self, token: str, job, future: asyncio.Future, executor: ProcessPoolExecutor):
+        """Drop a call no worker has taken yet, or ask its worker to stop"""
+        # Nobody reads the result any more, including a BrokenProcessPool from _replace()
+        future.add_done_callback(lambda _: future.cancelled() or future.exception())
+        if job.cancel():
+            return
+        self.cancel(token)
+        asyncio.get_running_loop().create_task(self._reap(token, future, executor))
+
+    async def _reap(self, token: str, future: asyncio.Future, executor: ProcessPoolExecutor):
+        """Kill the worker of a cancelled call that is still running after CANCEL_GRACE"""
+        done, _ = await asyncio.wait({future}, timeout=CANCEL_GRACE)
+        if done or executor is not self._executor:
+            return
+        pid = self._worker_pid(token)
+        if pid is None:
+            # Still queued: the worker drops it on pickup (see _run_call)
+            return
+        logging.error(f"Extractor worker {pid} ignored a cancellation for {CANCEL_GRACE:.0f}s, replacing it")
+        self._replace(pid)
+
+    def _replace(self, pid: int):
+        """Start fresh workers and kill a stuck one.
+
+        A killed worker breaks its executor, so calls still running or queued
+        there fail with BrokenProcessPool; call() runs those again on the
+        new workers within their remaining max_duration.
+        """
+        executor = self._executor
+        self._executor = None
+        self.start()
+        try:
+            os.kill(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+        except (ProcessLookupError, PermissionError):
+            pass
+        executor.shutdown(wait=False)
+
+    def _restart(self):
+        logging.error("Extractor pool broke, restarting workers")
+        self._executor = None
+        self.start()
+
+    async def extract(self, url: str, timeout: float) -> Optional[dict]:
+        return await self.call(ytdlp_extract, url, timeout=timeout)
+
+    async def download(self, url: str, temp_dir: str, options: dict, timeout: float,
+                       info: Optional[dict] = None, on_progress=None,
+                       max_duration: Optional[float] = None) -> Optional[dict]:
+        return await self.call(ytdlp_download, url, temp_dir, options, info,
+                               timeout=timeout, on_progress=on_progress, max_duration=max_duration)
+
+    async def gallery_dl(self, url: str, temp_dir: str, timeout: float, on_progress=None,
+                         max_duration: Optional[float] = None) -> Optional[dict]:
+        return await self.call(gallery_dl_download, url, temp_dir, timeout=timeout,
+                               on_progress=on_progress, max_duration=max_duration)
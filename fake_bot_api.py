@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Minimal stand-in for the Telegram Bot API server.
+
+Used by the benchmark and test scripts to exercise real python-telegram-bot
+requests without touching Telegram. Upload bodies are drained in chunks and
+discarded so the server itself doesn't hold files in memory.
+"""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import unquote_plus
+
+CHUNK_SIZE = 64 * 1024
+MEDIA_TYPE_PATTERN = re.compile(r'"type\\?"\s*:\s*\\?"(photo|video)')
+
+_message_ids = count(1)
+
+
+def _message(chat_id: int, **extra) -> dict:
+    message = {
+        'message_id': next(_message_ids),
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+    }
+    message.update(extra)
+    return message
+
+
+def _file(kind: str, n: int) -> dict:
+    return {'file_id': f'{kind}-{n}', 'file_unique_id': f'u-{kind}-{n}'}
+
+
+def _result_for(method: str, chat_id: int, head: bytes = b''):
+    n = next(_message_ids)
+    if method == 'getMe':
+        return {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}
+    if method == 'sendVideo':
+        return _message(chat_id, video=dict(_file('video', n), width=1, height=1, duration=1))
+    if method == 'sendPhoto':
+        return _message(chat_id, photo=[dict(_file('photo', n), width=1, height=1)])
+    if method == 'sendAudio':
+        return _message(chat_id, audio=dict(_file('audio', n), duration=1))
+    if method == 'sendDocument':
+        return _message(chat_id, document=_file('document', n))
+    if method in ('sendMessage', 'editMessageText'):
+        return _message(chat_id, text='ok')
+    if method == 'sendMediaGroup':
+        # One message per album item, in the order they were sent
+        return [_message(chat_id, video=dict(_file('video', n * 100 + i), width=1, height=1, duration=1))
+                if kind == 'video' else
+                _message(chat_id, photo=[dict(_file('photo', n * 100 + i), width=1, height=1)])
+                for i, kind in enumerate(MEDIA_TYPE_PATTERN.findall(unquote_plus(head.decode('utf-8', 'replace'))) or ['photo'])]
+    return True
+
+
+class FakeBotAPI:
+    """Threaded HTTP server answering Bot API methods with canned results.
+
+    Every request is recorded in `calls` as a dict with the method name,
+    content type, body size and (for small bodies) the raw body. Set
+    `floods[method] = n` to answer the next n calls of a method with a
+    429 flood wait of `flood_retry_after` seconds.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.calls = []
+        self.floods = {}
+        self.flood_retry_after = 1
+        self._lock = threading.Lock()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                method = self.path.rstrip('/').rsplit('/', 1)[-1]
+                length = int(self.headers.get('Content-Length') or 0)
+                remaining = length
+                head = b''
+                while remaining:
+                    chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    if len(head) < CHUNK_SIZE:
+                        head += chunk[:CHUNK_SIZE - len(head)]
+                    remaining -= len(chunk)
+                with api._lock:
+                    api.calls.append({
+                        'method': method,
+                        'content_type': self.headers.get('Content-Type', ''),
+                        'size': length,
+                        'head': head,
+                    })
+                    flooded = api.floods.get(method, 0) > 0
+                    if flooded:
+                        api.floods[method] -= 1
+                if flooded:
+                    status = 429
+                    body = json.dumps({
+                        'ok': False, 'error_code': 429,
+                        'description': f'Too Many Requests: retry after {api.flood_retry_after}',
+                        'parameters': {'retry_after': api.flood_retry_after},
+                    }).encode()
+                else:
+                    status = 200
+                    body = json.dumps({'ok': True, 'result': _result_for(method, 1, head)}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeBotAPI':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    api = FakeBotAPI(port=8081).start()
+    print(f"🧪 Fake Bot API listening on {api.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        api.stop()
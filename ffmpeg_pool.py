@@ -0,0 +1,312 @@
+"""
+Bounded ffmpeg pool for Setupia AI Saver.
+
+Post-processing that yt-dlp doesn't do for us runs here: video/audio merges
+(stream copy wherever the container allows), and files over the upload
+limit, which are re-encoded to a bitrate that fits or split losslessly into
+numbered parts. At most `workers` ffmpeg processes run at once and only
+`transcode_workers` of them may re-encode video; every process has a fixed
+thread count and a lower CPU priority, so transcodes never take the CPU
+away from downloads and uploads.
+
+Which of these the installed ffmpeg can do comes from the toolchain probe
+(libx264 and aac encoders, mp4 and segment muxers); jobs it can't run are
+skipped instead of failing. Files are inspected with ffprobe when it was
+found, and from `ffmpeg -i` output otherwise.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import re
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import metrics
+from toolchain import Toolchain
+
+VIDEO_EXTENSIONS = {'.mp4', '.webm', '.mov', '.avi', '.mkv'}
+AUDIO_EXTENSIONS = {'.m4a', '.mp3', '.aac', '.opus', '.ogg', '.wav'}
+
+# Share of the size limit aimed for, leaving room for container overhead
+# and encoder overshoot
+SIZE_MARGIN = 0.92
+# Audio bitrate range (kbit/s) for re-encodes
+MAX_AUDIO_KBPS = 128
+MIN_AUDIO_KBPS = 32
+# Audio codecs an MP4 can carry as-is; anything else is re-encoded to AAC
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'alac', 'ac3', 'eac3'}
+# Merge timeout: a base plus the inputs at a conservative stream-copy rate
+MERGE_TIMEOUT_BASE = 30.0
+MERGE_BYTES_PER_SECOND = 10 * 1024 * 1024
+# Segments are cut on keyframes, so parts can overshoot; each retry shortens them
+SPLIT_ATTEMPTS = 3
+SPLIT_SHRINK = 0.75
+
+DURATION_PATTERN = re.compile(r'Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)')
+STREAM_PATTERN = re.compile(r'Stream #\d+:\d+\S*: (Video|Audio): (\w+)')
+
+
+class FfmpegPool:
+    """Runs ffmpeg jobs with bounded concurrency and CPU use.
+
+    `toolchain` is the registry the ffmpeg / ffprobe paths and ffmpeg's
+    features are read from.
+    """
+
+    def __init__(self, toolchain: Toolchain, workers: int = 4, transcode_workers: int = 1,
+                 threads: int = 2, nice: int = 10):
+        self.toolchain = toolchain
+        self.workers = max(1, workers)
+        self.transcode_workers = max(1, min(transcode_workers, self.workers))
+        self.threads = max(1, threads)
+        self.nice = nice
+        self._nice_path = shutil.which('nice') if nice else None
+        self._slots = asyncio.Semaphore(self.workers)
+        self._transcodes = asyncio.Semaphore(self.transcode_workers)
+
+    async def ffmpeg_path(self) -> Optional[str]:
+        return (await self.toolchain.ready()).path('ffmpeg')
+
+    async def supports(self, *features: str) -> bool:
+        """Whether the probed ffmpeg has all of these encoders / muxers"""
+        toolchain = await self.toolchain.ready()
+        return all(toolchain.has('ffmpeg', feature) for feature in features)
+
+    async def can_fit(self, mode: str) -> bool:
+        """Whether oversized files can be made to fit in this mode (see fit())"""
+        reencode = await self.supports('libx264', 'aac', 'mp4')
+        split = await self.supports('segment')
+        return {'reencode': reencode, 'split': split, 'auto': reencode or split}.get(mode, False)
+
+    def _niced(self, cmd: list) -> list:
+        """`cmd` run through nice(1) at the pool's priority, where nice exists"""
+        # In argv rather than a preexec_fn, which isn't safe with threads
+        # running and rules out the faster posix_spawn / vfork paths
+        if self.nice and self._nice_path:
+            return [self._nice_path, '-n', str(self.nice), *cmd]
+        return cmd
+
+    async def _spawn(self, program: str, cmd: list, timeout: float, platform: str = 'unknown') -> tuple:
+        """(ok, stdout, stderr) of a process run at lowered CPU priority"""
+        process = await asyncio.create_subprocess_exec(
+            *self._niced(cmd),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        metrics.SUBPROCESS_SPAWNS.inc(program=program)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            metrics.TIMEOUTS.inc(stage=program, platform=platform, downloader=program)
+            return False, '', f'timed out after {timeout:.0f}s'
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        return process.returncode == 0, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+
+    async def _exec(self, args: list, timeout: float, platform: str = 'unknown') -> tuple:
+        path = await self.ffmpeg_path()
+        if not path:
+            return False, 'ffmpeg not found'
+        ok, _, stderr = await self._spawn('ffmpeg', [path, '-hide_banner', '-nostdin', *args], timeout, platform)
+        return ok, stderr
+
+    async def run(self, args: list, timeout: float, transcode: bool = False, platform: str = 'unknown') -> tuple:
+        """Run ffmpeg in a pool slot; returns (ok, stderr text).
+
+        `transcode` marks CPU-heavy video encodes, which also need one of the
+        fewer transcode slots. `platform` labels the timeout metric.
+        """
+        async with contextlib.AsyncExitStack() as slots:
+            if transcode:
+                await slots.enter_async_context(self._transcodes)
+            await slots.enter_async_context(self._slots)
+            return await self._exec(args, timeout, platform)
+
+    async def probe(self, path: Path, platform: str = 'unknown') -> dict:
+        """Duration and first video/audio codec of a file (cover art doesn't count as video)"""
+        # Reading the header is cheap, so it doesn't wait for a slot
+        toolchain = await self.toolchain.ready()
+        if toolchain.has('ffprobe'):
+            ok, output, error = await self._spawn('ffprobe', [
+                toolchain.path('ffprobe'), '-v', 'error', '-of', 'json',
+                '-show_entries', 'format=duration:stream=codec_type,codec_name:stream_disposition=attached_pic',
+                str(path)
+            ], timeout=30.0, platform=platform)
+            try:
+                data = json.loads(output) if ok else None
+            except ValueError:
+                data = None
+            if data is not None:
+                return self._probe_info(data)
+            logging.warning(f"ffprobe failed on {path.name}, reading ffmpeg -i instead: {error[-300:]}")
+
+        _, output = await self._exec(['-i', str(path)], timeout=30.0, platform=platform)
+        info = {'duration': None, 'video': None, 'audio': None}
+        match = DURATION_PATTERN.search(output)
+        if match:
+            hours, minutes, seconds = match.groups()
+            info['duration'] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        for kind, codec in STREAM_PATTERN.findall(output):
+            if info[kind.lower()] is None:
+                info[kind.lower()] = codec
+        return info
+
+    @staticmethod
+    def _probe_info(data: dict) -> dict:
+        """probe() result from ffprobe's JSON output"""
+        info = {'duration': None, 'video': None, 'audio': None}
+        try:
+            info['duration'] = float(data.get('format', {}).get('duration'))
+        except (TypeError, ValueError):
+            pass
+        for stream in data.get('streams') or []:
+            kind = stream.get('codec_type')
+            if kind not in ('video', 'audio') or (stream.get('disposition') or {}).get('attached_pic'):
+                continue
+            if info[kind] is None:
+                info[kind] = stream.get('codec_name')
+        return info
+
+    async def merge(self, video: Path, audio: Path, output: Path, platform: str = 'unknown') -> bool:
+        """Mux a video-only and an audio-only file into an MP4.
+
+        Video is always copied. Audio is copied when its codec fits the
+        container and re-encoded to AAC otherwise (or if the copy fails),
+        provided ffmpeg has the AAC encoder.
+        """
+        if not await self.supports('mp4'):
+            logging.warning("ffmpeg has no mp4 muxer, cannot merge video/audio")
+            return False
+        audio_info = await self.probe(audio, platform)
+        audio_codecs = ['copy'] if audio_info['audio'] in MP4_AUDIO_CODECS else []
+        if await self.supports('aac'):
+            audio_codecs.append('aac')
+        if not audio_codecs:
+            logging.warning(f"Cannot merge {video.name}: {audio_info['audio']} audio needs the AAC encoder, "
+                            f"which ffmpeg lacks")
+            return False
+        size = await asyncio.to_thread(lambda: video.stat().st_size + audio.stat().st_size)
+        timeout = MERGE_TIMEOUT_BASE + size / MERGE_BYTES_PER_SECOND
+
+        for audio_codec in audio_codecs:
+            ok, error = await self.run(
+                ['-y', '-i', str(video), '-i', str(audio),
+                 '-map', '0:v:0', '-map', '1:a:0', '-c:v', 'copy', '-c:a', audio_codec,
+                 '-movflags', '+faststart', str(output)],
+                timeout=timeout, platform=platform
+            )
+            if ok and output.exists():
+                logging.info(f"Merged {video.name} + {audio.name} "
+                             f"({'audio copied' if audio_codec == 'copy' else 'audio re-encoded'})")
+                return True
+            logging.warning(f"ffmpeg merge with audio {audio_codec} failed: {error[-500:]}")
+            output.unlink(missing_ok=True)
+        return False
+
+    @staticmethod
+    def plan_bitrates(max_bytes: int, info: dict) -> Optional[tuple]:
+        """(video_kbps, audio_kbps) that fit `max_bytes`, or None if nothing fits"""
+        total_kbps = max_bytes * 8 * SIZE_MARGIN / info['duration'] / 1000
+        if not info['video']:
+            audio_kbps = min(MAX_AUDIO_KBPS, int(total_kbps))
+            return (0, audio_kbps) if audio_kbps >= MIN_AUDIO_KBPS else None
+        audio_kbps = max(MIN_AUDIO_KBPS, min(MAX_AUDIO_KBPS, int(total_kbps * 0.15))) if info['audio'] else 0
+        video_kbps = int(total_kbps - audio_kbps)
+        return (video_kbps, audio_kbps) if video_kbps > 0 else None
+
+    async def fit(self, path: Path, max_bytes: int, mode: str = 'auto', min_video_kbps: int = 300,
+                  platform: str = 'unknown') -> Optional[list]:
+        """Files carrying `path` within `max_bytes`, or None if it can't be made to fit.
+
+        mode 'reencode' always re-encodes, 'split' always splits, and 'auto'
+        re-encodes unless the video bitrate would drop below `min_video_kbps`.
+        """
+        size = (await asyncio.to_thread(path.stat)).st_size
+        if size <= max_bytes:
+            return [path]
+        info = await self.probe(path, platform)
+        if not info['duration'] or not (info['video'] or info['audio']):
+            logging.warning(f"Cannot fit {path.name}: ffmpeg found no duration or media streams")
+            return None
+
+        if mode in ('auto', 'reencode'):
+            encoders = ('libx264', 'aac', 'mp4') if info['video'] else ('aac',)
+            plan = self.plan_bitrates(max_bytes, info)
+            if not await self.supports(*encoders):
+                logging.warning(f"ffmpeg lacks {'/'.join(encoders)}, cannot re-encode {path.name}")
+            elif plan and (mode == 'reencode' or not info['video'] or plan[0] >= min_video_kbps):
+                fitted = await self.reencode(path, info, max_bytes, *plan, platform=platform)
+                if fitted:
+                    return [fitted]
+            if mode == 'reencode':
+                return None
+        return await self.split(path, info, max_bytes, platform)
+
+    async def reencode(self, path: Path, info: dict, max_bytes: int,
+                       video_kbps: int, audio_kbps: int, platform: str = 'unknown') -> Optional[Path]:
+        """Re-encode at a bitrate targeted at `max_bytes`"""
+        if info['video']:
+            output = path.with_name(f"{path.stem}_fit.mp4")
+            args = ['-y', '-i', str(path), '-map', '0:v:0', '-map', '0:a:0?',
+                    '-c:v', 'libx264', '-preset', 'veryfast',
+                    '-b:v', f'{video_kbps}k', '-maxrate', f'{video_kbps}k', '-bufsize', f'{video_kbps * 2}k',
+                    '-c:a', 'aac', '-b:a', f'{audio_kbps or MIN_AUDIO_KBPS}k',
+                    '-movflags', '+faststart', '-threads', str(self.threads), str(output)]
+        else:
+            output = path.with_name(f"{path.stem}_fit.m4a")
+            args = ['-y', '-i', str(path), '-vn', '-c:a', 'aac', '-b:a', f'{audio_kbps}k',
+                    '-threads', str(self.threads), str(output)]
+
+        logging.info(f"Re-encoding {path.name} at {video_kbps}k video / {audio_kbps}k audio to fit "
+                     f"{max_bytes / (1024 * 1024):.0f}MB")
+        ok, error = await self.run(args, timeout=max(120.0, info['duration'] * 2), transcode=bool(info['video']),
+                                   platform=platform)
+        if not ok or not output.exists():
+            logging.error(f"ffmpeg re-encode failed for {path.name}: {error[-500:]}")
+            output.unlink(missing_ok=True)
+            return None
+        size = output.stat().st_size
+        if size > max_bytes:
+            logging.warning(f"Re-encode of {path.name} came out at {size / (1024 * 1024):.1f}MB, over the limit")
+            output.unlink(missing_ok=True)
+            return None
+        return output
+
+    async def split(self, path: Path, info: dict, max_bytes: int, platform: str = 'unknown') -> Optional[list]:
+        """Split into numbered parts by stream copy, each within `max_bytes`"""
+        if not await self.supports('segment'):
+            logging.error(f"Cannot split {path.name}: ffmpeg has no segment muxer")
+            return None
+        size = (await asyncio.to_thread(path.stat)).st_size
+        segment_time = info['duration'] * max_bytes * SIZE_MARGIN / size
+        parts_dir = path.with_name(f"{path.stem}_parts")
+        parts_dir.mkdir(exist_ok=True)
+        pattern = parts_dir / f"{path.stem}_part%03d{path.suffix}"
+
+        for _ in range(SPLIT_ATTEMPTS):
+            for old in parts_dir.iterdir():
+                old.unlink()
+            logging.info(f"Splitting {path.name} into {segment_time:.0f}s parts")
+            ok, error = await self.run(
+                ['-y', '-i', str(path), '-map', '0:v?', '-map', '0:a?', '-c', 'copy',
+                 '-f', 'segment', '-segment_time', f'{segment_time:.2f}',
+                 '-reset_timestamps', '1', '-segment_start_number', '1', str(pattern)],
+                timeout=60.0 + size / (20 * 1024 * 1024), platform=platform
+            )
+            if not ok:
+                logging.error(f"ffmpeg split failed for {path.name}: {error[-500:]}")
+                return None
+            parts = sorted(parts_dir.iterdir())
+            if parts and all(part.stat().st_size <= max_bytes for part in parts):
+                return parts
+            # Keyframes too far apart for this segment length
+            segment_time *= SPLIT_SHRINK
+        logging.error(f"Could not split {path.name} into parts under {max_bytes / (1024 * 1024):.0f}MB")
+        return None
@@ -0,0 +1,298 @@
+"""
+In-process metrics for Setupia AI Saver.
+
+Small counters, gauges and histograms with labels, rendered in the
+Prometheus text format and served on /metrics by serve(). Everything lives
+in memory and is updated from the event loop, so no locking or external
+client library is needed.
+"""
+
+import asyncio
+import bisect
+import contextlib
+import logging
+import math
+import time
+from typing import Optional
+
+_registry = []
+
+
+def _label_key(labelnames: tuple, labels: dict) -> tuple:
+    unknown = set(labels) - set(labelnames)
+    if unknown:
+        raise ValueError(f"Unknown labels: {', '.join(sorted(unknown))}")
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(labelnames: tuple, key: tuple, extra: Optional[dict] = None) -> str:
+    pairs = [(name, value) for name, value in zip(labelnames, key)]
+    pairs += list((extra or {}).items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        _Metric.__init__(self, name, help_text, labelnames)
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(_label_key(self.labelnames, labels), 0)
+
+    def render(self) -> list:
+        lines = _Metric.render(self)
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        self.values[_label_key(self.labelnames, labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        _Metric.__init__(self, name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.series = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+        series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+        series['sum'] += value
+        series['count'] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the duration of a `with` block"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Estimate a quantile from the buckets (like histogram_quantile)"""
+        series = self.series.get(_label_key(self.labelnames, labels))
+        if not series or not series['count']:
+            return None
+        rank = q * series['count']
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets, series['counts']):
+            if count and seen + count >= rank:
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper if upper != math.inf else lower
+        return lower
+
+    def render(self) -> list:
+        lines = _Metric.render(self)
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for upper, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, {'le': _format_value(upper)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Answer one HTTP request: GET /metrics, anything else is a 404"""
+    try:
+        request = (await asyncio.wait_for(reader.readline(), timeout=5.0)).decode('latin-1').split()
+        # Headers are not needed, just read past them
+        while (await asyncio.wait_for(reader.readline(), timeout=5.0)) not in (b'\r\n', b'\n', b''):
+            pass
+        if len(request) >= 2 and request[0] in ('GET', 'HEAD') and request[1].split('?')[0] == '/metrics':
+            status, content_type, body = '200 OK', 'text/plain; version=0.0.4; charset=utf-8', render().encode()
+        else:
+            status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', b'Not found\n'
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode())
+        if request[:1] != ['HEAD']:
+            writer.write(body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError, UnicodeDecodeError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int) -> Optional[asyncio.AbstractServer]:
+    """Serve render() on http://host:port/metrics; None if the port can't be bound"""
+    try:
+        server = await asyncio.start_server(_handle, host, port)
+    except OSError as e:
+        logging.error(f"Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    logging.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
+
+
+# ---------------------------------------------------------------------------
+# Metrics used by the bot
+# ---------------------------------------------------------------------------
+
+DEADLINE_BUDGET_USED = Histogram(
+    'setupia_deadline_budget_used_ratio',
+    'Share of the request deadline an attempt used',
+    ('platform', 'stage'),
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+)
+DEADLINE_EXCEEDED = Counter(
+    'setupia_deadline_exceeded_total',
+    'Attempts that ran out of request deadline',
+    ('platform', 'stage')
+)
+DEADLINE_SKIPPED = Counter(
+    'setupia_deadline_skipped_total',
+    'Attempts skipped because the request deadline had already passed',
+    ('platform', 'stage')
+)
+OUTBOUND_QUEUED = Gauge(
+    'setupia_outbound_queued',
+    'Bot API calls waiting in the outbound scheduler'
+)
+OUTBOUND_WAIT = Histogram(
+    'setupia_outbound_wait_seconds',
+    'Time a Bot API call waited for its rate-limit slot',
+    ('priority',)
+)
+OUTBOUND_RETRY_AFTER = Counter(
+    'setupia_outbound_retry_after_total',
+    'Flood waits (RetryAfter) answered by Telegram, each retried automatically',
+    ('endpoint',)
+)
+OUTBOUND_COALESCED = Counter(
+    'setupia_outbound_coalesced_total',
+    'Message edits replaced by a newer edit before they were sent',
+    ('endpoint',)
+)
+ADMISSION_LIMIT = Gauge(
+    'setupia_user_limit',
+    'Configured per-user admission limits (0 = unlimited)',
+    ('limit',)
+)
+ADMISSION_REJECTED = Counter(
+    'setupia_user_rejected_total',
+    'Requests refused by per-user admission control',
+    ('reason',)
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    'setupia_user_requests_in_flight',
+    'Admitted requests queued or running, across all users'
+)
+LANE_BUCKETS = (1, 2.5, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600, 900, 1800)
+LANE_WAIT = Histogram(
+    'setupia_lane_wait_seconds',
+    'Time a download job waited in the queue, per cost lane',
+    ('lane',),
+    buckets=LANE_BUCKETS
+)
+LANE_LATENCY = Histogram(
+    'setupia_lane_latency_seconds',
+    'Time from queueing a download job to its end, per cost lane',
+    ('lane',),
+    buckets=LANE_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    'setupia_stage_seconds',
+    'Duration of a request stage (url_normalization, format_listing, analysis, download, merge, upload)',
+    ('stage', 'platform', 'downloader'),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+)
+SUBPROCESS_SPAWNS = Counter(
+    'setupia_subprocess_spawns_total',
+    'Processes started (ffmpeg jobs, extractor pool workers)',
+    ('program',)
+)
+TIMEOUTS = Counter(
+    'setupia_timeouts_total',
+    'Stages that timed out, stalled or ran out of request deadline',
+    ('stage', 'platform', 'downloader')
+)
+FALLBACKS = Counter(
+    'setupia_fallbacks_total',
+    'Fallbacks taken after a failure (next downloader, best format, best quality without a format list)',
+    ('platform', 'kind')
+)
+BYTES_DOWNLOADED = Counter(
+    'setupia_downloaded_bytes_total',
+    'Bytes of media downloaded',
+    ('platform', 'downloader')
+)
+BYTES_UPLOADED = Counter(
+    'setupia_uploaded_bytes_total',
+    'Bytes of media sent to Telegram',
+    ('platform', 'downloader')
+)
+QUEUE_DEPTH = Gauge(
+    'setupia_queue_depth',
+    'Download jobs waiting for a worker, per cost lane',
+    ('lane',)
+)
+ACTIVE_JOBS = Gauge(
+    'setupia_active_jobs',
+    'Download jobs running, per cost lane',
+    ('lane',)
+)
+CACHE_LOOKUPS = Counter(
+    'setupia_cache_lookups_total',
+    'Cache lookups per cache and result (memory_hit, disk_hit, miss)',
+    ('cache', 'result')
+)
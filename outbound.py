@@ -0,0 +1,291 @@
+"""
+Outbound send scheduler for Setupia AI Saver.
+
+Every Bot API call aimed at a chat (sends, edits, deletes) goes through
+here as python-telegram-bot's rate limiter. Calls are dispatched in priority
+order within Telegram's global and per-chat limits: media deliveries first,
+then plain messages, then cosmetic status edits. An edit still waiting to go
+out is replaced by a newer edit of the same message, and a flood wait
+(RetryAfter) pauses that chat for `retry_after` seconds before the call is
+retried, instead of failing the send.
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from datetime import timedelta
+from itertools import count
+from typing import Any, Callable, Optional
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import metrics
+
+PRIORITY_MEDIA = 0
+PRIORITY_MESSAGE = 1
+PRIORITY_STATUS = 2
+
+MEDIA_ENDPOINTS = {
+    'sendPhoto', 'sendVideo', 'sendAudio', 'sendDocument', 'sendAnimation',
+    'sendVoice', 'sendVideoNote', 'sendMediaGroup',
+}
+STATUS_ENDPOINTS = {
+    'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup',
+    'deleteMessage', 'sendChatAction',
+}
+# Edits where only the latest version matters
+COALESCED_ENDPOINTS = {'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'}
+
+PRIORITY_NAMES = {PRIORITY_MEDIA: 'media', PRIORITY_MESSAGE: 'message', PRIORITY_STATUS: 'status'}
+
+# Private chats tolerate short bursts above one message per second
+CHAT_BURST = 3
+# Idle per-chat buckets are dropped above this many
+MAX_IDLE_CHATS = 1000
+
+
+def priority_for(endpoint: str) -> int:
+    if endpoint in MEDIA_ENDPOINTS:
+        return PRIORITY_MEDIA
+    if endpoint in STATUS_ENDPOINTS:
+        return PRIORITY_STATUS
+    return PRIORITY_MESSAGE
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        # A clock reading taken before the bucket was created mustn't drain it
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """Priority queue in front of the Bot API, within Telegram's rate limits.
+
+    `global_rate` is messages per second across all chats, `chat_rate` per
+    private chat and `group_rate` per group chat (Telegram allows about 30/s,
+    1/s and 20/min). Calls without a chat (getUpdates, answerCallbackQuery,
+    getFile, ...) pass straight through. A call can override its priority
+    with `rate_limit_args=PRIORITY_MEDIA` (or another PRIORITY_* value).
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, group_rate: float = 20 / 60,
+                 max_retries: int = 5):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._paused = {}
+        self._queue = []
+        self._seq = count()
+        self._edits = {}
+        self._running = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def initialize(self):
+        self._start()
+
+    async def shutdown(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for _, _, job in self._queue:
+            for future in job['futures']:
+                if not future.done():
+                    future.cancel()
+        self._queue.clear()
+        self._edits.clear()
+
+    def _start(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    def stats(self) -> dict:
+        """Queued calls per priority and chats currently in a flood wait"""
+        queued = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _ in self._queue:
+            queued[PRIORITY_NAMES[priority]] += 1
+        now = time.monotonic()
+        return {
+            'queued': queued,
+            'running': len(self._running),
+            'paused_chats': sum(1 for until in self._paused.values() if until > now),
+        }
+
+    async def process_request(self, callback: Callable, args: Any, kwargs: dict, endpoint: str, data: dict,
+                              rate_limit_args: Optional[int]):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+        self._start()
+
+        future = asyncio.get_running_loop().create_future()
+        key = None
+        if endpoint in COALESCED_ENDPOINTS and data.get('message_id') is not None:
+            key = (endpoint, chat_id, data['message_id'])
+            job = self._edits.get(key)
+            if job is not None:
+                # Not sent yet: send this version instead, and answer both callers with its result
+                job['call'] = (callback, args, kwargs)
+                job['futures'].append(future)
+                metrics.OUTBOUND_COALESCED.inc(endpoint=endpoint)
+                return await future
+
+        priority = rate_limit_args if rate_limit_args in PRIORITY_NAMES else priority_for(endpoint)
+        job = {
+            'call': (callback, args, kwargs),
+            'endpoint': endpoint,
+            'chat_id': chat_id,
+            'key': key,
+            'futures': [future],
+            'attempts': 0,
+            'priority': priority,
+            'seq': next(self._seq),
+            'queued_at': time.monotonic(),
+        }
+        self._enqueue(job)
+        return await future
+
+    def _enqueue(self, job: dict):
+        if job['key'] is not None:
+            self._edits[job['key']] = job
+        heapq.heappush(self._queue, (job['priority'], job['seq'], job))
+        metrics.OUTBOUND_QUEUED.set(len(self._queue))
+        self._wakeup.set()
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Negative ids (and @usernames) are groups and channels
+            group = not isinstance(chat_id, int) or chat_id < 0
+            rate = self.group_rate if group else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, 1 if group else CHAT_BURST)
+        return bucket
+
+    def _next_job(self) -> tuple:
+        """(job to send now, None) or (None, seconds until one can go; None if the queue is empty)"""
+        now = time.monotonic()
+        wait = self._global.wait_time(now)
+        if wait > 0:
+            return None, wait
+        earliest = None
+        for entry in sorted(self._queue):
+            job = entry[2]
+            if all(future.done() for future in job['futures']):
+                # Every caller gave up (cancelled); nothing to send
+                self._remove(entry)
+                continue
+            chat_wait = max(self._paused.get(job['chat_id'], 0) - now, self._bucket(job['chat_id']).wait_time(now))
+            if chat_wait <= 0:
+                self._remove(entry)
+                self._global.take(now)
+                self._bucket(job['chat_id']).take(now)
+                return job, None
+            earliest = chat_wait if earliest is None else min(earliest, chat_wait)
+        return None, earliest
+
+    def _remove(self, entry: tuple):
+        self._queue.remove(entry)
+        heapq.heapify(self._queue)
+        job = entry[2]
+        if job['key'] is not None and self._edits.get(job['key']) is job:
+            del self._edits[job['key']]
+        metrics.OUTBOUND_QUEUED.set(len(self._queue))
+
+    def _prune(self):
+        now = time.monotonic()
+        self._paused = {chat_id: until for chat_id, until in self._paused.items() if until > now}
+        if len(self._chats) > MAX_IDLE_CHATS:
+            self._chats = {chat_id: bucket for chat_id, bucket in self._chats.items() if not bucket.full(now)}
+
+    async def _dispatch(self):
+        while True:
+            job, wait = self._next_job()
+            if job is None:
+                if wait is None:
+                    self._prune()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            metrics.OUTBOUND_WAIT.observe(time.monotonic() - job['queued_at'],
+                                          priority=PRIORITY_NAMES[job['priority']])
+            task = asyncio.get_running_loop().create_task(self._send(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _send(self, job: dict):
+        callback, args, kwargs = job['call']
+        try:
+            result = await callback(*args, **kwargs)
+        except RetryAfter as e:
+            self._retry(job, e)
+            return
+        except Exception as e:
+            for future in job['futures']:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future in job['futures']:
+            if not future.done():
+                future.set_result(result)
+
+    def _retry(self, job: dict, error: RetryAfter):
+        retry_after = error.retry_after
+        if isinstance(retry_after, timedelta):
+            retry_after = retry_after.total_seconds()
+        metrics.OUTBOUND_RETRY_AFTER.inc(endpoint=job['endpoint'])
+        job['attempts'] += 1
+        if job['attempts'] > self.max_retries:
+            logging.error(f"{job['endpoint']} to chat {job['chat_id']} still flood-limited "
+                          f"after {self.max_retries} retries")
+            for future in job['futures']:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        logging.warning(f"Flood wait of {retry_after}s on chat {job['chat_id']}, "
+                        f"retrying {job['endpoint']} (attempt {job['attempts']})")
+        chat_id = job['chat_id']
+        self._paused[chat_id] = max(self._paused.get(chat_id, 0), time.monotonic() + retry_after)
+        newer = self._edits.get(job['key']) if job['key'] is not None else None
+        if newer is not None:
+            # A newer edit of the same message is already queued; it supersedes this one
+            newer['futures'].extend(job['futures'])
+            return
+        # Keeps its original sequence number, so it goes out ahead of later calls
+        self._enqueue(job)
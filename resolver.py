@@ -0,0 +1,113 @@
+"""
+Short-link resolution for Setupia AI Saver.
+
+Short links (vm.tiktok.com, redd.it, fb.watch, t.co, ...) are expanded to
+the URL they redirect to before routing, so the caches and the in-flight
+deduplication see the real post URL. One pooled HTTP client is shared by
+all requests, HEAD is tried before GET, and resolved links are stored in a
+persistent cache.
+"""
+
+import logging
+from typing import Optional
+from urllib.parse import urljoin
+
+import httpx
+
+import urlnorm
+from caches import RedirectCache
+
+# Hosts that only ever redirect somewhere else
+SHORT_LINK_HOSTS = frozenset({
+    'vm.tiktok.com', 'vt.tiktok.com', 'redd.it', 'fb.watch', 'fb.me', 'lnkd.in',
+    'youtu.be', 't.co', 'pin.it', 'flic.kr', 'instagr.am', 'bit.ly',
+})
+
+# Servers that reject HEAD answer with one of these; retry those hops with GET
+HEAD_UNSUPPORTED = {400, 403, 404, 405, 501}
+
+# A redirect landing here means the platform wants a login, not the real URL
+LOGIN_PATH_MARKERS = ('/login', '/accounts/login', '/signin')
+
+
+class ShortLinkResolver:
+    """Follows short-link redirects with a shared, pooled async client"""
+
+    def __init__(self, cache: RedirectCache, max_hops: int = 5, timeout: float = 5.0,
+                 short_hosts: frozenset = SHORT_LINK_HOSTS, user_agent: str = 'Mozilla/5.0'):
+        self.cache = cache
+        self.max_hops = max_hops
+        self.timeout = timeout
+        self.short_hosts = short_hosts
+        self.user_agent = user_agent
+        self.client: Optional[httpx.AsyncClient] = None
+
+    def start(self):
+        self.client = httpx.AsyncClient(
+            follow_redirects=False,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            headers={'User-Agent': self.user_agent},
+        )
+
+    async def close(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    def is_short_link(self, url: str) -> bool:
+        return urlnorm.parse(url).host in self.short_hosts
+
+    async def resolve(self, url: str) -> str:
+        """The URL a short link points to; any other URL is returned unchanged"""
+        # youtu.be carries the video ID, no request needed
+        parsed = urlnorm.parse(url)
+        if parsed.host == 'youtu.be' and parsed.media_id:
+            return urlnorm.clean_url(url)
+
+        if not self.is_short_link(url):
+            return url
+
+        cached = self.cache.get(url)
+        if cached:
+            logging.info(f"Resolved {url} -> {cached} from redirect cache")
+            return cached
+
+        target = await self.follow(url)
+        if target != url:
+            logging.info(f"Resolved short link {url} -> {target}")
+            self.cache.put(url, target)
+        return target
+
+    async def follow(self, url: str) -> str:
+        """Follow up to max_hops redirects, falling back to the input on errors"""
+        if self.client is None:
+            self.start()
+        current = url
+        try:
+            for _ in range(self.max_hops):
+                location = await self._next_hop(current)
+                if not location:
+                    break
+                if any(marker in urlnorm.parse(location).path.lower() for marker in LOGIN_PATH_MARKERS):
+                    logging.info(f"Short link {url} redirects to a login page, keeping {current}")
+                    break
+                current = location
+                if not self.is_short_link(current):
+                    # Landed on the real site; its own redirects are the downloaders' business
+                    break
+            else:
+                logging.warning(f"Short link {url} exceeded {self.max_hops} redirects, stopping at {current}")
+        except httpx.HTTPError as e:
+            logging.warning(f"Could not resolve short link {url}: {e}")
+        return current
+
+    async def _next_hop(self, url: str) -> Optional[str]:
+        response = await self.client.head(url)
+        if response.status_code in HEAD_UNSUPPORTED:
+            # Stream the GET so the page body is never downloaded
+            async with self.client.stream('GET', url) as response:
+                pass
+        if response.is_redirect and 'location' in response.headers:
+            return urljoin(url, response.headers['location'])
+        return None
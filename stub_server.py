@@ -0,0 +1,62 @@
+"""
+Minimal stand-in for the web servers media links point at.
+
+Used by the test scripts to serve redirects and media bodies locally. The
+test supplies the answers: `respond(method, path)` returns the status,
+headers and body for each HEAD or GET request.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+
+class StubServer:
+    """Threaded HTTP server answering HEAD and GET through `respond`.
+
+    Every request is recorded in `requests` as a (method, path) pair.
+    Content-Length is set from the body unless the headers give one.
+    """
+
+    def __init__(self, respond: Callable[[str, str], tuple], host: str = '127.0.0.1', port: int = 0):
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _answer(self, method: str):
+                stub.requests.append((method, self.path))
+                status, headers, body = respond(method, self.path)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if 'Content-Length' not in headers:
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if method != 'HEAD':
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self._answer('HEAD')
+
+            def do_GET(self):
+                self._answer('GET')
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'StubServer':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
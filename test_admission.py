@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Admission Control Test
+One user pasting a burst of links: only the token bucket's burst is
+admitted and the rest are refused with a retry time, the in-flight cap
+holds until requests finish, other users keep their own quotas, and
+queued requests see their position move up as the queue drains
+"""
+
+import asyncio
+import sys
+import time
+
+import metrics
+from bot import AdmissionControl, DownloadScheduler, DownloadTask
+
+
+def quota_checks() -> list:
+    checks = []
+    rejected = {reason: metrics.ADMISSION_REJECTED.value(reason=reason) for reason in ('rate', 'in_flight')}
+    in_flight = metrics.ADMISSION_IN_FLIGHT.value()
+
+    # 6 links a minute with a burst of 3; no in-flight cap
+    admission = AdmissionControl(6, 3, 0)
+    results = [admission.acquire(1) for _ in range(10)]
+    admitted = results.count(None)
+    refusals = [result for result in results if result is not None]
+    checks.append((admitted == 3, f"burst of 3 admitted out of 10 links ({admitted})"))
+    checks.append((all(reason == 'rate' and 0 < retry_after <= 10 for reason, retry_after in refusals),
+                   f"the rest refused with a retry time ({refusals[0]})"))
+    checks.append((admission.acquire(2) is None, "another user keeps their own quota"))
+    checks.append((admission.acquire(1, charge=False) is None, "uncharged request skips the link quota"))
+    checks.append((metrics.ADMISSION_REJECTED.value(reason='rate') == rejected['rate'] + 7, "rate refusals counted"))
+    for _ in range(admitted + 1):
+        admission.release(1)
+    admission.release(2)
+    checks.append((admission.in_flight(1) == 0 and metrics.ADMISSION_IN_FLIGHT.value() == in_flight,
+                   "released requests leave nothing in flight"))
+
+    # 600 links a minute refill a token every 0.1s
+    admission = AdmissionControl(600, 1, 2)
+    checks.append((admission.acquire(3) is None and admission.acquire(3)[0] == 'rate', "bucket empties"))
+    time.sleep(0.15)
+    checks.append((admission.acquire(3) is None, "bucket refills over time"))
+    checks.append((admission.acquire(3, charge=False) == ('in_flight', None), "in-flight cap refuses a third request"))
+    checks.append((metrics.ADMISSION_REJECTED.value(reason='in_flight') == rejected['in_flight'] + 1,
+                   "in-flight refusal counted"))
+    admission.release(3)
+    checks.append((admission.acquire(3, charge=False) is None, "a finished request frees its in-flight slot"))
+    return checks
+
+
+async def position_checks() -> list:
+    checks = []
+    scheduler = DownloadScheduler(1, 1, {}, 1)
+    release = asyncio.Event()
+
+    async def runner():
+        await release.wait()
+
+    tasks = [DownloadTask('reddit', runner, user_id=1, cost=5) for _ in range(3)]
+    positions = [await scheduler.submit(task) for task in tasks]
+    checks.append((positions == [1, 2, 3], f"queued requests are told their position ({positions})"))
+
+    # The only worker takes the first request, the others move up
+    scheduler.start()
+    try:
+        await asyncio.sleep(0.05)
+        positions = [scheduler.position(task) for task in tasks]
+        checks.append((positions == [0, 1, 2], f"positions move up as the queue drains ({positions})"))
+        release.set()
+    finally:
+        await scheduler.stop()
+    return checks
+
+
+def test_admission():
+    """Per-user quotas, in-flight cap and queue positions"""
+    print("🎟️ Admission Control Test")
+    print("=" * 40)
+
+    checks = quota_checks() + asyncio.run(position_checks())
+
+    for passed, label in checks:
+        print(f"{'✅' if passed else '❌'} {label}")
+    for passed, label in checks:
+        assert passed, label
+
+
+if __name__ == "__main__":
+    try:
+        test_admission()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Cache Test
+Runs the SQLite caches on an in-memory database: the file_id cache evicts
+the least recently used entry using hits it only wrote at the next put,
+and keeps its row count without counting the table; the negative cache
+forgets each failure class after its own TTL
+"""
+
+import sys
+import time
+
+import metrics
+from caches import open_database, FileIdCache, NegativeCache
+
+
+def item(file_id: str) -> list:
+    return [{'kind': 'photo', 'file_id': file_id}]
+
+
+def file_id_checks() -> list:
+    checks = []
+    conn = open_database(':memory:')
+    cache = FileIdCache(conn, ttl=60, max_entries=3)
+    hits = metrics.CACHE_LOOKUPS.value(cache='file_id', result='disk_hit')
+    misses = metrics.CACHE_LOOKUPS.value(cache='file_id', result='miss')
+
+    for key in ('a', 'b', 'c'):
+        cache.put(key, item(key), None)
+        time.sleep(0.01)
+    # A hit on the oldest entry makes 'b' the least recently used one
+    changes = conn.total_changes
+    entry = cache.get('a')
+    checks.append((entry == {'items': item('a'), 'caption': None}, "hit returns the stored items"))
+    checks.append((conn.total_changes == changes, "hit doesn't write to the database"))
+    checks.append((cache.get('missing') is None, "unknown key misses"))
+
+    cache.put('d', item('d'), 'caption')
+    keys = sorted(row[0] for row in conn.execute('SELECT key FROM file_ids'))
+    checks.append((keys == ['a', 'c', 'd'], f"least recently used entry evicted ({keys})"))
+
+    cache.delete('c')
+    cache.delete('missing')
+    counted = conn.execute('SELECT COUNT(*) FROM file_ids').fetchone()[0]
+    checks.append((cache.stats()['entries'] == counted == 2, f"row count kept in memory ({counted})"))
+    checks.append((FileIdCache(conn, ttl=60, max_entries=3).entries == 2, "row count read back on startup"))
+    checks.append((metrics.CACHE_LOOKUPS.value(cache='file_id', result='disk_hit') == hits + 1
+                   and metrics.CACHE_LOOKUPS.value(cache='file_id', result='miss') == misses + 1,
+                   "hits and misses exported"))
+    return checks
+
+
+def negative_checks() -> list:
+    checks = []
+    conn = open_database(':memory:')
+    cache = NegativeCache(conn, {'auth': 60, 'timeout': 1, 'rate_limited': 0})
+
+    cache.put('example.com/private', 'auth')
+    cache.put('example.com/slow', 'timeout')
+    cache.put('example.com/limited', 'rate_limited')
+    checks.append((cache.get('example.com/private') == 'auth' and cache.get('example.com/slow') == 'timeout',
+                   "recent failures are answered from the cache"))
+    checks.append((cache.get('example.com/limited') is None, "class without a TTL isn't cached"))
+
+    time.sleep(1.2)
+    checks.append((cache.get('example.com/slow') is None, "timeout forgotten after its TTL"))
+    checks.append((cache.get('example.com/private') == 'auth', "auth kept for its longer TTL"))
+    keys = [row[0] for row in conn.execute('SELECT key FROM failures')]
+    checks.append((keys == ['example.com/private'], f"expired entry deleted ({keys})"))
+    checks.append((cache.hits == 3, f"hits counted ({cache.hits})"))
+    return checks
+
+
+def test_caches():
+    """file_id cache eviction, batched hits and row count; negative cache TTLs"""
+    print("🗄️ Cache Test")
+    print("=" * 40)
+
+    checks = file_id_checks() + negative_checks()
+
+    for passed, label in checks:
+        print(f"{'✅' if passed else '❌'} {label}")
+    for passed, label in checks:
+        assert passed, label
+
+
+if __name__ == "__main__":
+    try:
+        test_caches()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Extractor Pool Cancellation Test
+Runs calls that block without ever reaching a progress hook on a one-worker
+pool. A cancelled or timed-out call must not hold the worker, calls queued
+behind it must neither fail nor have their queue time counted against their
+own startup timeout, and a call that spent its time waiting for a worker is
+reported as busy
+"""
+
+import asyncio
+import sys
+import time
+
+import extractor_pool
+from extractor_pool import ExtractorPool
+
+
+def blocking_call(seconds: float, token: str) -> dict:
+    """Sleeps like a blocked socket read: no hooks, so it never sees a cancel flag"""
+    time.sleep(seconds)
+    return {'ok': True, 'slept': seconds}
+
+
+async def run_checks(pool: ExtractorPool) -> list:
+    checks = []
+
+    # Warm up, so worker startup doesn't count against the timeouts below
+    result = await pool.call(blocking_call, 0.1, timeout=30)
+    checks.append((result == {'ok': True, 'slept': 0.1}, "call runs on a warm worker"))
+
+    # A stuck call is cancelled by the caller; the next call must still go through
+    stuck = asyncio.create_task(pool.call(blocking_call, 60, timeout=120))
+    await asyncio.sleep(1.5)
+    stuck.cancel()
+    started = time.monotonic()
+    result = await pool.call(blocking_call, 0.1, timeout=3)
+    elapsed = time.monotonic() - started
+    checks.append((result is not None and elapsed < 30,
+                   f"call after a cancelled stuck call succeeds ({elapsed:.1f}s)"))
+
+    # A call queued behind a stuck one that times out doesn't inherit its queue time
+    stuck = asyncio.create_task(pool.call(blocking_call, 60, timeout=2))
+    await asyncio.sleep(0.5)
+    result = await pool.call(blocking_call, 0.1, timeout=3)
+    checks.append((result is not None, "queued call isn't timed out by its wait for a worker"))
+    checks.append((await stuck is None, "stuck call times out"))
+
+    # A call run again after a worker replacement only gets what is left of its max_duration
+    stuck = asyncio.create_task(pool.call(blocking_call, 60, timeout=2))
+    await asyncio.sleep(0.5)
+    started = time.monotonic()
+    result = await pool.call(blocking_call, 5, timeout=10, max_duration=4)
+    elapsed = time.monotonic() - started
+    await stuck
+    checks.append((result is None and elapsed < 5, f"retried call keeps its max_duration ({elapsed:.1f}s)"))
+    await asyncio.sleep(extractor_pool.CANCEL_GRACE + 1)  # its worker gets replaced too
+
+    # A call that never gets a worker is reported as busy, not as a timeout
+    running = asyncio.create_task(pool.call(blocking_call, 3, timeout=10))
+    await asyncio.sleep(1)
+    result = await pool.call(blocking_call, 0.1, timeout=10, max_duration=1)
+    checks.append((result is not None and result.get('busy'), "call without a free worker comes back busy"))
+    checks.append((await running == {'ok': True, 'slept': 3}, "the call holding the worker isn't affected"))
+
+    # A call that got its worker and then ran out of time is a plain timeout
+    result = await pool.call(blocking_call, 6, timeout=10, max_duration=3)
+    checks.append((result is None, "call running past max_duration times out"))
+    return checks
+
+
+def test_extractor_pool():
+    """Cancelled and timed-out calls free their worker"""
+    print("🧵 Extractor Pool Cancellation Test")
+    print("=" * 40)
+
+    grace = extractor_pool.CANCEL_GRACE
+    extractor_pool.CANCEL_GRACE = 1.0
+    pool = ExtractorPool(1, stall_timeout=5, max_duration=120)
+    try:
+        checks = asyncio.run(run_checks(pool))
+    finally:
+        pool.shutdown()
+        extractor_pool.CANCEL_GRACE = grace
+
+    for passed, label in checks:
+        print(f"{'✅' if passed else '❌'} {label}")
+    for passed, label in checks:
+        assert passed, label
+
+
+if __name__ == "__main__":
+    try:
+        test_extractor_pool()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Failure Classification Test
+Maps yt-dlp / gallery-dl error messages to the failure classes the
+negative cache keys on: permanent failures (auth, not_found) and
+transient ones (rate_limited) get a class, while server errors, network
+errors and calls that only waited on a busy extractor pool get none and
+are never cached
+"""
+
+import sys
+
+from bot import SetupiaAISaver
+
+# error message -> expected failure class
+CASES = {
+    "ERROR: [youtube] abc: Private video. Sign in if you've been granted access": 'auth',
+    "ERROR: [instagram] abc: Requested content is not available, rate-limit reached or login required": 'rate_limited',
+    "HTTP Error 401: Unauthorized": 'auth',
+    "HTTP Error 404: Not Found": 'not_found',
+    "ERROR: [youtube] abc: This video has been removed by the uploader": 'not_found',
+    "HTTP Error 429: Too Many Requests": 'rate_limited',
+    "ERROR: [youtube] abc: Sign in to confirm you're not a bot": 'rate_limited',
+    # Transient or unknown: nothing is remembered
+    "HTTP Error 503: Service Unavailable": None,
+    "HTTP Error 500: Internal Server Error": None,
+    "HTTP Error 403: Forbidden": None,
+    "[Errno 104] Connection reset by peer": None,
+    "ERROR: [generic] Unable to download webpage: blogindex timed out": None,
+}
+
+
+def test_failures():
+    """Permanent vs transient failure classes"""
+    print("🚫 Failure Classification Test")
+    print("=" * 40)
+
+    saver = SetupiaAISaver.__new__(SetupiaAISaver)
+    checks = [(saver.classify_failure(error) == expected, f"{error!r} -> {expected}")
+              for error, expected in CASES.items()]
+    busy = {'ok': False, 'error': 'all extractor workers are busy', 'busy': True}
+    checks.append((saver.classify_result(busy) is None, "busy pool result isn't a failure of the link"))
+    checks.append((saver.classify_result({'ok': False, 'error': 'HTTP Error 404: Not Found'}) == 'not_found',
+                   "failed result classified by its error"))
+
+    for passed, label in checks:
+        print(f"{'✅' if passed else '❌'} {label}")
+    for passed, label in checks:
+        assert passed, label
+
+
+if __name__ == "__main__":
+    try:
+        test_failures()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Hedged Download Test
+Races stand-in downloaders through hedged_download: once the request
+deadline has passed while an attempt is still running, the queued
+downloaders are skipped and the race waits on the running attempt without
+spinning the event loop
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+
+import metrics
+from bot import Deadline, DownloadScheduler, SetupiaAISaver
+
+
+class QuickHedges:
+    """Latency tracker stand-in that hedges after a fixed short delay"""
+
+    def hedge_delay(self, platform: str, tool: str) -> float:
+        return 0.2
+
+    def record(self, platform: str, tool: str, seconds: float):
+        pass
+
+
+def saver_with(downloaders: dict) -> SetupiaAISaver:
+    """A bot with just what hedged_download needs; `downloaders` maps tool -> seconds before it fails"""
+    saver = SetupiaAISaver.__new__(SetupiaAISaver)
+    saver.scheduler = DownloadScheduler(2, 4, {}, 4)
+    saver.latency = QuickHedges()
+    saver.hedge_costs = {}
+    saver.started = []
+
+    async def fail_after(tool: str):
+        saver.started.append(tool)
+        await asyncio.sleep(downloaders[tool])
+        return None
+
+    saver.download_with_yt_dlp = lambda url, temp_dir, **kwargs: fail_after('yt-dlp')
+    saver.download_with_gallery_dl = lambda url, temp_dir, **kwargs: fail_after('gallery-dl')
+    return saver
+
+
+async def run_checks() -> list:
+    checks = []
+    saver = saver_with({'yt-dlp': 1.0, 'gallery-dl': 0.1})
+    attempts = [('yt-dlp', 'https://example.com/v'), ('gallery-dl', 'https://example.com/v')]
+    skipped = metrics.DEADLINE_SKIPPED.value(platform='test', stage='gallery-dl')
+
+    # The deadline passes at 0.1s, the hedge would be due at 0.2s and yt-dlp runs until 1.0s
+    with tempfile.TemporaryDirectory(prefix='setupia_test_') as temp_dir:
+        started, cpu = time.monotonic(), time.process_time()
+        result = await saver.hedged_download('test', attempts, temp_dir, deadline=Deadline(0.1, 'test'))
+        elapsed, cpu = time.monotonic() - started, time.process_time() - cpu
+
+    checks.append((result is None and elapsed >= 0.9, f"race waits for the running attempt ({elapsed:.1f}s)"))
+    checks.append((cpu < elapsed / 2, f"no busy loop while waiting ({cpu:.2f}s CPU in {elapsed:.1f}s)"))
+    checks.append((saver.started == ['yt-dlp'], f"queued downloader not started ({saver.started})"))
+    checks.append((metrics.DEADLINE_SKIPPED.value(platform='test', stage='gallery-dl') == skipped + 1,
+                   "skipped downloader counted"))
+    checks.append((not saver.scheduler._global.locked() and saver.scheduler._global._value == 4,
+                   "no hedge slots left claimed"))
+    return checks
+
+
+def test_hedging():
+    """Expired deadline with an attempt still running"""
+    print("🏁 Hedged Download Test")
+    print("=" * 40)
+
+    checks = asyncio.run(run_checks())
+
+    for passed, label in checks:
+        print(f"{'✅' if passed else '❌'} {label}")
+    for passed, label in checks:
+        assert passed, label
+
+
+if __name__ == "__main__":
+    try:
+        test_hedging()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Outbound Scheduler Test
+Sends through python-telegram-bot with the outbound scheduler as its rate
+limiter against the stand-in Bot API server: flood waits are retried after
+retry_after, queued edits of one message collapse into a single request,
+and each chat is paced on its own
+"""
+
+import asyncio
+import sys
+import time
+from urllib.parse import unquote_plus
+
+from telegram.ext import ExtBot
+
+import metrics
+from fake_bot_api import FakeBotAPI
+from outbound import OutboundScheduler, CHAT_BURST
+
+CHAT_RATE = 4.0
+
+
+async def run_checks(api: FakeBotAPI) -> list:
+    checks = []
+    scheduler = OutboundScheduler(global_rate=100.0, chat_rate=CHAT_RATE, max_retries=3)
+    bot = ExtBot('123:stub', base_url=f'{api.url}/bot', rate_limiter=scheduler)
+    await bot.initialize()
+    try:
+        # A flooded send is retried once the flood wait is over
+        api.floods['sendMessage'] = 1
+        retries = metrics.OUTBOUND_RETRY_AFTER.value(endpoint='sendMessage')
+        started = time.monotonic()
+        await bot.send_message(1, 'flooded')
+        elapsed = time.monotonic() - started
+        sent = [call for call in api.calls if call['method'] == 'sendMessage']
+        checks.append((len(sent) == 2 and elapsed >= api.flood_retry_after,
+                       f"flooded send retried after retry_after ({elapsed:.1f}s, {len(sent)} requests)"))
+        checks.append((metrics.OUTBOUND_RETRY_AFTER.value(endpoint='sendMessage') == retries + 1,
+                       "flood wait counted"))
+
+        # Edits queued behind a paced chat collapse into the latest one
+        api.calls.clear()
+        await asyncio.gather(*(bot.send_message(2, f'fill {n}') for n in range(CHAT_BURST)))
+        results = await asyncio.gather(*(bot.edit_message_text(f'version {n}', chat_id=2, message_id=7)
+                                         for n in range(5)))
+        edits = [call for call in api.calls if call['method'] == 'editMessageText']
+        body = unquote_plus(edits[0]['head'].decode()) if edits else ''
+        checks.append((len(edits) == 1 and 'version 4' in body,
+                       f"5 queued edits sent as {len(edits)} editMessageText with the latest text"))
+        checks.append((all(result for result in results), "every edit caller gets the result"))
+
+        # Each chat has its own pace: a busy chat doesn't hold up another one
+        count = CHAT_BURST + 4
+        finished = {}
+
+        async def burst(chat_id: int):
+            await asyncio.gather(*(bot.send_message(chat_id, f'message {n}') for n in range(count)))
+            finished[chat_id] = time.monotonic() - started
+
+        await asyncio.sleep(CHAT_BURST / CHAT_RATE)  # let chat 2 refill
+        started = time.monotonic()
+        await asyncio.gather(burst(3), burst(4))
+        paced = (count - CHAT_BURST) / CHAT_RATE
+        checks.append((min(finished.values()) >= paced * 0.9,
+                       f"{count} messages to one chat take at least {paced:.1f}s"))
+        checks.append((max(finished.values()) < paced * 1.6,
+                       f"two chats paced side by side ({finished[3]:.1f}s / {finished[4]:.1f}s)"))
+    finally:
+        await bot.shutdown()
+    return checks
+
+
+def test_outbound():
+    """Flood-wait retries, edit coalescing and per-chat pacing"""
+    print("📤 Outbound Scheduler Test")
+    print("=" * 40)
+
+    api = FakeBotAPI().start()
+    try:
+        checks = asyncio.run(run_checks(api))
+    finally:
+        api.stop()
+
+    for passed, label in checks:
+        print(f"{'✅' if passed else '❌'} {label}")
+    for passed, label in checks:
+        assert passed, label
+
+
+if __name__ == "__main__":
+    try:
+        test_outbound()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Short-Link Resolver Test
+Resolves redirect chains served by a local HTTP stub: HEAD-first hops,
+GET fallback for servers that reject HEAD, the hop limit and the
+persistent redirect cache
+"""
+
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+from caches import open_database, RedirectCache
+from resolver import ShortLinkResolver
+from stub_server import StubServer
+
+# path -> (status for HEAD, status for GET, Location)
+ROUTES = {
+    '/s/chain': (301, 301, '/mid'),
+    '/mid': (302, 302, '/post/123'),
+    '/post/123': (200, 200, None),
+    '/s/nohead': (405, 302, '/post/456'),
+    '/post/456': (200, 200, None),
+    '/s/loop': (302, 302, '/s/loop'),
+    '/s/login': (302, 302, '/accounts/login?next=/post/789'),
+}
+
+
+def redirect(method: str, path: str) -> tuple:
+    head_status, get_status, location = ROUTES.get(path, (404, 404, None))
+    return head_status if method == 'HEAD' else get_status, {'Location': location} if location else {}, b''
+
+
+async def run_checks(stub: StubServer, db_path: str) -> list:
+    resolver = ShortLinkResolver(
+        RedirectCache(open_database(db_path), ttl=3600), max_hops=4, short_hosts=frozenset({'127.0.0.1'})
+    )
+    resolver.start()
+    checks = []
+    try:
+        resolved = await resolver.resolve(f'{stub.url}/s/chain')
+        checks.append((resolved == f'{stub.url}/post/123', f"redirect chain resolved: {resolved}"))
+        checks.append((all(method == 'HEAD' for method, _ in stub.requests), "HEAD used when the server allows it"))
+
+        resolved = await resolver.resolve(f'{stub.url}/s/nohead')
+        checks.append((resolved == f'{stub.url}/post/456', "GET fallback when HEAD is rejected"))
+
+        stub.requests.clear()
+        resolved = await resolver.resolve(f'{stub.url}/s/loop')
+        checks.append((len(stub.requests) == 4, f"hop limit stops a redirect loop ({len(stub.requests)} requests)"))
+
+        resolved = await resolver.resolve(f'{stub.url}/s/login')
+        checks.append((resolved == f'{stub.url}/s/login', "login-page redirects are not followed"))
+
+        resolved = await resolver.resolve('https://youtu.be/dQw4w9WgXcQ?si=abc')
+        checks.append((resolved == 'https://www.youtube.com/watch?v=dQw4w9WgXcQ', "youtu.be rewritten without a request"))
+    finally:
+        await resolver.close()
+
+    # A fresh resolver on the same database answers from the cache
+    stub.requests.clear()
+    resolver = ShortLinkResolver(RedirectCache(open_database(db_path), ttl=3600), short_hosts=frozenset({'127.0.0.1'}))
+    try:
+        resolved = await resolver.resolve(f'{stub.url}/s/chain')
+    finally:
+        await resolver.close()
+    checks.append((resolved == f'{stub.url}/post/123' and not stub.requests, "redirect cache survives a restart"))
+    return checks
+
+
+def test_resolver():
+    """Resolve short links against a local redirect stub"""
+    print("🔗 Short-Link Resolver Test")
+    print("=" * 40)
+
+    stub = StubServer(redirect).start()
+    with tempfile.TemporaryDirectory(prefix='setupia_test_') as temp_dir:
+        try:
+            checks = asyncio.run(run_checks(stub, str(Path(temp_dir) / 'cache.db')))
+        finally:
+            stub.stop()
+
+    for passed, label in checks:
+        print(f"{'✅' if passed else '❌'} {label}")
+    for passed, label in checks:
+        assert passed, label
+
+
+if __name__ == "__main__":
+    try:
+        test_resolver()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
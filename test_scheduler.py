@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Download Scheduler Test
+Runs fake jobs through the download scheduler: jobs land in the cheap or
+expensive lane by predicted cost, the shortest queued job runs first,
+expensive jobs can't take the slots reserved for cheap ones when the
+queue is full, and hedge claims on idle slots never leak
+"""
+
+import asyncio
+import sys
+
+from bot import DownloadScheduler, DownloadTask
+
+
+class FakeJobs:
+    """Jobs that record their start and run until released"""
+
+    def __init__(self):
+        self.started = []
+        self.release = asyncio.Event()
+
+    def task(self, name: str, cost: float, platform: str = 'reddit') -> DownloadTask:
+        async def runner():
+            self.started.append(name)
+            await self.release.wait()
+        return DownloadTask(platform, runner, cost=cost)
+
+
+async def settle():
+    """Let the workers pick up whatever they can"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def lane_checks() -> list:
+    checks = []
+    scheduler = DownloadScheduler(1, 1, {}, 1, cheap_cost=15.0, reserved_cheap=0)
+    jobs = FakeJobs()
+    scheduler.start()
+    try:
+        # One running job makes the rest queue up
+        await scheduler.submit(jobs.task('blocker', 1))
+        await settle()
+        queued = [jobs.task(name, cost) for name, cost in (('video', 60), ('clip', 5), ('merge', 20), ('pin', 1))]
+        for task in queued:
+            await scheduler.submit(task)
+        lanes = {name: task.lane for task, name in zip(queued, ('video', 'clip', 'merge', 'pin'))}
+        checks.append((lanes == {'video': 'expensive', 'clip': 'cheap', 'merge': 'expensive', 'pin': 'cheap'},
+                       f"lane chosen by predicted cost ({lanes})"))
+        checks.append((scheduler.position(queued[3]) == 1, "cheapest job is next in line"))
+
+        # Every job returns at once when released, so each finish lets the next one in
+        jobs.release.set()
+        for _ in range(50):
+            if len(jobs.started) == 5:
+                break
+            await asyncio.sleep(0.01)
+        checks.append((jobs.started == ['blocker', 'pin', 'clip', 'merge', 'video'],
+                       f"shortest job first ({jobs.started})"))
+    finally:
+        await scheduler.stop()
+    return checks
+
+
+async def load_checks() -> list:
+    checks = []
+    # Three slots, one of them kept for cheap jobs
+    scheduler = DownloadScheduler(3, 3, {}, 3, cheap_cost=15.0, reserved_cheap=1)
+    jobs = FakeJobs()
+    scheduler.start()
+    try:
+        for n in range(4):
+            await scheduler.submit(jobs.task(f'expensive {n}', 120))
+        await settle()
+        checks.append((scheduler.lane_active == {'cheap': 0, 'expensive': 2} and scheduler.queued == 2,
+                       f"expensive jobs held to their share ({scheduler.lane_active}, {scheduler.queued} queued)"))
+
+        await scheduler.submit(jobs.task('pin', 1, platform='pinterest'))
+        await settle()
+        checks.append(('pin' in jobs.started and scheduler.lane_active['cheap'] == 1,
+                       "cheap job runs on the reserved slot despite the expensive backlog"))
+        checks.append((not scheduler.has_free_slot('pinterest'), "no slot left for anyone else"))
+        jobs.release.set()
+    finally:
+        await scheduler.stop()
+    return checks
+
+
+async def claim_checks() -> list:
+    checks = []
+    scheduler = DownloadScheduler(2, 4, {'reddit': 2}, 4)
+
+    checks.append((await scheduler.try_claim('reddit', 2), "idle slots claimed for a hedge"))
+    checks.append((not scheduler.has_free_slot('reddit'), "claimed slots are taken from the platform"))
+    checks.append((not await scheduler.try_claim('reddit', 1), "claim fails once the platform is full"))
+
+    # Only two global slots are left: a claim of three fails part way and must hand back what it took
+    checks.append((not await scheduler.try_claim('pinterest', 3), "claim larger than the idle capacity fails"))
+    checks.append((await scheduler.try_claim('pinterest', 2), "a failed claim holds nothing"))
+
+    await scheduler.release_claim('pinterest', 2)
+    await scheduler.release_claim('reddit', 2)
+    await scheduler.release_claim('reddit', 0)
+    checks.append((scheduler.has_free_slot('reddit') and await scheduler.try_claim('other', 4),
+                   "released claims free every slot"))
+    await scheduler.release_claim('other', 4)
+    return checks
+
+
+def test_scheduler():
+    """Cost lanes, shortest job first, reserved cheap capacity and hedge claims"""
+    print("🚦 Download Scheduler Test")
+    print("=" * 40)
+
+    checks = asyncio.run(lane_checks()) + asyncio.run(load_checks()) + asyncio.run(claim_checks())
+
+    for passed, label in checks:
+        print(f"{'✅' if passed else '❌'} {label}")
+    for passed, label in checks:
+        assert passed, label
+
+
+if __name__ == "__main__":
+    try:
+        test_scheduler()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+yt-dlp Format Selection Test
+Downloads from a prepared info dict whose formats are served by a local
+HTTP stub, through the same worker function the extractor pool runs, and
+checks that each call gets the format it asked for even though the worker
+reuses one YoutubeDL instance
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+import extractor_pool
+from stub_server import StubServer
+
+# format_id -> (height, body served for it)
+FORMATS = {
+    'low': (240, b'L' * 2048),
+    'mid': (480, b'M' * 4096),
+    'high': (720, b'H' * 8192),
+}
+
+
+def media(method: str, path: str) -> tuple:
+    _, body = FORMATS.get(path.strip('/'), (0, None))
+    if body is None:
+        return 404, {}, b''
+    return 200, {'Content-Type': 'video/mp4'}, body
+
+
+def info_dict(base_url: str) -> dict:
+    return {
+        'id': 'stub123',
+        'title': 'Stub video',
+        'extractor': 'generic',
+        'extractor_key': 'Generic',
+        'webpage_url': f'{base_url}/watch',
+        'formats': [
+            {
+                'format_id': format_id, 'url': f'{base_url}/{format_id}', 'ext': 'mp4',
+                'height': height, 'width': height * 16 // 9, 'vcodec': 'avc1', 'acodec': 'mp4a',
+                'filesize': len(body),
+            }
+            for format_id, (height, body) in FORMATS.items()
+        ],
+    }
+
+
+def download(stub: StubServer, temp_dir: str, fmt) -> dict:
+    options = {'format': fmt, 'outtmpl': f'{fmt or "default"}.%(ext)s'}
+    return extractor_pool.ytdlp_download(f'{stub.url}/watch', temp_dir, options, info_dict(stub.url), 'test')
+
+
+def test_ytdlp_formats():
+    """Each download gets the format it requested"""
+    print("🎚️ yt-dlp Format Selection Test")
+    print("=" * 40)
+
+    # Run the worker side in this process, as a pool worker would
+    extractor_pool._init_worker({}, {}, {}, {})
+    stub = StubServer(media).start()
+    try:
+        with tempfile.TemporaryDirectory(prefix='setupia_test_') as temp_dir:
+            # Alternate formats so a selector left over from the last call would show
+            for fmt, expected in (('low', 'low'), ('high', 'high'), ('mid', 'mid'),
+                                  ('best[height<=480]', 'mid'), (None, 'high'), ('low', 'low')):
+                result = download(stub, temp_dir, fmt)
+                format_id = result.get('info', {}).get('format_id') if result['ok'] else result['error']
+                body = Path(result['files'][0]['path']).read_bytes() if result['ok'] and result['files'] else b''
+                passed = format_id == expected and body == FORMATS[expected][1]
+                print(f"{'✅' if passed else '❌'} format {fmt!r} -> {format_id}")
+                assert passed, f"format {fmt!r} downloaded {format_id}, expected {expected}"
+
+            result = download(stub, temp_dir, 'best[height<=')
+            print(f"{'✅' if not result['ok'] else '❌'} invalid format spec is reported as an error")
+            assert not result['ok'], "invalid format spec should fail"
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    try:
+        test_ytdlp_formats()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
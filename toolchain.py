@@ -0,0 +1,171 @@
+"""
+Toolchain capability registry for Setupia AI Saver.
+
+ffmpeg, ffprobe, yt-dlp and gallery-dl are detected once, in the background
+at startup: where they are, which version is installed and which of the
+features the bot relies on they support. Download paths read the cached
+results; nothing is probed again unless probe() is called.
+"""
+
+import asyncio
+import importlib.metadata
+import importlib.util
+import logging
+import re
+import subprocess
+import time
+from pathlib import Path
+from typing import Optional
+
+FFMPEG_CANDIDATES = (
+    '/usr/local/bin/ffmpeg',
+    '/opt/homebrew/bin/ffmpeg',
+    '/usr/bin/ffmpeg',
+    'ffmpeg',  # Check if it's in PATH
+)
+
+# Tools the bot can't work without; the others only degrade it
+REQUIRED_TOOLS = ('yt-dlp', 'gallery-dl')
+
+VERSION_PATTERN = re.compile(r'version (\S+)')
+
+
+def _run(cmd: list, timeout: float = 5.0) -> Optional[str]:
+    """stdout of a command, or None if it can't be run"""
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+    except (subprocess.TimeoutExpired, OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.decode(errors='replace')
+
+
+def _missing(name: str, error: str) -> dict:
+    return {'name': name, 'available': False, 'path': None, 'version': None, 'features': {}, 'error': error}
+
+
+def probe_ffmpeg(candidates: tuple = FFMPEG_CANDIDATES) -> dict:
+    """First working ffmpeg, with the encoders and muxers the bot uses"""
+    for path in candidates:
+        output = _run([path, '-version'])
+        if output is None:
+            continue
+        match = VERSION_PATTERN.search(output.splitlines()[0] if output else '')
+        encoders = _run([path, '-hide_banner', '-encoders']) or ''
+        muxers = _run([path, '-hide_banner', '-muxers']) or ''
+        return {
+            'name': 'ffmpeg',
+            'available': True,
+            'path': path,
+            'version': match.group(1) if match else None,
+            'features': {
+                'libx264': ' libx264 ' in encoders,
+                'aac': ' aac ' in encoders,
+                'mp4': ' mp4 ' in muxers,
+                'segment': ' segment ' in muxers,
+            },
+            'error': None,
+        }
+    return _missing('ffmpeg', 'not found in ' + ', '.join(candidates))
+
+
+def probe_ffprobe(ffmpeg_path: Optional[str]) -> dict:
+    """ffprobe next to ffmpeg, or on PATH"""
+    candidates = []
+    if ffmpeg_path and '/' in ffmpeg_path:
+        candidates.append(str(Path(ffmpeg_path).with_name('ffprobe')))
+    candidates.append('ffprobe')
+    for path in candidates:
+        output = _run([path, '-version'])
+        if output is not None:
+            match = VERSION_PATTERN.search(output.splitlines()[0] if output else '')
+            return {'name': 'ffprobe', 'available': True, 'path': path,
+                    'version': match.group(1) if match else None, 'features': {}, 'error': None}
+    return _missing('ffprobe', 'not found')
+
+
+def probe_module(name: str, module: str, features: dict) -> dict:
+    """A Python package, located and versioned without importing it"""
+    spec = importlib.util.find_spec(module)
+    if spec is None:
+        return _missing(name, f'module {module} is not installed')
+    try:
+        version = importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        version = None
+    return {'name': name, 'available': True, 'path': spec.origin, 'version': version,
+            'features': features, 'error': None}
+
+
+def probe_all(ffmpeg_candidates: tuple = FFMPEG_CANDIDATES) -> dict:
+    ffmpeg = probe_ffmpeg(ffmpeg_candidates)
+    ffprobe = probe_ffprobe(ffmpeg['path'])
+    yt_dlp = probe_module('yt-dlp', 'yt_dlp', {
+        # Separate video/audio formats can only be requested when they can be merged
+        'merge': ffmpeg['available'],
+        'impersonate': importlib.util.find_spec('curl_cffi') is not None,
+    })
+    gallery_dl = probe_module('gallery-dl', 'gallery_dl', {
+        'ytdl': importlib.util.find_spec('yt_dlp') is not None,
+        'ugoira': ffmpeg['available'],
+    })
+    return {tool['name']: tool for tool in (ffmpeg, ffprobe, yt_dlp, gallery_dl)}
+
+
+class Toolchain:
+    """Cached results of probing the external tools"""
+
+    def __init__(self, ffmpeg_candidates: tuple = FFMPEG_CANDIDATES):
+        self.ffmpeg_candidates = ffmpeg_candidates
+        self.tools = {}
+        self.probed_at = None
+        self._probing: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Probe in the background; readers wait for it through ready()"""
+        if self._probing is None:
+            self._probing = asyncio.get_running_loop().create_task(self._probe())
+
+    async def _probe(self) -> dict:
+        started = time.monotonic()
+        self.tools = await asyncio.to_thread(probe_all, self.ffmpeg_candidates)
+        self.probed_at = time.time()
+        summary = ', '.join(f"{name} {tool['version'] or '?'}" if tool['available'] else f"{name} missing"
+                            for name, tool in self.tools.items())
+        logging.info(f"Toolchain probed in {time.monotonic() - started:.2f}s: {summary}")
+        return self.tools
+
+    async def probe(self) -> dict:
+        """Probe again (e.g. after installing ffmpeg); concurrent callers share one probe"""
+        if self._probing is None or self._probing.done():
+            self._probing = asyncio.get_running_loop().create_task(self._probe())
+        return await asyncio.shield(self._probing)
+
+    async def ready(self) -> 'Toolchain':
+        """The registry, once the first probe has finished"""
+        if self._probing is None:
+            self.start()
+        if not self._probing.done():
+            await asyncio.shield(self._probing)
+        return self
+
+    def has(self, name: str, feature: Optional[str] = None) -> bool:
+        tool = self.tools.get(name)
+        if not tool or not tool['available']:
+            return False
+        return feature is None or bool(tool['features'].get(feature))
+
+    def path(self, name: str) -> Optional[str]:
+        tool = self.tools.get(name)
+        return tool['path'] if tool else None
+
+    def report(self) -> dict:
+        """Readiness: required tools present, optional ones missing, and every probe result"""
+        return {
+            'ready': bool(self.tools) and all(self.has(name) for name in REQUIRED_TOOLS),
+            'probed': self.probed_at is not None,
+            'probed_at': self.probed_at,
+            'missing_optional': [name for name in self.tools if name not in REQUIRED_TOOLS and not self.has(name)],
+            'tools': self.tools,
+        }
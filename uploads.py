@@ -0,0 +1,50 @@
+"""
+Multipart uploads with disk reads off the event loop for Setupia AI Saver.
+
+httpx encodes multipart bodies synchronously: even on an AsyncClient, each
+file field is read with a plain `file.read(64 KiB)` while the request is
+being sent, so every chunk of a 50 MB upload is read on the event loop.
+The request class here hands python-telegram-bot a client that produces
+those chunks in a worker thread instead.
+"""
+
+import asyncio
+
+import httpx
+from telegram.request import HTTPXRequest
+
+
+class ThreadedReadStream(httpx.AsyncByteStream):
+    """Async request body that advances a sync body (and its file reads) in a thread"""
+
+    def __init__(self, stream: httpx.SyncByteStream):
+        self.stream = stream
+
+    async def __aiter__(self):
+        chunks = iter(self.stream)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+
+class ThreadedUploadClient(httpx.AsyncClient):
+    """AsyncClient whose multipart requests read their files in a thread.
+
+    Headers, including Content-Length, still come from httpx's own encoder;
+    only the iteration of the body moves off the loop.
+    """
+
+    def build_request(self, method, url, *args, **kwargs) -> httpx.Request:
+        request = super().build_request(method, url, *args, **kwargs)
+        if kwargs.get('files'):
+            request.stream = ThreadedReadStream(request.stream)
+        return request
+
+
+class ThreadedUploadRequest(HTTPXRequest):
+    """HTTPXRequest for the Bot API whose uploads don't read files on the event loop"""
+
+    def _build_client(self) -> httpx.AsyncClient:
+        return ThreadedUploadClient(**self._client_kwargs)
@@ -0,0 +1,194 @@
+"""
+URL normalization for Setupia AI Saver.
+
+Every URL is parsed once with urllib.parse. The platform comes from a
+host-suffix dictionary lookup, tracking parameters are dropped one by one
+(the rest of the query is kept), and links to the same media collapse to a
+stable (platform, media_id) key that the caches use.
+"""
+
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Registered domain -> platform. Subdomains (vm.tiktok.com, old.reddit.com)
+# resolve through their parent domain.
+PLATFORM_HOSTS = {
+    'youtube.com': 'youtube', 'youtu.be': 'youtube', 'youtube-nocookie.com': 'youtube',
+    'pinterest.com': 'pinterest', 'pin.it': 'pinterest',
+    'deviantart.com': 'deviantart',
+    'flickr.com': 'flickr', 'flic.kr': 'flickr',
+    'reddit.com': 'reddit', 'redd.it': 'reddit',
+    'tumblr.com': 'tumblr',
+    'behance.net': 'behance',
+    'linkedin.com': 'linkedin', 'lnkd.in': 'linkedin',
+    't.me': 'telegram', 'telegram.me': 'telegram', 'telegram.org': 'telegram',
+    'instagram.com': 'instagram', 'instagr.am': 'instagram',
+    'twitter.com': 'twitter', 'x.com': 'twitter',
+    'facebook.com': 'facebook', 'fb.watch': 'facebook', 'fb.me': 'facebook', 'fb.com': 'facebook',
+    'tiktok.com': 'tiktok',
+    'snapchat.com': 'snapchat', 'snap.com': 'snapchat',
+    'discord.com': 'discord', 'discord.gg': 'discord',
+    'whatsapp.com': 'whatsapp', 'wa.me': 'whatsapp',
+}
+
+# Host prefixes that don't change what a link points to
+HOST_PREFIXES = ('www.', 'm.', 'mobile.')
+
+# Query parameters that never change which media a link points to
+TRACKING_PARAMS = frozenset({
+    'si', 'igsh', 'igshid', 'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'feature',
+    'share_id', 'ref_src', 'ref_url', 'is_from_webapp', 'sender_device',
+    'sender_web_id', '_r', '_t', 'u_code', 'preview_pb',
+})
+
+# Parameters that break downloads on a given platform, on top of the tracking ones
+PLATFORM_DROP_PARAMS = {
+    'instagram': frozenset({'img_index'}),
+    'twitter': frozenset({'t', 's', 'cn', 'refsrc'}),
+    'facebook': frozenset({'__tn__', '__cft__', 'hash', '_rdr', 'app_id', 'display'}),
+    'reddit': frozenset({'context'}),
+    'pinterest': frozenset({'sent', 'from_app'}),
+    'tumblr': frozenset({'source', 'ref'}),
+    'linkedin': frozenset({'trackingid', 'refid', 'lipi', 'licu'}),
+    'telegram': frozenset({'single', 'thread'}),
+    'whatsapp': frozenset({'text', 'app_absent'}),
+}
+
+# Path shapes carrying a media ID, per platform
+MEDIA_ID_PATTERNS = {
+    'youtube': re.compile(r'^/(?:shorts|embed|live|v)/([A-Za-z0-9_-]{11})'),
+    'instagram': re.compile(r'^/(?:[^/]+/)?(?:p|reels?|tv)/([A-Za-z0-9_-]+)|^/stories/[^/]+/(\d+)'),
+    'tiktok': re.compile(r'^/@[^/]+/(?:video|photo)/(\d+)|^/v/(\d+)'),
+    'twitter': re.compile(r'^/(?:[^/]+|i/web)/status(?:es)?/(\d+)'),
+    'reddit': re.compile(r'^/r/[^/]+/comments/([a-z0-9]+)|^/comments/([a-z0-9]+)'),
+    'facebook': re.compile(r'/(?:videos|reel)/(?:[^/]+/)?(\d+)'),
+    'pinterest': re.compile(r'^/pin/(\d+)'),
+}
+YOUTUBE_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+class NormalizedURL(NamedTuple):
+    url: str
+    scheme: str
+    netloc: str
+    platform: str
+    host: str
+    path: str
+    query: tuple
+    fragment: str
+    media_id: Optional[str]
+
+    @property
+    def key(self) -> Optional[tuple]:
+        """(platform, media_id) if the media ID is known"""
+        return (self.platform, self.media_id) if self.media_id else None
+
+
+def platform_for_host(host: str) -> str:
+    """Platform for a hostname, checking each parent domain once"""
+    host = host.lower().rstrip('.')
+    while host:
+        platform = PLATFORM_HOSTS.get(host)
+        if platform:
+            return platform
+        _, _, host = host.partition('.')
+    return 'unknown'
+
+
+def _strip_host(netloc: str) -> str:
+    host = netloc.lower().rsplit('@', 1)[-1].split(':', 1)[0]
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+
+def _media_id(platform: str, host: str, path: str, query: tuple) -> Optional[str]:
+    if platform == 'youtube':
+        if host == 'youtu.be':
+            candidate = path.strip('/').split('/', 1)[0]
+            return candidate if YOUTUBE_ID.match(candidate) else None
+        for name, value in query:
+            if name == 'v' and YOUTUBE_ID.match(value):
+                return value
+    elif platform == 'reddit' and host == 'redd.it':
+        return path.strip('/').split('/', 1)[0] or None
+    elif platform == 'facebook':
+        if host == 'fb.watch':
+            return path.strip('/').split('/', 1)[0] or None
+        for name, value in query:
+            if name in ('v', 'story_fbid') and value.isdigit():
+                return value
+
+    pattern = MEDIA_ID_PATTERNS.get(platform)
+    if pattern:
+        match = pattern.search(path)
+        if match:
+            return next(group for group in match.groups() if group)
+    return None
+
+
+@lru_cache(maxsize=4096)
+def parse(url: str) -> NormalizedURL:
+    """Parse a URL once into platform, host, path, query pairs and media ID"""
+    parts = urlsplit(url.strip())
+    host = _strip_host(parts.netloc)
+    platform = platform_for_host(host)
+    query = tuple(parse_qsl(parts.query, keep_blank_values=True))
+    return NormalizedURL(url, parts.scheme, parts.netloc, platform, host, parts.path, query, parts.fragment,
+                         _media_id(platform, host, parts.path, query))
+
+
+def is_tracking_param(name: str, platform: Optional[str] = None) -> bool:
+    name = name.lower()
+    if name.startswith('utm_') or name in TRACKING_PARAMS:
+        return True
+    return platform is not None and name in PLATFORM_DROP_PARAMS.get(platform, ())
+
+
+def _rebuild(parsed: NormalizedURL, keep) -> str:
+    query = [(name, value) for name, value in parsed.query if keep(name)]
+    return urlunsplit((parsed.scheme, parsed.netloc, parsed.path, urlencode(query), parsed.fragment))
+
+
+def strip_utm(url: str) -> str:
+    """Drop utm_* parameters only, keeping everything else in place"""
+    if 'utm_' not in url:
+        return url
+    return _rebuild(parse(url), lambda name: not name.lower().startswith('utm_'))
+
+
+def clean_url(url: str) -> str:
+    """URL with tracking and download-breaking parameters removed.
+
+    YouTube links become the plain watch URL for their video ID; other
+    links keep every parameter that isn't known tracking.
+    """
+    parsed = parse(url)
+    if parsed.platform == 'youtube':
+        if parsed.media_id:
+            return f"https://www.youtube.com/watch?v={parsed.media_id}"
+        return _rebuild(parsed, lambda name: False)
+    if not parsed.query:
+        return url
+    return _rebuild(parsed, lambda name: not is_tracking_param(name, parsed.platform))
+
+
+def canonical_url(url: str) -> str:
+    """URL without scheme, mobile/www prefixes, trailing slash or tracking parameters"""
+    parsed = parse(url)
+    query = sorted((name, value) for name, value in parsed.query if not is_tracking_param(name))
+    canonical = f"{parsed.host}{parsed.path.rstrip('/')}"
+    if query:
+        canonical += '?' + urlencode(query)
+    return canonical
+
+
+def media_identity(url: str) -> str:
+    """platform:media_id when the media ID is known, otherwise the canonical URL"""
+    parsed = parse(url)
+    if parsed.media_id:
+        return f"{parsed.platform}:{parsed.media_id}"
+    return canonical_url(url)